@@ -6,7 +6,7 @@ import polars as pl
 from gravity_model.log import logger
 from gravity_model.location import LocationContainer
 from gravity_model.trip import TripLoader
-from gravity_model.distance import LATypes, BallTreeLocationAssigner, BeeLineLocationAssigner, CircleLocationAssigner
+from gravity_model.distance import GRID_RESOLUTION, MERGED_BOUNDARIES, LATypes, BallTreeLocationAssigner, BeeLineLocationAssigner, CircleLocationAssigner, PolygonLocationAssigner, CachedLocationAssigner, GridLocationAssigner
 
 @click.command()
 @click.argument("location_data", metavar="[Location Data]", type=click.Path(exists=True, readable=True, dir_okay=False, path_type=Path))
@@ -15,10 +15,22 @@ from gravity_model.distance import LATypes, BallTreeLocationAssigner, BeeLineLoc
 @click.argument("results_output", metavar="[Trip Data Output]", type=click.Path(readable=True, dir_okay=False, path_type=Path))
 @click.option("-k", "--keep-distance", "keep_distance", is_flag=True)
 @click.option("-d", "--drop", is_flag=True)
-def main(location_data: Path, raw_data: Path, loc_assigner_type:LATypes, results_output: Path, keep_distance: bool, drop: bool):
+@click.option("-s", "--stream", is_flag=True, help="Convert the trip data in chunks and write them incrementally, keeping memory usage constant")
+@click.option("--batch-size", type=int, default=1_000_000, help="Number of raw rows per chunk when streaming")
+@click.option("-b", "--boundaries", type=click.Path(exists=True, readable=True, dir_okay=False, path_type=Path), help="Boundary polygons of the locations (geojson, or csv with a WKT geometry column), required by the POLYGON assigner")
+@click.option("--boundaries-id", type=str, default="LAD24CD", help="Column of the boundary data holding the location id")
+@click.option("--no-assignment-cache", "no_assignment_cache", is_flag=True, help="Do not reuse or store the location assignments of celltower coordinates")
+@click.option("--grid-base", type=click.Choice([LATypes.BALLTREE, LATypes.BEELINE], case_sensitive=False), default=LATypes.BALLTREE, help="Nearest location assigner the GRID assigner is built from and falls back to near boundaries")
+@click.option("--grid-resolution", type=float, default=GRID_RESOLUTION, help="Size of the GRID assigner's cells in degrees")
+def main(location_data: Path, raw_data: Path, loc_assigner_type:LATypes, results_output: Path, keep_distance: bool, drop: bool, stream: bool, batch_size: int, boundaries: Path, boundaries_id: str, no_assignment_cache: bool, grid_base: LATypes, grid_resolution: float):
     logger.info(f"Loading location data from {location_data.absolute().as_posix()}")
-    locs = LocationContainer.from_csv(location_data)
-    
+    locs = LocationContainer.from_file(location_data)
+
+    # The GRID assigner is a lookup table on top of one of the others
+    grid = loc_assigner_type is LATypes.GRID
+    if grid:
+        loc_assigner_type = grid_base
+
     # Depending on the loc_assigner_type choosen by the user we initialze one
     if loc_assigner_type is LATypes.BALLTREE:
         loc_assigner = BallTreeLocationAssigner(locs)
@@ -27,16 +39,38 @@ def main(location_data: Path, raw_data: Path, loc_assigner_type:LATypes, results
         loc_assigner = BeeLineLocationAssigner(locs)
     elif loc_assigner_type is LATypes.CIRCLE:
         loc_assigner = CircleLocationAssigner(locs)
+    elif loc_assigner_type is LATypes.POLYGON:
+        if boundaries is None:
+            raise click.UsageError("The POLYGON assigner needs the boundary polygons, see --boundaries")
+        logger.info(f"Loading boundary polygons from {boundaries.absolute().as_posix()}")
+        loc_assigner = PolygonLocationAssigner(locs, boundaries, boundaries_id, id_mapping=MERGED_BOUNDARIES)
+
+    if grid:
+        loc_assigner = GridLocationAssigner(loc_assigner, resolution=grid_resolution)
+    if not no_assignment_cache:
+        loc_assigner = CachedLocationAssigner(loc_assigner)
 
     if keep_distance:
         logger.info("Will keep celltower coordinates instead of mapping to location coordinates")
     if drop:
         logger.info("Will drop any trips with less than 100km of length")
 
+    trips_schema = {"start_lat": "home_coord_x", "start_long": "home_coord_y", "stop_lat": "dest_coord_x", "stop_long": "dest_coord_y", "number": "frequency"}
+
+    if stream:
+        logger.info(f"Streaming unprocessed trip data from {raw_data.absolute().as_posix()} to {results_output.absolute().as_posix()}")
+        written, min_dist = TripLoader.stream_trips(
+            loc_assigner, raw_data, trips_schema, results_output,
+            keep_distance=keep_distance, min_distance=100 if drop else 0, batch_size=batch_size
+        )
+        logger.info(f"Wrote {written} trips")
+        if drop and min_dist < 100:
+            raise RuntimeError(f"The drop flag is set, but the shortest trip is shorter than 100km long! ({min_dist})")
+        return
+
     logger.info(f"Loading unprocessed trip data from {raw_data.absolute().as_posix()}")
     trips = TripLoader.load_trips(
-        loc_assigner, raw_data,
-        {"start_lat": "home_coord_x", "start_long": "home_coord_y", "stop_lat": "dest_coord_x", "stop_long": "dest_coord_y", "number": "frequency"},
+        loc_assigner, raw_data, trips_schema,
         keep_distance=keep_distance, min_distance=100 if drop else 0
     )
     # We double check that we properly filtered all trips that are shorter than 100km
@@ -46,7 +80,7 @@ def main(location_data: Path, raw_data: Path, loc_assigner_type:LATypes, results
         raise RuntimeError(f"The drop flag is set, but the shortest trip is shorter than 100km long! ({min_dist})")
 
     logger.info(f"Saving normalized trip data to {results_output.absolute().as_posix()}")
-    trips.to_csv(results_output)
+    trips.to_file(results_output)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
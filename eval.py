@@ -7,7 +7,7 @@ import click
 from gravity_model.log import logger
 from gravity_model.trip import TripContainer
 from gravity_model.visualize import set_dpi, visualize, vis_types
-from gravity_model.training import chi_square_distance, kolmogorov_smirnov_statistic, get_histogram, get_ccdf
+from gravity_model.training import Distribution
 
 @click.command()
 @click.argument("trip_location", metavar="[Trip Data]", type=click.Path(exists=True, readable=True, dir_okay=False, path_type=Path))
@@ -20,11 +20,11 @@ def main(trip_location: Path, compare: tuple[Path, str], error: bool, results_ou
     set_dpi(1200, 1200)
 
     logger.info(f"Loading model trip data from {trip_location.absolute().as_posix()}")
-    trips = TripContainer.from_csv(trip_location)
+    trips = TripContainer.from_file(trip_location)
 
     if compare:
         logger.info(f"Loading real trip data from  {compare[0].absolute().as_posix()}")
-        comparison = TripContainer.from_csv(compare[0])
+        comparison = TripContainer.from_file(compare[0])
 
     logger.info(f"Visualizing trips...")
     for current_visualization_type in vis_types:
@@ -37,8 +37,9 @@ def main(trip_location: Path, compare: tuple[Path, str], error: bool, results_ou
     if compare and error:
         logger.info("Calculating error values...")
         import json
-        chi = chi_square_distance(get_histogram(trips), get_histogram(comparison))
-        kss = kolmogorov_smirnov_statistic(get_ccdf(trips), get_ccdf(comparison))
+        distribution, comparison_distribution = Distribution(trips), Distribution(comparison)
+        chi = distribution.chi_square_distance(comparison_distribution)
+        kss = distribution.kolmogorov_smirnov_statistic(comparison_distribution)
 
         errors = {
             "chi": chi,
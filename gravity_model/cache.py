@@ -0,0 +1,17 @@
+import os
+from pathlib import Path
+
+from .log import logger
+
+CACHE_DIRECTORY = Path(os.environ.get("GRAVITY_MODEL_CACHE", ".cache"))
+
+def cache_file(kind: str, key: str, suffix: str) -> Path:
+    """
+    Returns the path of a cache entry of the given kind (e.g. "distances"), creating the cache directory if needed.
+    The key should identify the content the entry was derived from, e.g. a hash of the location dataset.
+    """
+    directory = CACHE_DIRECTORY.joinpath(kind)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory.joinpath(f"{key}{suffix}")
+    logger.debug(f"Using cache file {path.as_posix()}")
+    return path
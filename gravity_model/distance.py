@@ -1,20 +1,60 @@
 from abc import ABC, abstractmethod
+from hashlib import sha256
+from pathlib import Path
 import math
 import enum
 
 import numpy as np
-from sklearn.neighbors import BallTree
+import polars as pl
+from sklearn.neighbors import BallTree, KDTree
 from geopy.distance import distance
 
 from .location import LocationContainer, Location
+from .geodesic import geodesic
+from .storage import FILE_SUFFIXES, read_frame
+from .log import logger
+from .cache import cache_file
 
 class LATypes(enum.StrEnum):
     BALLTREE = "BALLTREE"
     BEELINE = "BEELINE"
     CIRCLE = "CIRCLE"
+    POLYGON = "POLYGON"
+    GRID = "GRID"
+
+# Location index returned for coordinates that could not be assigned to any location
+UNASSIGNED = -1
+
+# Raster cells of the GRID assigner that hold no location, or that need to be assigned by the exact assigner
+GRID_UNASSIGNED = np.iinfo(np.uint16).max - 1
+GRID_FALLBACK = np.iinfo(np.uint16).max
+# Extent (west, east, south, north) in degrees and resolution of the GRID assigner, covering the UK
+GRID_EXTENT = (-10.0, 4.0, 49.0, 61.0)
+GRID_RESOLUTION = 0.005
+
+# Boundaries of locations that were merged in the location data, as boundary id -> location id. The London
+# boroughs (E09) are merged into the London region (E12000007) in census_data/uk_boundaries_merged_2024.csv
+MERGED_BOUNDARIES = {f"E09{number:06d}": "E12000007" for number in range(1, 34)}
+# Coordinates outside of every boundary polygon are assigned to the nearest one within this distance in degrees
+POLYGON_TOLERANCE = 0.01
+
+# Mean earth radius in kilometers, used to convert kilometers into haversine (unit sphere) distances
+EARTH_RADIUS = 6371.0088
+# Spherical and ellipsoidal distances differ by less than 1%, candidates are searched in a slightly larger radius
+# and then filtered by their exact geodesic distance
+SPHERE_TOLERANCE = 1.01
+
+def unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """(n, 3) array of the positions of the coordinates (in degrees) on the unit sphere."""
+    lat, long = np.radians(latitudes), np.radians(longitudes)
+    return np.column_stack((np.cos(lat) * np.cos(long), np.cos(lat) * np.sin(long), np.sin(lat)))
 
 class BaseLocationAssigner(ABC):
 
+    TYPE: LATypes = None
+    # Whether the region of every location is convex, e.g. the cells of a nearest neighbour assignment
+    CONVEX: bool = False
+
     @abstractmethod
     def __init__(self, locations: LocationContainer):
         super().__init__()
@@ -23,53 +63,349 @@ class BaseLocationAssigner(ABC):
     def check(self, coordinates: tuple[float, float]) -> Location | None:
         pass
 
+    def check_many(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """
+        Assigns arrays of coordinates at once, returning the location index of every coordinate (UNASSIGNED if none).
+        Assigners should override this with a vectorised implementation, this fallback calls check once per coordinate.
+        """
+        indices = np.full(len(latitudes), UNASSIGNED, dtype=np.int64)
+        for i, coordinates in enumerate(zip(latitudes.tolist(), longitudes.tolist())):
+            location = self.check(coordinates)
+            if location is not None:
+                indices[i] = self.locations.index_of(location.lid)
+        return indices
+
+    def cache_key(self) -> str:
+        """Identifies the assignments this assigner makes, i.e. its type and everything it was built from."""
+        return f"{self.TYPE}-{self.locations.digest()}"
+
 class BallTreeLocationAssigner(BaseLocationAssigner):
+
+    TYPE = LATypes.BALLTREE
+    CONVEX = True
+
     def __init__(self, locations: LocationContainer):
         self.locations = locations
-        coords: list[tuple[float, float]] = []
-        for loc in locations.locations:
-            coords.append( tuple(np.radians(loc.coordinates)) )
-        self.tree = BallTree(coords, leaf_size=2, metric="haversine")
+        self.tree = BallTree(np.radians(locations.coordinates), leaf_size=2, metric="haversine")
 
     def check(self, coordinates: tuple[float, float]):
         _, location_index = self.tree.query(np.radians( [(coordinates[0], coordinates[1])] ) , 1)
-        location = self.locations.locations[location_index[0][0]]
+        location = self.locations.location(location_index[0][0])
         return location
+
+    def check_many(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        location_index = self.tree.query(np.radians(np.column_stack((latitudes, longitudes))), 1, return_distance=False)
+        return location_index[:, 0].astype(np.int64)
     
 class BeeLineLocationAssigner(BaseLocationAssigner):
+    """
+    Assigns coordinates to the location with the shortest geodesic distance.
+
+    The locations are indexed as 3D unit vectors in a KDTree, whose euclidean (chord) nearest neighbours are the
+    nearest ones on the sphere. The few nearest candidates are then compared by their exact geodesic distance.
+    """
+
+    TYPE = LATypes.BEELINE
+    CONVEX = True
+
+    # Number of nearest candidates on the sphere that are compared by their geodesic distance
+    CANDIDATES = 4
+    # Number of coordinates queried at once
+    BATCH_SIZE = 1_000_000
+
     def __init__(self, locations: LocationContainer):
         self.locations = locations
+        self.tree = KDTree(unit_vectors(locations.latitudes, locations.longitudes))
 
     def check(self, coordinates):
-        nearest_loc = None
-        shortest_distance = -1
-        for loc in self.locations.locations:
-            curr_distance = distance(loc.coordinates, coordinates)
-            if shortest_distance == -1 or curr_distance < shortest_distance:
-                nearest_loc = loc
-                shortest_distance = curr_distance
-        return nearest_loc
+        return self.locations.location(self.check_many(np.array([coordinates[0]]), np.array([coordinates[1]]))[0])
+
+    def check_many(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        indices = np.empty(len(latitudes), dtype=np.int64)
+        k = min(self.CANDIDATES, len(self.locations))
+        for start in range(0, len(latitudes), self.BATCH_SIZE):
+            lat = latitudes[start:start + self.BATCH_SIZE, None]
+            long = longitudes[start:start + self.BATCH_SIZE, None]
+            candidates = self.tree.query(unit_vectors(lat[:, 0], long[:, 0]), k, return_distance=False)
+            distances = geodesic(lat, long, self.locations.latitudes[candidates], self.locations.longitudes[candidates])
+            # Candidates are compared in location index order, so the lowest index wins ties like in a linear scan
+            order = np.argsort(candidates, axis=1)
+            candidates = np.take_along_axis(candidates, order, axis=1)
+            distances = np.take_along_axis(distances, order, axis=1)
+            indices[start:start + len(lat)] = candidates[np.arange(len(lat)), np.argmin(distances, axis=1)]
+        return indices
 
 class CircleLocationAssigner(BaseLocationAssigner):
+    """
+    Assigns coordinates to the nearest location whose circle (of the same area as the location) contains them.
+
+    The coordinates are put into a haversine BallTree, which is queried once with every location's own radius.
+    Only the candidates found that way are checked with the exact geodesic distance.
+    """
+
+    TYPE = LATypes.CIRCLE
+
+    # Number of coordinates indexed at once, bounds the memory used by the tree and the candidate pairs
+    BATCH_SIZE = 1_000_000
+
     def __init__(self, locations: LocationContainer):
         self.locations = locations
-        self.areas: dict[Location, float] = {}
-        for loc in self.locations.locations:
-            area = loc.area
-            self.areas[loc] = self.calculate_radius(area) 
+        self.radii: np.ndarray = self.calculate_radius(locations.areas)
+        # Locations without an area have a NaN radius and never contain any coordinates
+        self.circles: np.ndarray = np.flatnonzero(self.radii > 0)
+        self.centers: np.ndarray = np.radians(locations.coordinates[self.circles])
+        self.search_radii: np.ndarray = self.radii[self.circles] * SPHERE_TOLERANCE / EARTH_RADIUS
 
     @staticmethod
     def calculate_radius(area_km2):
         """returns the radius of a circle from its area."""
-        return math.sqrt(area_km2 / math.pi)
+        with np.errstate(invalid="ignore"):
+            return np.sqrt(area_km2 / math.pi)
+
+    def check(self, coordinates):
+        index = self.check_many(np.array([coordinates[0]]), np.array([coordinates[1]]))[0]
+        return None if index == UNASSIGNED else self.locations.location(index)
+
+    def check_many(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        indices = np.full(len(latitudes), UNASSIGNED, dtype=np.int64)
+        for start in range(0, len(latitudes), self.BATCH_SIZE):
+            lat = latitudes[start:start + self.BATCH_SIZE]
+            long = longitudes[start:start + self.BATCH_SIZE]
+            tree = BallTree(np.radians(np.column_stack((lat, long))), metric="haversine")
+            found = tree.query_radius(self.centers, self.search_radii)
+            counts = np.fromiter((len(f) for f in found), dtype=np.int64, count=len(found))
+            if counts.sum() == 0:
+                continue
+            candidates = np.repeat(self.circles, counts)
+            points = np.concatenate(found).astype(np.int64)
+            distances = geodesic(lat[points], long[points], self.locations.latitudes[candidates], self.locations.longitudes[candidates])
+            # Check if coordinates are within the circle
+            inside = distances < self.radii[candidates]
+            points, candidates, distances = points[inside], candidates[inside], distances[inside]
+            # If within multiple circles, the nearest one wins (the lowest location index on ties)
+            order = np.lexsort((candidates, distances, points))
+            points, candidates = points[order], candidates[order]
+            first = np.ones(len(points), dtype=bool)
+            first[1:] = points[1:] != points[:-1]
+            indices[start + points[first]] = candidates[first]
+        return indices
+
+class PolygonLocationAssigner(BaseLocationAssigner):
+    """
+    Assigns coordinates to the location whose boundary polygon contains them.
+
+    The boundaries are read once into a shapely STRtree, which answers the point-in-polygon test for whole arrays of
+    coordinates. Coordinates just outside of every polygon (e.g. on the coastline) are assigned to the nearest polygon
+    within the tolerance, measured in degrees, coordinates further away stay unassigned.
+    Boundaries can be any file geopandas can read (e.g. geojson), or a csv / parquet / ipc file with a WKT geometry
+    column. Polygons are matched to locations by their id. Ids that are not part of the location data are looked up
+    in id_mapping, so the polygons of merged locations are dissolved into the location they were merged into.
+    Boundaries that still match no location are an error, their coordinates would end up in a neighbouring location.
+    """
+
+    TYPE = LATypes.POLYGON
+
+    def __init__(self, locations: LocationContainer, boundaries: Path, id_column: str = "LAD24CD", geometry_column: str = "geometry", id_mapping: dict[str, str] = None, tolerance: float = POLYGON_TOLERANCE):
+        # shapely (and geopandas for geojson / shapefiles) are only needed by this assigner
+        import shapely
+
+        self.locations = locations
+        self.boundaries = Path(boundaries)
+        self.id_column = id_column
+        self.id_mapping = dict(id_mapping) if id_mapping is not None else {}
+        self.tolerance = tolerance
+        ids, geometries = self.load_boundaries(self.boundaries, id_column, geometry_column)
+        location_ids = set(self.locations.ids)
+        ids = [lid if lid in location_ids else self.id_mapping.get(lid, lid) for lid in ids]
+        unknown = sorted({lid for lid in ids if lid not in location_ids})
+        if unknown:
+            raise ValueError(f"{len(unknown)} boundary ids are not part of the location data (e.g. {', '.join(unknown[:5])}), map them to their locations with id_mapping!")
+        self.polygon_locations: np.ndarray = np.array([self.locations.index_of(lid) for lid in ids], dtype=np.int64)
+        self.tree = shapely.STRtree(geometries)
+        logger.info(f"Indexed {len(self.polygon_locations)} boundaries for {len(np.unique(self.polygon_locations))} locations")
+
+    @staticmethod
+    def load_boundaries(boundaries: Path, id_column: str, geometry_column: str) -> tuple[list[str], np.ndarray]:
+        import shapely
+
+        if boundaries.suffix.lower() in FILE_SUFFIXES:
+            df = read_frame(boundaries, sidecar=False)
+            return df.get_column(id_column).cast(str).to_list(), shapely.from_wkt(df.get_column(geometry_column).to_numpy())
+        import geopandas
+        gdf = geopandas.read_file(boundaries).to_crs("EPSG:4326")
+        return gdf[id_column].astype(str).to_list(), gdf.geometry.to_numpy()
+
+    def cache_key(self) -> str:
+        with self.boundaries.open("rb") as f:
+            boundaries = sha256(f.read()).hexdigest()
+        mapping = ",".join(f"{key}:{value}" for key, value in sorted(self.id_mapping.items()))
+        return sha256(f"{super().cache_key()}|{boundaries}|{self.id_column}|{mapping}|{self.tolerance}".encode()).hexdigest()
+
+    def check(self, coordinates):
+        index = self.check_many(np.array([coordinates[0]]), np.array([coordinates[1]]))[0]
+        return None if index == UNASSIGNED else self.locations.location(index)
+
+    def check_many(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        import shapely
+
+        points = shapely.points(np.asarray(longitudes, dtype=np.float64), np.asarray(latitudes, dtype=np.float64))
+        indices = np.full(len(points), UNASSIGNED, dtype=np.int64)
+        point_index, polygon_index = self.tree.query(points, predicate="within")
+        # Points on the border of two polygons are assigned to the location with the lowest index
+        candidates = self.polygon_locations[polygon_index]
+        order = np.lexsort((candidates, point_index))
+        point_index, candidates = point_index[order], candidates[order]
+        first = np.ones(len(point_index), dtype=bool)
+        first[1:] = point_index[1:] != point_index[:-1]
+        indices[point_index[first]] = candidates[first]
+
+        outside = np.flatnonzero((indices == UNASSIGNED) & ~shapely.is_missing(points) & ~shapely.is_empty(points))
+        if len(outside) > 0:
+            point_index, polygon_index = self.tree.query_nearest(points[outside], max_distance=self.tolerance, all_matches=False)
+            indices[outside[point_index]] = self.polygon_locations[polygon_index]
+        return indices
+
+class CachedLocationAssigner(BaseLocationAssigner):
+    """
+    Wraps another assigner and remembers the location index of every coordinate it has assigned.
+
+    Trip endpoints repeat the same celltower coordinates over and over, so only the unique coordinates that are not
+    in the lookup table yet are passed on to the wrapped assigner, everything else is a join. The table is persisted
+    in the cache directory, keyed by the wrapped assigner's cache key, so it is shared between runs. It is stored as
+    a directory of IPC parts: every batch only appends the assignments it added, the parts are merged when loading.
+    """
+
+    SCHEMA = {"lat": pl.Float64, "long": pl.Float64, "location": pl.Int64}
+
+    # Number of parts above which they are merged into a single one when the table is loaded
+    MAXIMUM_PARTS = 16
+
+    def __init__(self, assigner: BaseLocationAssigner):
+        self.assigner = assigner
+        self.locations = assigner.locations
+        self.TYPE = assigner.TYPE
+        self.CONVEX = assigner.CONVEX
+        self.directory = cache_file("assignments", assigner.cache_key(), "")
+        self.directory.mkdir(exist_ok=True)
+        parts = sorted(self.directory.glob("*.arrow"))
+        self.next_part = int(parts[-1].stem) + 1 if parts else 0
+        if parts:
+            # An interrupted merge can leave assignments in two parts, the lookup needs every coordinate only once
+            self.table = pl.concat([pl.read_ipc(part, memory_map=False) for part in parts]).unique(subset=["lat", "long"], keep="first", maintain_order=True)
+            logger.info(f"Loaded {self.table.height} cached coordinate assignments from {self.directory.as_posix()}")
+            if len(parts) > self.MAXIMUM_PARTS:
+                self.append(self.table)
+                for part in parts:
+                    part.unlink()
+        else:
+            self.table = pl.DataFrame(schema=self.SCHEMA)
+
+    def cache_key(self) -> str:
+        return self.assigner.cache_key()
+
+    def check(self, coordinates):
+        index = self.check_many(np.array([coordinates[0]]), np.array([coordinates[1]]))[0]
+        return None if index == UNASSIGNED else self.locations.location(index)
+
+    def check_many(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        points = pl.DataFrame({"lat": latitudes, "long": longitudes}, schema={"lat": pl.Float64, "long": pl.Float64})
+        missing = points.unique().join(self.table, on=["lat", "long"], how="anti")
+        if missing.height > 0:
+            indices = self.assigner.check_many(missing.get_column("lat").to_numpy(), missing.get_column("long").to_numpy())
+            added = missing.with_columns(pl.Series("location", indices, dtype=pl.Int64))
+            self.table = pl.concat([self.table, added])
+            self.append(added)
+        return points.join(self.table, on=["lat", "long"], how="left", maintain_order="left").get_column("location").fill_null(UNASSIGNED).to_numpy()
+
+    def append(self, assignments: pl.DataFrame):
+        """Stores the given assignments as the next part of the persisted table."""
+        path = self.directory.joinpath(f"{self.next_part:08d}.arrow")
+        self.next_part += 1
+        # Write to a temporary file first, so an interrupted run never leaves a truncated cache entry
+        temporary = path.with_suffix(".tmp")
+        assignments.write_ipc(temporary, compression="uncompressed")
+        temporary.replace(path)
+
+class GridLocationAssigner(BaseLocationAssigner):
+    """
+    Assigns coordinates by looking up the cell of a precomputed lat/long raster of location indices.
+
+    The raster is built once from another (exact) assigner by assigning the corners of every cell. Cells whose corners
+    are all assigned to the same location hold its index, all other cells lie on a boundary and are flagged, the
+    coordinates inside them are passed on to the exact assigner, as well as those outside of the raster's extent.
+    The raster is stored in the cache directory as uint16 array, keyed by the exact assigner and the raster layout.
+    Agreeing corners only prove that the whole cell belongs to one location if every location's region is convex, so
+    only nearest neighbour assigners (BALLTREE, BEELINE) can be rastered. With CIRCLE or POLYGON regions an enclave
+    or a small circle that lies inside a cell without touching its corners would be missed.
+    """
+
+    TYPE = LATypes.GRID
+
+    # Number of cell corners assigned at once when building the raster
+    BATCH_SIZE = 1_000_000
+
+    def __init__(self, assigner: BaseLocationAssigner, extent: tuple[float, float, float, float] = GRID_EXTENT, resolution: float = GRID_RESOLUTION):
+        if not assigner.CONVEX:
+            raise ValueError(f"The GRID assigner needs an assigner with convex regions ({LATypes.BALLTREE} or {LATypes.BEELINE}), not {assigner.TYPE}!")
+        if len(assigner.locations) >= GRID_UNASSIGNED:
+            raise ValueError(f"The GRID assigner supports at most {GRID_UNASSIGNED} locations!")
+        self.assigner = assigner
+        self.locations = assigner.locations
+        self.west, self.east, self.south, self.north = extent
+        self.resolution = resolution
+        self.rows = int(round((self.north - self.south) / resolution))
+        self.columns = int(round((self.east - self.west) / resolution))
+        path = cache_file("grids", self.cache_key(), ".npy")
+        if path.exists():
+            logger.info(f"Loading cached location grid from {path.as_posix()}")
+            self.cells: np.ndarray = np.load(path, mmap_mode="r")
+        else:
+            self.cells = self.build()
+            # Write to a temporary file first, so an interrupted run never leaves a truncated cache entry
+            temporary = path.with_suffix(".tmp")
+            with temporary.open("wb") as f:
+                np.save(f, self.cells)
+            temporary.replace(path)
+        logger.info(f"{np.count_nonzero(self.cells == GRID_FALLBACK) / self.cells.size:.2%} of the {self.rows}x{self.columns} grid cells use the exact {self.assigner.TYPE} assigner")
+
+    def cache_key(self) -> str:
+        return sha256(f"{self.TYPE}|{self.assigner.cache_key()}|{self.west},{self.east},{self.south},{self.north}|{self.resolution}".encode()).hexdigest()
+
+    def build(self) -> np.ndarray:
+        logger.info(f"Building a {self.rows}x{self.columns} location grid with the {self.assigner.TYPE} assigner")
+        latitudes = self.south + np.arange(self.rows + 1) * self.resolution
+        longitudes = self.west + np.arange(self.columns + 1) * self.resolution
+        corners = np.empty((self.rows + 1, self.columns + 1), dtype=np.int64)
+        step = max(1, self.BATCH_SIZE // len(longitudes))
+        for start in range(0, len(latitudes), step):
+            lat, long = np.meshgrid(latitudes[start:start + step], longitudes, indexing="ij")
+            corners[start:start + step] = self.assigner.check_many(lat.ravel(), long.ravel()).reshape(lat.shape)
+        corners = np.where(corners == UNASSIGNED, GRID_UNASSIGNED, corners)
+        cells = corners[:-1, :-1].astype(np.uint16)
+        uniform = (corners[:-1, :-1] == corners[1:, :-1]) & (corners[:-1, :-1] == corners[:-1, 1:]) & (corners[:-1, :-1] == corners[1:, 1:])
+        cells[~uniform] = GRID_FALLBACK
+        return cells
 
     def check(self, coordinates):
-        nearest_loc = None
-        shortest_distance = -1
-        for key, value in self.areas.items():
-            curr_distance = distance(key.coordinates, coordinates)
-            if curr_distance.km < value: # Check if coordinates are within circle
-                if shortest_distance == -1 or curr_distance < shortest_distance: # if within multiple circles, check if the current is nearer
-                    nearest_loc = key
-                    shortest_distance = curr_distance
-        return nearest_loc
+        index = self.check_many(np.array([coordinates[0]]), np.array([coordinates[1]]))[0]
+        return None if index == UNASSIGNED else self.locations.location(index)
+
+    def check_many(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            row = np.floor((latitudes - self.south) / self.resolution)
+            column = np.floor((longitudes - self.west) / self.resolution)
+            inside = (row >= 0) & (row < self.rows) & (column >= 0) & (column < self.columns)
+        cells = np.full(len(latitudes), GRID_FALLBACK, dtype=np.uint16)
+        cells[inside] = self.cells[row[inside].astype(np.int64), column[inside].astype(np.int64)]
+        indices = cells.astype(np.int64)
+        indices[cells == GRID_UNASSIGNED] = UNASSIGNED
+        fallback = np.flatnonzero(cells == GRID_FALLBACK)
+        if len(fallback) > 0:
+            indices[fallback] = self.assigner.check_many(latitudes[fallback], longitudes[fallback])
+        return indices
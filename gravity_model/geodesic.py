@@ -0,0 +1,65 @@
+import numpy as np
+from geopy.distance import distance
+
+# WGS-84, the ellipsoid geopy uses for its geodesic distance (axes in kilometers)
+EQUATORIAL_RADIUS = 6378.137
+FLATTENING = 1 / 298.257223563
+POLAR_RADIUS = EQUATORIAL_RADIUS * (1 - FLATTENING)
+
+VINCENTY_TOLERANCE = 1e-12
+VINCENTY_ITERATIONS = 200
+
+def geodesic(lat_a: np.ndarray, long_a: np.ndarray, lat_b: np.ndarray, long_b: np.ndarray) -> np.ndarray:
+    """
+    Vectorised geodesic distance in kilometers between coordinates given in degrees, using Vincenty's inverse formula.
+    Inputs are broadcast against each other. Pairs for which the iteration does not converge (nearly antipodal points)
+    fall back to geopy.
+    """
+    lat_a, long_a, lat_b, long_b = np.broadcast_arrays(
+        np.asarray(lat_a, dtype=np.float64), np.asarray(long_a, dtype=np.float64),
+        np.asarray(lat_b, dtype=np.float64), np.asarray(long_b, dtype=np.float64)
+    )
+    f, a, b = FLATTENING, EQUATORIAL_RADIUS, POLAR_RADIUS
+
+    L = np.radians(long_b - long_a)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat_a)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat_b)))
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(VINCENTY_ITERATIONS):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_U2 * sin_lam, cos_U1 * sin_U2 - sin_U1 * cos_U2 * cos_lam)
+            cos_sigma = sin_U1 * sin_U2 + cos_U1 * cos_U2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_U1 * cos_U2 * sin_lam / sin_sigma)
+            cos_sq_alpha = 1 - sin_alpha ** 2
+            # Equatorial lines have cos_sq_alpha == 0
+            cos_2sigma_m = np.where(cos_sq_alpha == 0, 0.0, cos_sigma - 2 * sin_U1 * sin_U2 / cos_sq_alpha)
+            C = f / 16 * cos_sq_alpha * (4 + f * (4 - 3 * cos_sq_alpha))
+            previous = lam
+            lam = L + (1 - C) * f * sin_alpha * (sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            converged = np.abs(lam - previous) <= VINCENTY_TOLERANCE
+            if converged.all():
+                break
+
+        u_sq = cos_sq_alpha * (a ** 2 - b ** 2) / (b ** 2)
+        A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        result = b * A * (sigma - delta_sigma)
+
+    # Coincident points
+    result = np.where(sin_sigma == 0, 0.0, result)
+    for index in map(tuple, np.argwhere(~converged | ~np.isfinite(result))):
+        result[index] = distance((lat_a[index], long_a[index]), (lat_b[index], long_b[index])).kilometers
+    return result
+
+def pairwise_geodesic(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """(n, n) matrix of geodesic distances in kilometers between all given coordinates."""
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    return geodesic(latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :])
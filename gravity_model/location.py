@@ -1,12 +1,21 @@
 from pathlib import Path
+from hashlib import sha256
+from sys import intern
 from typing import Union
 
+import numpy as np
 import polars as pl
 from geopy.distance import distance
-import tqdm
+
+from .log import logger
+from .cache import cache_file
+from .geodesic import pairwise_geodesic
+from .storage import read_frame, write_frame
 
 class Location():
 
+    __slots__ = ("_name", "_lid", "_latitude", "_longitude", "_area", "_population", "index", "_hash")
+
     LOCATION_SCHEMA = \
     {
         "name": pl.String,
@@ -17,11 +26,15 @@ class Location():
         "population": pl.Int64
     }
 
-    def __init__(self, location_name: str, location_id: str, latitude: float, longitude: float, area: float, popoluation: int = None):
+    def __init__(self, location_name: str, location_id: str, latitude: float, longitude: float, area: float, popoluation: int = None, location_index: int = -1):
+        # The hash is calculated on first use and reset whenever one of its components is changed through a setter
+        self._hash: int = None
         self.name: str = location_name
         self.lid: str = location_id
         self.latitude: float = latitude
         self.longitude: float = longitude
+        # Index of the location in its LocationContainer, -1 if it does not belong to one
+        self.index: int = location_index
         if area is None:
             self._area: int = -1
         if isinstance(area, (int, float)) and area >= 0:
@@ -32,7 +45,43 @@ class Location():
             self.population = int(popoluation)
 
     def get_copy(self):
-        return Location(self.name, self.lid, self.latitude, self.longitude, self.area, self.population)
+        return Location(self.name, self.lid, self.latitude, self.longitude, self.area, self.population, self.index)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, value: str):
+        self._name = value
+        self._hash = None
+
+    @property
+    def lid(self) -> str:
+        return self._lid
+
+    @lid.setter
+    def lid(self, value: str):
+        self._lid = value
+        self._hash = None
+
+    @property
+    def latitude(self) -> float:
+        return self._latitude
+
+    @latitude.setter
+    def latitude(self, value: float):
+        self._latitude = value
+        self._hash = None
+
+    @property
+    def longitude(self) -> float:
+        return self._longitude
+
+    @longitude.setter
+    def longitude(self, value: float):
+        self._longitude = value
+        self._hash = None
 
     @property
     def area(self):
@@ -57,6 +106,7 @@ class Location():
         if value < 0:
             raise ValueError(f"Population needs to be zero or higher, not {value}")
         self._population = int(value)
+        self._hash = None
 
     @property
     def coordinates(self) -> tuple[float, float]:
@@ -95,13 +145,14 @@ class Location():
         }
     
     def __getstate__(self):
-        return self.as_dict()
+        return {**self.as_dict(), "index": self.index}
 
     def __setstate__(self, state: dict):
         self.name = state.get("name")
         self.lid = state.get("id")
         self.latitude = state.get("lat")
         self.longitude = state.get("long")
+        self.index = state.get("index", -1)
         self.area = state.get("area")
         self.population = state.get("population")
 
@@ -111,7 +162,7 @@ class Location():
         
         other: Location = other
 
-        return (other.coordinates == self.coordinates) and (self.area == other.area)
+        return (other.latitude == self.latitude) and (other.longitude == self.longitude) and (self.area == other.area)
     
     def __lt__(self, other):
         if not isinstance(other, Location):
@@ -133,35 +184,47 @@ class Location():
             return False
     
     def __hash__(self):
-        return hash((self.name, self.lid, self.coordinates, self.population))
+        if self._hash is None:
+            self._hash = hash((self.name, self.lid, self.latitude, self.longitude, self.population))
+        return self._hash
     
     def __repr__(self):
         return f"Location(name={self.name},id={self.lid},coordinates={self.coordinates},population={self.population})"
         
 
 class LocationContainer():
-    
+    """
+    Column oriented table of locations.
+
+    The polars DataFrame is the authoritative representation, the numeric columns are exposed as numpy arrays
+    and every location is identified by its stable row index. Location objects are only created when requested.
+    """
+
     def __init__(self, locations: list[Location] = None, df: pl.DataFrame = None):
         if locations is None and df is None:
             raise ValueError("When instantiating a LocationContainer, at least one input must be provided!")
         self._locations = locations
         self._df = df
+        self._columns: dict[str, np.ndarray] = {}
+        self._names: tuple[str, ...] = None
+        self._ids: tuple[str, ...] = None
+        self._index: dict[str, int] = None
+        self._digest: str = None
+        self._distances: np.ndarray = None
+        # File the locations were read from, if any, so derived artifacts can refer back to the dataset
+        self.source: Path = None
     
     @property
-    def locations(self):
-        if self._locations is None and self.df is not None:
-            self._locations = []
-            for row in tqdm.tqdm(self.df.iter_rows(named=True), desc="Converting DataFrame to list", total=self.df.height, unit="row(s)"):
-                self._locations.append(
-                    Location(
-                        row["name"],
-                        row["id"],
-                        row["lat"],
-                        row["long"],
-                        row["area"],
-                        row["population"]
-                    )
-                )
+    def locations(self) -> list[Location]:
+        if self._locations is None and self._df is not None:
+            self._locations = [
+                Location(name, lid, lat, long, area, population, index)
+                for index, (name, lid, lat, long, area, population) in enumerate(zip(
+                    self.names, self.ids,
+                    self._df["lat"].to_list(), self._df["long"].to_list(),
+                    self._df["area"].to_list(), self._df["population"].to_list()
+                ))
+            ]
         return self._locations
 
     @locations.setter
@@ -172,16 +235,14 @@ class LocationContainer():
             if not isinstance(v, Location):
                 raise TypeError("the list provided can only contain Locations")
         self._locations = value
+        self._df = None
+        self._invalidate_columns()
     
     @property
     def df(self) -> pl.DataFrame:
-        if self._df is None and self.locations is not None:
-            rows = []
-            for loc in tqdm.tqdm(self.locations, desc="Making DataFrame", total=len(self.locations), unit="location(s)"):
-                rows.append(
-                    loc.as_dict()
-                )
-            self._df = pl.DataFrame(data=rows,
+        if self._df is None and self._locations is not None:
+            self._df = pl.DataFrame(
+                data=[loc.as_dict() for loc in self._locations],
                 schema=Location.LOCATION_SCHEMA
             )
         return self._df
@@ -190,19 +251,130 @@ class LocationContainer():
     def df(self, value):
         if not isinstance(value, pl.DataFrame):
             raise TypeError("the df property needs to be a polars DataFrame")
+        self._df = value
+        self._locations = None
+        self._invalidate_columns()
+
+    def _invalidate_columns(self):
+        self._columns = {}
+        self._names = None
+        self._ids = None
+        self._index = None
+        self._digest = None
+        self._distances = None
+
+    def _column(self, name: str, dtype: type, fill: float | int) -> np.ndarray:
+        if name not in self._columns:
+            self._columns[name] = self.df.get_column(name).fill_null(fill).to_numpy().astype(dtype, copy=False)
+        return self._columns[name]
+
+    @property
+    def latitudes(self) -> np.ndarray:
+        return self._column("lat", np.float64, np.nan)
+
+    @property
+    def longitudes(self) -> np.ndarray:
+        return self._column("long", np.float64, np.nan)
+
+    @property
+    def areas(self) -> np.ndarray:
+        return self._column("area", np.float64, -1.0)
+
+    @property
+    def populations(self) -> np.ndarray:
+        return self._column("population", np.int64, -1)
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        """(n, 2) array of latitude and longitude in degrees, ordered by location index."""
+        if "coordinates" not in self._columns:
+            self._columns["coordinates"] = np.column_stack((self.latitudes, self.longitudes))
+        return self._columns["coordinates"]
+
+    @property
+    def names(self) -> tuple[str, ...]:
+        if self._names is None:
+            self._names = tuple(intern(name) if name is not None else None for name in self.df.get_column("name").to_list())
+        return self._names
+
+    @property
+    def ids(self) -> tuple[str, ...]:
+        if self._ids is None:
+            self._ids = tuple(intern(lid) if lid is not None else None for lid in self.df.get_column("id").to_list())
+        return self._ids
+
+    def index_of(self, location_id: str) -> int:
+        """Returns the stable integer index of the location with the given id."""
+        if self._index is None:
+            self._index = {lid: index for index, lid in enumerate(self.ids)}
+        return self._index[location_id]
+
+    def location(self, index: int) -> Location:
+        return self.locations[index]
+
+    def digest(self) -> str:
+        """Hash of the location dataset, used to key caches derived from it."""
+        if self._digest is None:
+            self._digest = sha256(self.df.write_csv().encode()).hexdigest()
+        return self._digest
+
+    def distance_matrix(self) -> np.ndarray:
+        """
+        (n, n) matrix of geodesic distances in kilometers between all locations, indexed by location index.
+        The matrix is persisted in the cache directory, so it is only computed once per location dataset.
+        """
+        if self._distances is None:
+            path = cache_file("distances", self.digest(), ".npy")
+            if path.exists():
+                logger.info(f"Loading cached distances from {path.as_posix()}")
+                self._distances = np.load(path, mmap_mode="r")
+            else:
+                logger.info(f"Calculating distances between {len(self)} locations")
+                self._distances = pairwise_geodesic(self.latitudes, self.longitudes)
+                # Write to a temporary file first, so an interrupted run never leaves a truncated cache entry
+                temporary = path.with_suffix(".tmp")
+                with temporary.open("wb") as f:
+                    np.save(f, self._distances)
+                temporary.replace(path)
+        return self._distances
 
     def to_csv(self, filename: Path):
         self.df.write_csv(filename)
 
+    def to_parquet(self, filename: Path):
+        self.df.write_parquet(filename)
+
+    def to_ipc(self, filename: Path):
+        self.df.write_ipc(filename, compression="uncompressed")
+
+    def to_file(self, filename: Path):
+        """Writes the locations in the format given by the file extension."""
+        write_frame(self.df, filename)
+
     @staticmethod
     def from_csv(filename: Path) -> "LocationContainer":
         return LocationContainer(df=pl.read_csv(filename, schema=Location.LOCATION_SCHEMA))
+
+    @staticmethod
+    def from_parquet(filename: Path) -> "LocationContainer":
+        return LocationContainer(df=pl.read_parquet(filename).cast(Location.LOCATION_SCHEMA))
+
+    @staticmethod
+    def from_ipc(filename: Path) -> "LocationContainer":
+        return LocationContainer(df=pl.read_ipc(filename, memory_map=True).cast(Location.LOCATION_SCHEMA))
+
+    @staticmethod
+    def from_file(filename: Path) -> "LocationContainer":
+        """Reads locations in the format given by the file extension."""
+        container = LocationContainer(df=read_frame(filename, schema=Location.LOCATION_SCHEMA))
+        container.source = Path(filename)
+        return container
     
     def __len__(self):
-        if self._locations is not None:
-            return len(self.locations)
         if self._df is not None:
-            return self.df.height
+            return self._df.height
+        if self._locations is not None:
+            return len(self._locations)
         return 0
         
 class LocationLoader():
@@ -215,8 +387,8 @@ class LocationLoader():
         if isinstance(population, str):
             population = Path(population)
         # We read both the boundaries and the population data from their respective csv files
-        boundariesDf = pl.read_csv(boundaries, infer_schema_length=None)
-        populationDf = pl.read_csv(population, infer_schema_length=None)
+        boundariesDf = read_frame(boundaries, sidecar=False)
+        populationDf = read_frame(population, sidecar=False)
         # We have two maps, that provide us with the column names to be used
         bIndex, bName, bLat, bLong, bArea = boundaries_schema.get("index"), boundaries_schema.get("name"), boundaries_schema.get("lat"), boundaries_schema.get("long"), boundaries_schema.get("area")
         pIndex, pPopulation = population_schema.get("index"), population_schema.get("population")
@@ -227,8 +399,18 @@ class LocationLoader():
         # if there is no population entry for a administrative area, we throw an error
         # we join them on the index, which is (in our case) the LAD24CD number
         combinedDf = boundariesDf.join(populationDf, how="left", left_on=bIndex, right_on=pIndex)
-        
-        locations = []
-        for row in tqdm.tqdm(combinedDf.iter_rows(named=True), desc="Loading Locations", total=combinedDf.height, disable=silent):
-            locations.append(Location(row[bName], row[bIndex], row[bLat], row[bLong], row[bArea] / (1000000), row[pPopulation]))
-        return LocationContainer(locations)
+
+        # We select the columns straight into the location schema
+        df = combinedDf.select(
+            pl.col(bName).alias("name"),
+            pl.col(bIndex).alias("id"),
+            pl.col(bLat).alias("lat"),
+            pl.col(bLong).alias("long"),
+            pl.col(bArea).alias("area"),
+            pl.col(pPopulation).alias("population")
+        ).cast(Location.LOCATION_SCHEMA)
+        # The area is converted from m^2 to km^2, numpy divides exactly while polars multiplies with the reciprocal
+        df = df.with_columns(pl.Series("area", df.get_column("area").to_numpy() / 1_000_000))
+        if not silent:
+            logger.info(f"Loaded {df.height} locations")
+        return LocationContainer(df=df)
@@ -13,4 +13,12 @@ class ModelType(enum.StrEnum):
     TRIPLEEXPOWER = "TRIPLEEXPOWER"
     SPLIT = "SPLIT"
 
-Gravity = float
\ No newline at end of file
+Gravity = float
+
+# Binary model files start with this magic, followed by the format version (little endian uint32)
+MODEL_MAGIC = b"GRAVMDL\x00"
+MODEL_FORMAT_VERSION = 1
+# Arrays in binary model files start at multiples of this many bytes, so they can be memory-mapped directly
+MODEL_ALIGNMENT = 64
+# Parameter model files are json objects whose "format" key holds this value
+PARAMETER_MODEL_FORMAT = "GRAVMDL-PARAMETERS"
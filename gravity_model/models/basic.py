@@ -1,72 +1,232 @@
-from itertools import product
-from random import choices
+import os
+import json
+import struct
 from pathlib import Path
 
+import numpy as np
+from scipy import sparse
 from jsonpickle import encode
 
-from . import Gravity, ModelType
+from . import Gravity, ModelType, MODEL_MAGIC, MODEL_FORMAT_VERSION, MODEL_ALIGNMENT, PARAMETER_MODEL_FORMAT
 from ..location import LocationContainer
-from ..trip import Trip, TripContainer
+from ..trip import Trip, TripContainer, TripCounts
+from ..sampling import PairSampler, sorted_uniforms
+from ..training import get_distance_bins
 from ..search.random_search import RandomSearch
 from ..search.grid_search import GridSearch
 from ..search.genetic_search import GeneticSearch
 from ..search.nelder_mead import NelderMeadSearch
+from ..search.halving import SuccessiveHalving
 from ..log import logger
-from ..search import SearchType
+from ..search import SearchType, EvaluationType, DEFAULT_TRAINING_TRIPS
+
+# Attributes derived from the location table, models loaded from a parameter file only build them on first access
+LAZY_ATTRIBUTES = frozenset({
+    "locations", "origins", "destinations", "distances", "origin_populations", "destination_populations",
+    "distance_bins", "distance_order", "bin_indicator", "gravities", "log_scale", "total_gravity", "sampler",
+})
+
+# Upper bound for the memory of one chunk of parameter sets in expected_histograms, larger chunks gain
+# nothing once the gravity block no longer fits into the cache
+BATCH_MEMORY_BUDGET = 32 * 1024 * 1024
+# Blocks of the size of a (chunk × pairs) gravity block that exist at once while the kernel is evaluated
+BATCH_BLOCK_COPIES = 4
+
+def aligned(offset: int) -> int:
+    return -(-offset // MODEL_ALIGNMENT) * MODEL_ALIGNMENT
 
 class GravityModel():
 
+    TYPE = ModelType.BASIC
+    # Names of the attributes that parameterise the gravity function, in constructor order
+    PARAMETERS: tuple[str, ...] = ()
+
     def __init__(self, locations: LocationContainer, minimum_distance: int = 100):
-        self.matrix: dict[Trip, Gravity] = {}
         self.total_gravity: Gravity = 0.0
+        # Gravities of all pairs relative to the largest one, the absolute gravity is gravities * exp(log_scale)
+        self.gravities: np.ndarray = None
+        self.log_scale: float = 0.0
+        self._trips: list[Trip] = None
+        self._matrix: dict[Trip, Gravity] = None
+        self.sampler: PairSampler = None
+        self.rng = np.random.default_rng()
 
         self.chi = -1
         self.kss = -1
 
-        for loc_a, loc_b in product(locations.locations, repeat=2):
-            if loc_a == loc_b:
-                continue
-            trip = Trip(loc_a, loc_b)
-            if self.matrix.get(trip, None) is not None:
-                continue
-            if trip.distance < minimum_distance:
-                continue
-            self.matrix[trip] = 0
+        self.minimum_distance = minimum_distance
+        self._build(locations)
+
+    def _build(self, locations: LocationContainer):
+        self.locations = locations
+        minimum_distance = self.minimum_distance
+        # Every ordered pair of distinct locations that is at least minimum_distance km apart, in row-major order.
+        # The distance matrix is cached per location dataset, so the geodesic is only ever computed once.
+        distance_matrix = locations.distance_matrix()
+        lat, long, area = locations.latitudes, locations.longitudes, locations.areas
+        same_location = (lat[:, None] == lat[None, :]) & (long[:, None] == long[None, :]) & (area[:, None] == area[None, :])
+        origins, destinations = np.nonzero(~same_location & (distance_matrix >= minimum_distance))
+        self._set_pairs(origins, destinations, distance_matrix[origins, destinations])
         self.recreate_matrix()
 
-    def gravity(self, trip: Trip):
-        return (trip.locations[0].population * trip.locations[1].population) / trip.distance.kilometers
+    def _set_pairs(self, origins: np.ndarray, destinations: np.ndarray, distances: np.ndarray):
+        self.origins: np.ndarray = origins
+        self.destinations: np.ndarray = destinations
+        self.distances: np.ndarray = np.ascontiguousarray(distances, dtype=np.float64)
+        populations = self.locations.populations.astype(np.float64)
+        self.origin_populations: np.ndarray = populations[origins]
+        self.destination_populations: np.ndarray = populations[destinations]
+        # Histogram bin of every pair, so expected distributions are a single bincount
+        self.distance_bins: np.ndarray = get_distance_bins(self.distances)
+        self.distance_order: np.ndarray = np.argsort(self.distances, kind="stable")
+        # Sparse (pairs × bins) matrix with a one in the bin of every pair, so binning many gravity rows is one product
+        pairs = len(self.distances)
+        self.bin_indicator = sparse.csr_array(
+            (np.ones(pairs), (np.arange(pairs), self.distance_bins)),
+            shape=(pairs, int(self.distance_bins.max(initial=-1)) + 1),
+        )
+
+    def log_gravity(self, origin_population: np.ndarray, destination_population: np.ndarray, distance: np.ndarray) -> np.ndarray:
+        """Array kernel returning the natural logarithm of the gravity of every (pop_i, pop_j, d_ij) triple."""
+        return np.log(origin_population) + np.log(destination_population) - np.log(distance)
+
+    def gravity(self, trip: Trip) -> Gravity:
+        return float(np.exp(self.log_gravity(np.float64(trip.locations[0].population), np.float64(trip.locations[1].population), np.float64(trip.distance.kilometers))))
 
     def recreate_matrix(self):
-        self.total_gravity = 0
-        for trip in self.matrix.keys():
-            gravity = self.gravity(trip)
-            self.matrix[trip] = gravity
-            self.total_gravity += gravity
+        # Working in log space keeps the exponential families from under- or overflowing,
+        # the gravities are rescaled so that the largest one is 1 before leaving log space
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_gravity = self.log_gravity(self.origin_populations, self.destination_populations, self.distances)
+        # Missing (negative) populations produce NaN, those pairs are never chosen
+        log_gravity[np.isnan(log_gravity)] = -np.inf
+        maximum = log_gravity.max(initial=-np.inf)
+        self.log_scale = float(maximum) if np.isfinite(maximum) else 0.0
+        self.gravities = np.exp(log_gravity - self.log_scale)
+        self.total_gravity = float(self.gravities.sum())
+        self._matrix = None
+        self.sampler = PairSampler(self.gravities)
+
+    def batch_size(self, memory_budget: int = BATCH_MEMORY_BUDGET) -> int:
+        """Number of parameter sets that expected_histograms evaluates together within the memory budget."""
+        return max(1, memory_budget // (BATCH_BLOCK_COPIES * 8 * max(1, len(self.distances))))
 
-    def train(self, desired: TripContainer, parameters: dict[str, tuple[float, float]] = None, iterations: int = -1, accuracy: float = 0.1, metric: str = "chi", search_type: SearchType = SearchType.RANDOM, metric_map: Path = None):
+    def expected_histograms(self, parameters: list[dict[str, float]], memory_budget: int = BATCH_MEMORY_BUDGET) -> np.ndarray:
+        """
+        Returns the expected share of trips in every distance bin for each parameter set, as (sets × bins) array.
+        The log gravity kernel is evaluated with columns of parameter values, giving a (sets × pairs) gravity block
+        whose normalised rows are binned by a single product with the bin indicator. The model itself is not changed.
+        """
+        histograms = np.zeros((len(parameters), self.bin_indicator.shape[1]))
+        current = {name: getattr(self, name) for name in self.PARAMETERS}
+        size = self.batch_size(memory_budget)
+        try:
+            for start in range(0, len(parameters), size):
+                chunk = parameters[start:start + size]
+                for name in self.PARAMETERS:
+                    setattr(self, name, np.array([p[name] for p in chunk], dtype=np.float64)[:, None])
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    log_gravity = self.log_gravity(self.origin_populations, self.destination_populations, self.distances)
+                # Kernels that do not depend on any parameter return a single row
+                log_gravity = np.array(np.broadcast_to(log_gravity, (len(chunk), len(self.distances))))
+                # Same as recreate_matrix, row by row
+                log_gravity[np.isnan(log_gravity)] = -np.inf
+                maximum = log_gravity.max(axis=1, keepdims=True, initial=-np.inf)
+                maximum[~np.isfinite(maximum)] = 0.0
+                log_gravity -= maximum
+                gravities = np.exp(log_gravity, out=log_gravity)
+                gravities /= gravities.sum(axis=1, keepdims=True)
+                histograms[start:start + len(chunk)] = gravities @ self.bin_indicator
+        finally:
+            for name, value in current.items():
+                setattr(self, name, value)
+        return histograms
+
+    @property
+    def matrix(self) -> dict[Trip, Gravity]:
+        if self._matrix is None:
+            self._matrix = dict(zip(self.all_trips, self.gravities.tolist()))
+        return self._matrix
+
+    def _restore_matrix(self, matrix_tuples: list[tuple[Trip, Gravity]]):
+        self._trips = [trip for trip, _ in matrix_tuples]
+        self.gravities = np.array([gravity for _, gravity in matrix_tuples], dtype=np.float64)
+        self.log_scale = 0.0
+        self._matrix = None
+        self.sampler = PairSampler(self.gravities)
+        self.rng = np.random.default_rng()
+
+    def train(self, desired: TripContainer, parameters: dict[str, tuple[float, float]] = None, iterations: int = -1, accuracy: float = 0.1, metric: str = "chi", search_type: SearchType = SearchType.RANDOM, metric_map: Path = None, evaluation: EvaluationType = EvaluationType.SAMPLED, workers: int = 1, seed: int = None, training_trips: int = DEFAULT_TRAINING_TRIPS, screening_trips: int = None):
         if parameters is None:
             parameters = {}
+        # Successive halving screens the candidates of the grid, random and genetic searches on screening_trips first
+        halving = SuccessiveHalving(screening_trips) if screening_trips is not None else None
         if search_type is SearchType.GRID:
-            search = GridSearch(self, desired, parameters, metric_map)
+            search = GridSearch(self, desired, parameters, metric_map, evaluation=evaluation, workers=workers, seed=seed, training_trips=training_trips, halving=halving)
         elif search_type is SearchType.GENETIC:
             population_size = max(20, min(30, (iterations + 200) // 20))
-            search = GeneticSearch(self, desired, parameters, population_size=population_size, csv_path=metric_map)
+            search = GeneticSearch(self, desired, parameters, population_size=population_size, csv_path=metric_map, evaluation=evaluation, workers=workers, seed=seed, training_trips=training_trips, halving=halving)
         elif search_type is SearchType.NELDER_MEAD:
-            search = NelderMeadSearch(self, desired, parameters, metric_map)
+            search = NelderMeadSearch(self, desired, parameters, metric_map, evaluation=evaluation, seed=seed, training_trips=training_trips)
         else:
-            search = RandomSearch(self, desired, parameters, metric_map)
+            search = RandomSearch(self, desired, parameters, metric_map, evaluation=evaluation, workers=workers, seed=seed, training_trips=training_trips, halving=halving)
         search.train(iterations, accuracy, metric)
         search.apply()
 
     @property
-    def all_trips(self):
-        return list(self.matrix.keys())
+    def all_trips(self) -> list[Trip]:
+        if self._trips is None:
+            location = self.locations.location
+            self._trips = [
+                Trip(location(origin), location(destination), kilometers)
+                for origin, destination, kilometers in zip(self.origins.tolist(), self.destinations.tolist(), self.distances.tolist())
+            ]
+        return self._trips
+
+    def sample_pairs(self, n: int) -> np.ndarray:
+        """Draws n pair indices (into origins, destinations, distances and gravities) proportional to their gravity."""
+        return self.sampler.sample(n, self.rng)
 
     def make_trips(self, n: int) -> TripContainer:
         logger.info(f"Generating {n} trips...")
-        return TripContainer(choices(list(self.matrix.keys()), weights=list(self.matrix.values()), k=n))
+        indices = self.sample_pairs(n)
+        if getattr(self, "locations", None) is None:
+            # Models restored from a matrix of Trips do not know their location table
+            trips = self.all_trips
+            return TripContainer([trips[index] for index in indices.tolist()])
+        return TripContainer.from_pairs(self.locations, self.origins[indices], self.destinations[indices], self.distances[indices])
     
+    def make_trip_counts(self, n: int, rng: np.random.Generator = None) -> TripCounts:
+        """
+        Draws n trips as a single multinomial over the normalised gravities, returning only the count per pair.
+        A generator can be passed in to make the draw reproducible, otherwise the model's own one is used.
+        """
+        logger.info(f"Generating {n} trip counts...")
+        if rng is None:
+            rng = self.rng
+        if n < len(self.gravities):
+            # The multinomial costs a draw per pair, for small samples it is cheaper to spread sorted uniforms over the pairs
+            counts = self.sampler.counts(sorted_uniforms(n, rng))
+        else:
+            counts = rng.multinomial(n, self.gravities / self.total_gravity)
+        return TripCounts(self.locations, self.origins, self.destinations, self.distances, counts, self.distance_bins)
+
+    def common_trip_counts(self, uniforms: np.ndarray) -> TripCounts:
+        """
+        Draws trips with the given sorted block of uniforms instead of fresh random numbers, so the counts of two
+        parameter sets drawn with the same block only differ because their gravities do.
+        """
+        # The uniforms are spent on the pairs in order of their distance, so a small change of the gravities only
+        # moves trips between pairs of similar distance instead of reshuffling the whole histogram
+        order = self.distance_order
+        counts = np.empty(len(order), dtype=np.int64)
+        counts[order] = PairSampler(self.gravities[order]).counts(uniforms)
+        return TripCounts(self.locations, self.origins, self.destinations, self.distances, counts, self.distance_bins)
+
+    def expected_trip_counts(self) -> TripCounts:
+        """Returns the exact expected share of trips of every pair, i.e. the normalised gravities."""
+        return TripCounts(self.locations, self.origins, self.destinations, self.distances, self.gravities / self.total_gravity, self.distance_bins)
+
     def matrix_as_tuples(self) -> list[tuple[Trip, Gravity]]:
         tuples = []
         for key, value in self.matrix.items():
@@ -84,19 +244,150 @@ class GravityModel():
     def __setstate__(self, state: dict):
         if state.get("type", None) is None or state.get("type") is not ModelType.BASIC:
             raise ValueError(f"Type needs to be {ModelType.BASIC.__str__()}")
-        matrix_tuples = state.get("matrix")
-        self.matrix = {}
-        for key, value in matrix_tuples:
-            self.matrix[key] = value
+        self._restore_matrix(state.get("matrix"))
         self.total_gravity = state.get("total")
 
+    @property
+    def parameters(self) -> dict[str, float]:
+        return {name: float(getattr(self, name)) for name in self.PARAMETERS}
+
     def to_json(self, filename: Path):
         json = encode(self)
         with filename.open("w") as f:
             f.write(json)
 
+    def to_binary(self, filename: Path):
+        """
+        Writes the model in the binary model format: the magic, the format version and the length of a json header
+        (type, parameters and the location table), followed by the pair arrays, each aligned so it can be memory-mapped.
+        """
+        if getattr(self, "locations", None) is None:
+            raise ValueError("Only models that know their location table can be stored in the binary format!")
+        arrays = {
+            "origins": np.ascontiguousarray(self.origins, dtype="<i4"),
+            "destinations": np.ascontiguousarray(self.destinations, dtype="<i4"),
+            "distances": np.ascontiguousarray(self.distances, dtype="<f8"),
+            "gravities": np.ascontiguousarray(self.gravities, dtype="<f8"),
+        }
+        offset = 0
+        layout = {}
+        for name, array in arrays.items():
+            layout[name] = {"dtype": array.dtype.str, "offset": offset}
+            offset = aligned(offset + array.nbytes)
+        header = json.dumps({
+            "type": str(self.TYPE),
+            "parameters": self.parameters,
+            "minimum_distance": self.minimum_distance,
+            "total": self.total_gravity,
+            "log_scale": self.log_scale,
+            "pairs": len(self.gravities),
+            "arrays": layout,
+            "locations": self.locations.df.to_dict(as_series=False),
+        }).encode()
+        preamble = MODEL_MAGIC + struct.pack("<IQ", MODEL_FORMAT_VERSION, len(header)) + header
+        start = aligned(len(preamble))
+        with filename.open("wb") as f:
+            f.write(preamble)
+            for name, array in arrays.items():
+                f.write(b"\0" * (start + layout[name]["offset"] - f.tell()))
+                f.write(array.tobytes())
+
+    @classmethod
+    def from_arrays(cls, locations: LocationContainer, parameters: dict[str, float], minimum_distance: int, origins: np.ndarray, destinations: np.ndarray, distances: np.ndarray, gravities: np.ndarray, log_scale: float = 0.0) -> "GravityModel":
+        """Restores a model from its pair arrays without recomputing the distance matrix or the gravities."""
+        model = cls.__new__(cls)
+        for name in cls.PARAMETERS:
+            setattr(model, name, parameters[name])
+        model._trips = None
+        model._matrix = None
+        model.rng = np.random.default_rng()
+        model.chi = -1
+        model.kss = -1
+        model.locations = locations
+        model.minimum_distance = minimum_distance
+        model._set_pairs(origins, destinations, distances)
+        model.gravities = gravities
+        model.log_scale = log_scale
+        model.total_gravity = float(gravities.sum())
+        model.sampler = PairSampler(gravities)
+        return model
+
+    def to_parameters(self, filename: Path):
+        """
+        Writes only the model type, its parameters and a reference to the location dataset (path and digest).
+        The gravities are rebuilt from the locations when the model is loaded and first used.
+        """
+        source = self.locations.source
+        if source is None:
+            raise ValueError("Parameter model files need a location dataset that was read from a file!")
+        header = {
+            "format": PARAMETER_MODEL_FORMAT,
+            "version": MODEL_FORMAT_VERSION,
+            "type": str(self.TYPE),
+            "parameters": self.parameters,
+            "minimum_distance": self.minimum_distance,
+            "locations": {
+                # Relative to the model file, so models and locations can be moved together
+                "path": Path(os.path.relpath(source.resolve(), filename.resolve().parent)).as_posix(),
+                "digest": self.locations.digest(),
+            },
+        }
+        with filename.open("w") as f:
+            json.dump(header, f, indent=4)
+
+    @classmethod
+    def from_parameters(cls, parameters: dict[str, float], minimum_distance: int, locations: Path | LocationContainer, digest: str) -> "GravityModel":
+        """
+        Creates a model without building its pairs or gravities. They are built from the location dataset on the
+        first access of any attribute derived from it, e.g. by make_trips.
+        """
+        model = cls.__new__(cls)
+        for name in cls.PARAMETERS:
+            setattr(model, name, parameters[name])
+        model._trips = None
+        model._matrix = None
+        model.rng = np.random.default_rng()
+        model.chi = -1
+        model.kss = -1
+        model.minimum_distance = minimum_distance
+        model._source = (locations, digest)
+        return model
+
+    def _materialize(self):
+        source, digest = self._source
+        if isinstance(source, LocationContainer):
+            locations = source
+        else:
+            logger.info(f"Loading location data for the model from {Path(source).as_posix()}")
+            locations = LocationContainer.from_file(source)
+        if locations.digest() != digest:
+            origin = "The given location dataset" if isinstance(source, LocationContainer) else f"The location dataset {Path(source).as_posix()}"
+            raise ValueError(f"{origin} does not match the one the {self.TYPE} model was trained on, so the model cannot be built! (expected digest {digest}, got {locations.digest()})")
+        # The source is only dropped once it is known to be valid, a failed attempt can be retried
+        del self._source
+        self._build(locations)
+
+    def __getattr__(self, name: str):
+        # Only called when normal lookup fails, i.e. for derived attributes of a model that has not been built yet
+        if name not in LAZY_ATTRIBUTES or "_source" not in self.__dict__:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        self._materialize()
+        return getattr(self, name)
+
+    def to_file(self, filename: Path, parameters_only: bool = False):
+        """
+        Stores only the parameters if requested, otherwise as jsonpickle if the filename ends in .json and in the
+        binary model format for any other filename.
+        """
+        if parameters_only:
+            self.to_parameters(filename)
+        elif filename.suffix.lower() == ".json":
+            self.to_json(filename)
+        else:
+            self.to_binary(filename)
+
     def __len__(self):
-        return len(self.matrix)
+        return len(self.gravities)
 
     def __repr__(self):
         return f"GravityModel(total={self.total_gravity},matrix={self.matrix})"
\ No newline at end of file
@@ -1,11 +1,15 @@
+import numpy as np
+
 from . import ModelType
 from .power import PowerGravityModel
-from ..trip import Trip
 
 class DoublePowerGravityModel(PowerGravityModel):
 
-    def gravity(self, trip: Trip):
-        return ((trip.locations[0].population ** self.beta) * (trip.locations[1].population ** self.beta)) / (trip.distance.kilometers ** self.alpha)
+    TYPE = ModelType.DOUBLEPOWER
+    PARAMETERS = ("alpha", "beta")
+
+    def log_gravity(self, origin_population, destination_population, distance):
+        return self.beta * (np.log(origin_population) + np.log(destination_population)) - self.alpha * np.log(distance)
 
     def __init__(self, locations, alpha: float = 1.0, beta: float = 1.0, minimum_distance: int = 100):
         self.beta = beta
@@ -25,10 +29,7 @@ class DoublePowerGravityModel(PowerGravityModel):
     def __setstate__(self, state: dict):
         if state.get("type", None) is None or state.get("type") is not ModelType.POWER:
             raise ValueError(f"Type needs to be {ModelType.BASIC.__str__()}")
-        matrix_tuples = state.get("matrix")
-        self.matrix = {}
-        for key, value in matrix_tuples:
-            self.matrix[key] = value
+        self._restore_matrix(state.get("matrix"))
         self.alpha = state.get("alpha")
         self.beta = state.get("beta")
         self.total_gravity = state.get("total")
\ No newline at end of file
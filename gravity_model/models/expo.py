@@ -1,17 +1,15 @@
+import numpy as np
+
 from . import ModelType
 from .basic import GravityModel
 
-from ..trip import Trip
-
-from sys import float_info
-
-from math import exp
-
 class ExponentialGravityModel(GravityModel):
 
-    def gravity(self, trip: Trip):
-        denominator = exp(-self.alpha * trip.distance.kilometers)
-        return (trip.locations[0].population * trip.locations[1].population) * max(denominator, float_info.min)
+    TYPE = ModelType.EXPO
+    PARAMETERS = ("alpha",)
+
+    def log_gravity(self, origin_population, destination_population, distance):
+        return np.log(origin_population) + np.log(destination_population) - self.alpha * distance
 
     def __init__(self, locations, alpha: float = 1.0, minimum_distance: int = 100):
         self.alpha = alpha
@@ -30,9 +28,6 @@ class ExponentialGravityModel(GravityModel):
     def __setstate__(self, state: dict):
         if state.get("type", None) is None or state.get("type") is not ModelType.POWER:
             raise ValueError(f"Type needs to be {ModelType.BASIC.__str__()}")
-        matrix_tuples = state.get("matrix")
-        self.matrix = {}
-        for key, value in matrix_tuples:
-            self.matrix[key] = value
+        self._restore_matrix(state.get("matrix"))
         self.alpha = state.get("alpha")
         self.total_gravity = state.get("total")
\ No newline at end of file
@@ -1,16 +1,15 @@
+import numpy as np
+
 from . import ModelType
 from .basic import GravityModel
-from ..trip import Trip
-
-from sys import float_info
-
-from math import exp
 
 class ExponentialPowerGravityModel(GravityModel):
 
-    def gravity(self, trip: Trip):
-        denominator = (1 / (trip.distance.kilometers ** self.alpha)) * max(exp(-self.beta * trip.distance.kilometers), float_info.min)
-        return (trip.locations[0].population * trip.locations[1].population) * denominator
+    TYPE = ModelType.EXPOWER
+    PARAMETERS = ("alpha", "beta")
+
+    def log_gravity(self, origin_population, destination_population, distance):
+        return np.log(origin_population) + np.log(destination_population) - self.alpha * np.log(distance) - self.beta * distance
 
     def __init__(self, locations, alpha: float = 1.0, beta: float = 0.1, minimum_distance: int = 100):
         self.alpha = alpha
@@ -31,10 +30,7 @@ class ExponentialPowerGravityModel(GravityModel):
     def __setstate__(self, state: dict):
         if state.get("type", None) is None or state.get("type") is not ModelType.POWER:
             raise ValueError(f"Type needs to be {ModelType.BASIC.__str__()}")
-        matrix_tuples = state.get("matrix")
-        self.matrix = {}
-        for key, value in matrix_tuples:
-            self.matrix[key] = value
+        self._restore_matrix(state.get("matrix"))
         self.alpha = state.get("alpha")
         self.beta = state.get("beta")
         self.total_gravity = state.get("total")
\ No newline at end of file
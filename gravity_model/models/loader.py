@@ -1,15 +1,103 @@
+import json
+import struct
 from pathlib import Path
-from jsonpickle import decode
 
-from .basic import GravityModel
+import numpy as np
+import polars as pl
+from jsonpickle import Unpickler
+
+from . import ModelType, MODEL_MAGIC, MODEL_FORMAT_VERSION, PARAMETER_MODEL_FORMAT
+from .basic import GravityModel, aligned
 from .power import PowerGravityModel
 from .doublepower import DoublePowerGravityModel
 from .triplepower import TriplePowerGravityModel
+from .expo import ExponentialGravityModel
+from .doubleexpo import DoubleExponentialGravityModel
+from .tripleexpo import TripleExponentialGravityModel
+from .expower import ExponentialPowerGravityModel
+from .split import SplitGravityModel
+from ..location import Location, LocationContainer
+from ..log import logger
 
-def model_from_json(filename: Path) -> GravityModel | PowerGravityModel | DoublePowerGravityModel | TriplePowerGravityModel:
-    with filename.open("r") as f:
-        json = f.read()
-    model = decode(json)
+MODELS: dict[ModelType, type[GravityModel]] = {
+    model.TYPE: model for model in (
+        GravityModel,
+        PowerGravityModel,
+        DoublePowerGravityModel,
+        TriplePowerGravityModel,
+        ExponentialGravityModel,
+        DoubleExponentialGravityModel,
+        TripleExponentialGravityModel,
+        ExponentialPowerGravityModel,
+        SplitGravityModel,
+    )
+}
+
+def model_from_json(filename: Path, document = None) -> GravityModel | PowerGravityModel | DoublePowerGravityModel | TriplePowerGravityModel:
+    """Reads a model written by GravityModel.to_json, the already parsed json document of the file can be passed in."""
+    if document is None:
+        with filename.open("r") as f:
+            document = json.load(f)
+    model = Unpickler().restore(document)
     if not isinstance(model, (GravityModel, PowerGravityModel, DoublePowerGravityModel, TriplePowerGravityModel)):
         raise ValueError(f"{filename.as_posix()} does not contain a recognized model! ({type(model)})")
-    return model
\ No newline at end of file
+    return model
+
+def model_from_binary(filename: Path) -> GravityModel:
+    """Reads a model written by GravityModel.to_binary, the pair arrays are memory-mapped instead of read."""
+    with filename.open("rb") as f:
+        if f.read(len(MODEL_MAGIC)) != MODEL_MAGIC:
+            raise ValueError(f"{filename.as_posix()} is not a binary model file!")
+        version, header_length = struct.unpack("<IQ", f.read(struct.calcsize("<IQ")))
+        if version > MODEL_FORMAT_VERSION:
+            raise ValueError(f"{filename.as_posix()} uses model format version {version}, but only versions up to {MODEL_FORMAT_VERSION} are supported!")
+        header = json.loads(f.read(header_length))
+    start = aligned(len(MODEL_MAGIC) + struct.calcsize("<IQ") + header_length)
+    arrays = {
+        name: np.memmap(filename, dtype=np.dtype(layout["dtype"]), mode="r", offset=start + layout["offset"], shape=(header["pairs"],))
+        for name, layout in header["arrays"].items()
+    }
+    model_type = ModelType(header["type"])
+    if model_type not in MODELS:
+        raise ValueError(f"{filename.as_posix()} contains an unknown model type! ({model_type})")
+    locations = LocationContainer(df=pl.DataFrame(header["locations"], schema=Location.LOCATION_SCHEMA))
+    logger.debug(f"Memory-mapped {header['pairs']} pairs of a {model_type} model from {filename.as_posix()}")
+    return MODELS[model_type].from_arrays(
+        locations, header["parameters"], header["minimum_distance"],
+        arrays["origins"], arrays["destinations"], arrays["distances"], arrays["gravities"], header["log_scale"]
+    )
+
+def model_from_parameters(filename: Path, locations: LocationContainer = None) -> GravityModel:
+    """
+    Reads a model written by GravityModel.to_parameters. The model is not built until it is first used, so listing
+    the type and parameters of many models is cheap. The referenced location dataset can be replaced by a loaded one.
+    """
+    with filename.open("r") as f:
+        header = json.load(f)
+    if header.get("format") != PARAMETER_MODEL_FORMAT:
+        raise ValueError(f"{filename.as_posix()} is not a parameter model file!")
+    if header["version"] > MODEL_FORMAT_VERSION:
+        raise ValueError(f"{filename.as_posix()} uses model format version {header['version']}, but only versions up to {MODEL_FORMAT_VERSION} are supported!")
+    model_type = ModelType(header["type"])
+    if model_type not in MODELS:
+        raise ValueError(f"{filename.as_posix()} contains an unknown model type! ({model_type})")
+    if locations is None:
+        locations = filename.parent.joinpath(header["locations"]["path"])
+    return MODELS[model_type].from_parameters(header["parameters"], header["minimum_distance"], locations, header["locations"]["digest"])
+
+def load_model(filename: Path) -> GravityModel:
+    """
+    Loads a model in the binary, parameter or jsonpickle format. Binary models start with the model magic, the other
+    formats are json documents and parameter models are told apart by their format field.
+    """
+    with filename.open("rb") as f:
+        if f.read(len(MODEL_MAGIC)) == MODEL_MAGIC:
+            return model_from_binary(filename)
+    with filename.open("r") as f:
+        try:
+            document = json.load(f)
+        except json.JSONDecodeError as error:
+            raise ValueError(f"{filename.as_posix()} is neither a binary nor a json model file!") from error
+    if isinstance(document, dict) and document.get("format") == PARAMETER_MODEL_FORMAT:
+        return model_from_parameters(filename)
+    return model_from_json(filename, document)
@@ -1,11 +1,15 @@
+import numpy as np
+
 from . import ModelType
 from .basic import GravityModel
-from ..trip import Trip
 
 class PowerGravityModel(GravityModel):
 
-    def gravity(self, trip: Trip):
-        return (trip.locations[0].population * trip.locations[1].population) / (trip.distance.kilometers ** self.alpha)
+    TYPE = ModelType.POWER
+    PARAMETERS = ("alpha",)
+
+    def log_gravity(self, origin_population, destination_population, distance):
+        return np.log(origin_population) + np.log(destination_population) - self.alpha * np.log(distance)
 
     def __init__(self, locations, alpha: float = 1.0, minimum_distance: int = 100):
         self.alpha = alpha
@@ -24,9 +28,6 @@ class PowerGravityModel(GravityModel):
     def __setstate__(self, state: dict):
         if state.get("type", None) is None or state.get("type") is not ModelType.POWER:
             raise ValueError(f"Type needs to be {ModelType.BASIC.__str__()}")
-        matrix_tuples = state.get("matrix")
-        self.matrix = {}
-        for key, value in matrix_tuples:
-            self.matrix[key] = value
+        self._restore_matrix(state.get("matrix"))
         self.alpha = state.get("alpha")
         self.total_gravity = state.get("total")
\ No newline at end of file
@@ -1,14 +1,16 @@
+import numpy as np
+
 from . import ModelType
 from .basic import GravityModel
-from ..trip import Trip
 
 class SplitGravityModel(GravityModel):
 
-    def gravity(self, trip: Trip):
-        if trip.distance.kilometers < self.gamma:
-            return (trip.locations[0].population * trip.locations[1].population) / (trip.distance.kilometers ** self.alpha)
-        else:
-            return (trip.locations[0].population * trip.locations[1].population) / (trip.distance.kilometers ** self.beta)
+    TYPE = ModelType.SPLIT
+    PARAMETERS = ("alpha", "beta", "gamma")
+
+    def log_gravity(self, origin_population, destination_population, distance):
+        exponent = np.where(distance < self.gamma, self.alpha, self.beta)
+        return np.log(origin_population) + np.log(destination_population) - exponent * np.log(distance)
 
     def __init__(self, locations, alpha: float = 1.0, beta: float = 1.0, gamma: int = 600, minimum_distance: int = 100):
         self.alpha = alpha
@@ -31,10 +33,7 @@ class SplitGravityModel(GravityModel):
     def __setstate__(self, state: dict):
         if state.get("type", None) is None or state.get("type") is not ModelType.POWER:
             raise ValueError(f"Type needs to be {ModelType.BASIC.__str__()}")
-        matrix_tuples = state.get("matrix")
-        self.matrix = {}
-        for key, value in matrix_tuples:
-            self.matrix[key] = value
+        self._restore_matrix(state.get("matrix"))
         self.alpha = state.get("alpha")
         self.beta = state.get("beta")
         self.gamma = state.get("gamma")
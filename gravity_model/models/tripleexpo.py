@@ -1,15 +1,15 @@
-from math import exp
-from sys import float_info
+import numpy as np
+
 from . import ModelType
 from .doubleexpo import DoubleExponentialGravityModel
-from ..trip import Trip
 
 class TripleExponentialGravityModel(DoubleExponentialGravityModel):
 
-    def gravity(self, trip: Trip):
-        numerator = exp(self.beta * trip.locations[0].population) * exp(self.gamma * trip.locations[1].population)
-        denominator = exp(-self.alpha * trip.distance.kilometers)
-        return max(numerator, float_info.min) * max(denominator, float_info.min)
+    TYPE = ModelType.TRIPLEEXPO
+    PARAMETERS = ("alpha", "beta", "gamma")
+
+    def log_gravity(self, origin_population, destination_population, distance):
+        return self.beta * origin_population + self.gamma * destination_population - self.alpha * distance
 
     def __init__(self, locations, alpha: float = 1.0, beta: float = 1.0, gamma: float = 1.0, minimum_distance: int = 100):
         self.gamma = gamma
@@ -30,10 +30,7 @@ class TripleExponentialGravityModel(DoubleExponentialGravityModel):
     def __setstate__(self, state: dict):
         if state.get("type", None) is None or state.get("type") is not ModelType.POWER:
             raise ValueError(f"Type needs to be {ModelType.BASIC.__str__()}")
-        matrix_tuples = state.get("matrix")
-        self.matrix = {}
-        for key, value in matrix_tuples:
-            self.matrix[key] = value
+        self._restore_matrix(state.get("matrix"))
         self.alpha = state.get("alpha")
         self.beta = state.get("beta")
         self.gamma = state.get("gamma")
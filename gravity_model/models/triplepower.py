@@ -1,11 +1,15 @@
+import numpy as np
+
 from . import ModelType
 from .doublepower import DoublePowerGravityModel
-from ..trip import Trip
 
 class TriplePowerGravityModel(DoublePowerGravityModel):
 
-    def gravity(self, trip: Trip):
-        return ((trip.locations[0].population ** self.beta) * (trip.locations[1].population ** self.gamma)) / (trip.distance.kilometers ** self.alpha)
+    TYPE = ModelType.TRIPLEPOWER
+    PARAMETERS = ("alpha", "beta", "gamma")
+
+    def log_gravity(self, origin_population, destination_population, distance):
+        return self.beta * np.log(origin_population) + self.gamma * np.log(destination_population) - self.alpha * np.log(distance)
 
     def __init__(self, locations, alpha: float = 1.0, beta: float = 1.0, gamma: float = 1.0, minimum_distance: int = 100):
         self.gamma = gamma
@@ -26,10 +30,7 @@ class TriplePowerGravityModel(DoublePowerGravityModel):
     def __setstate__(self, state: dict):
         if state.get("type", None) is None or state.get("type") is not ModelType.POWER:
             raise ValueError(f"Type needs to be {ModelType.BASIC.__str__()}")
-        matrix_tuples = state.get("matrix")
-        self.matrix = {}
-        for key, value in matrix_tuples:
-            self.matrix[key] = value
+        self._restore_matrix(state.get("matrix"))
         self.alpha = state.get("alpha")
         self.beta = state.get("beta")
         self.gamma = state.get("gamma")
@@ -0,0 +1,48 @@
+import numpy as np
+
+def sorted_uniforms(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Draws n sorted uniform random numbers in linear time, as normalised cumulative sums of exponential spacings."""
+    spacings = np.cumsum(rng.standard_exponential(n + 1))
+    return spacings[:-1] / spacings[-1]
+
+def common_uniforms(seed: int, n: int) -> np.ndarray:
+    """A sorted block of n uniform random numbers that is the same for every call with the same seed."""
+    return np.sort(np.random.default_rng([seed, n]).random(n))
+
+class PairSampler():
+    """
+    Draws indices proportional to a fixed weight vector.
+
+    The normalised cumulative distribution is computed once, every draw afterwards is a single vectorised
+    searchsorted over uniform random numbers.
+    """
+
+    def __init__(self, weights: np.ndarray):
+        cdf = np.cumsum(weights, dtype=np.float64)
+        if len(cdf) == 0 or not cdf[-1] > 0:
+            raise ValueError("PairSampler needs at least one positive weight!")
+        self.cdf: np.ndarray = cdf / cdf[-1]
+
+    def sample(self, n: int, rng: np.random.Generator = None) -> np.ndarray:
+        if rng is None:
+            rng = np.random.default_rng()
+        indices = np.searchsorted(self.cdf, rng.random(n), side="right")
+        # Guards against the last cumulative value being rounded just below 1
+        return np.minimum(indices, len(self.cdf) - 1)
+
+    def counts(self, uniforms: np.ndarray) -> np.ndarray:
+        """
+        Returns how many of the given sorted uniforms every index receives, i.e. the counts sample would produce
+        for them. Costs a single searchsorted between the cumulative distribution and the uniforms.
+        """
+        if len(uniforms) < len(self.cdf):
+            # Searching the fewer sorted values is cheaper, the result is the same
+            indices = np.minimum(np.searchsorted(self.cdf, uniforms, side="right"), len(self.cdf) - 1)
+            return np.bincount(indices, minlength=len(self.cdf))
+        bounds = np.searchsorted(uniforms, self.cdf, side="left")
+        # Like in sample, uniforms above a last cumulative value that was rounded below 1 go to the last index
+        bounds[-1] = len(uniforms)
+        return np.diff(bounds, prepend=0)
+
+    def __len__(self):
+        return len(self.cdf)
@@ -6,6 +6,14 @@ class SearchType(enum.StrEnum):
     GENETIC = "GENETIC"
     NELDER_MEAD = "NELDER_MEAD"
 
+class EvaluationType(enum.StrEnum):
+    # Estimate the model's distance distribution from a sample of trips
+    SAMPLED = "SAMPLED"
+    # Calculate the model's exact expected distance distribution from the normalised gravities
+    EXPECTED = "EXPECTED"
+    # Sample trips from the model with one fixed block of uniforms per search, shared by all parameter sets
+    COMMON = "COMMON"
+
 DEFAULT_TRAINING_TRIPS = 5_000_000
 
 POWER_LAW_TUPLE = (0.1, 2.0, 1.0)
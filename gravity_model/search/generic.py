@@ -1,16 +1,56 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import as_completed
 from pathlib import Path
 
+import numpy as np
 import polars as pl
 
-from ..training import Parameter
-from ..trip import TripContainer
+from ..training import Parameter, Distribution
+from ..trip import TripContainer, TripCounts
+from . import EvaluationType, DEFAULT_TRAINING_TRIPS
+from .parallel import ParallelEvaluator, evaluate_model
+from .halving import SuccessiveHalving
+from ..sampling import common_uniforms
+from ..log import logger
+
+def read_parameter_map(path: Path, columns: list[str]) -> pl.DataFrame:
+    """
+    Reads the given parameter and metric columns of a parameter map written by a search. If the map has a trips column,
+    only the rows evaluated with the full sample size are kept, screening rows were estimated from smaller samples.
+    """
+    columns = list(columns)
+    header = pl.read_csv(path, n_rows=0).columns
+    schema = {col: pl.Float64 for col in columns}
+    if "trips" not in header:
+        return pl.read_csv(path, columns=columns, schema_overrides=schema).select(columns)
+    parameter_map = pl.read_csv(path, columns=[*columns, "trips"], schema_overrides={**schema, "trips": pl.Int64})
+    # Exact evaluations have no sample size, they are always kept
+    full_size = parameter_map.get_column("trips").max()
+    return parameter_map.filter(pl.col("trips").is_null() | (pl.col("trips") == full_size)).select(columns)
 
 class GenericSearch(ABC):
 
-    def __init__(self, model, desired: TripContainer, parameters: dict[str, tuple[float, float, float]], csv_path: Path | None = None):
+    def __init__(self, model, desired: TripContainer, parameters: dict[str, tuple[float, float, float]], csv_path: Path | None = None, evaluation: EvaluationType = EvaluationType.SAMPLED, workers: int = 1, seed: int = None, training_trips: int = DEFAULT_TRAINING_TRIPS, halving: SuccessiveHalving = None):
         self.model = model
         self.real_data = desired
+        # The desired trips never change during a search, so their distribution is only calculated once
+        self.target = Distribution(desired)
+        self.evaluation = evaluation
+        # Number of processes evaluating parameter sets, searches that support it evaluate in parallel if > 1
+        self.workers = max(1, workers)
+        if self.batched and self.workers > 1:
+            logger.info("Exact evaluations are batched in a single process, the workers are not used")
+        # Every parameter set is sampled with a seed derived from this one, so its metrics do not depend on
+        # the order or the process in which it is evaluated
+        self.seed: int = seed if seed is not None else int(np.random.SeedSequence().entropy)
+        logger.info(f"Search seed: {self.seed}")
+        # Number of trips sampled per evaluation, the genetic and Nelder-Mead searches cap it at the number of desired trips
+        self.sample_size = training_trips
+        self._uniforms: dict[int, np.ndarray] = {}
+        # Searches that evaluate many candidates at once screen them on smaller samples first, if set
+        self.halving = halving
+        if self.halving is not None and self.batched:
+            logger.info("Exact evaluations do not depend on a sample size, candidates are not screened")
         self.parameters: dict[str, Parameter] = {}
         self.metrics: dict[str, float] = { "chi" : None, "kss": None }
         for name, value in parameters.items():
@@ -23,27 +63,170 @@ class GenericSearch(ABC):
             self._df = pl.DataFrame(
                 {col: pl.Series(name=col, values=[], dtype=pl.Float64) for col in cols}
             )
+            # Number of trips the metrics were estimated from, screened candidates are recorded with smaller samples
+            self._df = self._df.with_columns(pl.Series(name="trips", values=[], dtype=pl.Int64))
 
     @abstractmethod
     def train(self, iterations: int = 100, accuracy: float = -1.0, metric: str = "chi"):
         pass
 
+    def evaluate(self, n: int, seed: np.random.SeedSequence = None) -> tuple[float, float]:
+        """
+        Compares the distance distribution of the model in its current state with the desired trips.
+        Depending on the evaluation type the model distribution is estimated from n sampled trips or calculated exactly.
+        """
+        return evaluate_model(self.model, self.target, self.evaluation, n, None if seed is None else np.random.default_rng(seed), self.uniforms(n))
+
+    def uniforms(self, n: int) -> np.ndarray | None:
+        """
+        The block of n sorted uniforms that every parameter set is sampled with in the COMMON evaluation, generated
+        once per search from its seed. Differences between parameter sets are then not blurred by sampling noise.
+        """
+        if self.evaluation is not EvaluationType.COMMON:
+            return None
+        if n not in self._uniforms:
+            self._uniforms[n] = common_uniforms(self.seed, n)
+        return self._uniforms[n]
+
+    def uniform_blocks(self, n: int) -> dict[int, np.ndarray] | None:
+        """The blocks of uniforms for all sample sizes used when evaluating candidates with n trips, e.g. for workers."""
+        if self.evaluation is not EvaluationType.COMMON:
+            return None
+        sizes = [n] if self.halving is None else [n, *self.halving.rungs(n)]
+        return {size: self.uniforms(size) for size in sizes}
+
+    def screen(self, candidates: list[dict[str, float]], n: int, metric: str, evaluator: ParallelEvaluator = None) -> tuple[list[int], dict[int, tuple[int, tuple[float, float]]]]:
+        """
+        Screens the candidates on smaller samples if successive halving is enabled. Returns the indices of the
+        candidates to evaluate with n trips and, for the eliminated ones, the trips and (chi, kss) of their last screening.
+        Every screening evaluation is written to the parameter map together with its number of trips.
+        """
+        if self.halving is None or self.batched:
+            return list(range(len(candidates))), {}
+
+        def evaluate(batch: list[dict[str, float]], trips: int) -> list[tuple[float, float]]:
+            results = [None] * len(batch)
+            if evaluator is not None:
+                futures = {evaluator.submit(params, self.task_seed(params), trips): index for index, params in enumerate(batch)}
+                completed = ((futures[future], future.result()) for future in as_completed(futures))
+            else:
+                completed = ((index, self.evaluate_batch([params], trips)[0]) for index, params in enumerate(batch))
+            # Every result is recorded as soon as it is done, so an interrupted rung keeps what it evaluated so far
+            for index, (chi, kss) in completed:
+                self.add_parameter_map_point(batch[index], {"chi" : chi, "kss" : kss}, trips)
+                results[index] = (chi, kss)
+            return results
+
+        return self.halving.screen(candidates, n, metric, evaluate)
+
+    @property
+    def batched(self) -> bool:
+        # Exact evaluations of many parameter sets are cheaper as one array pass than spread over processes
+        return self.evaluation is EvaluationType.EXPECTED
+
+    def evaluate_batch(self, candidates: list[dict[str, float]], n: int) -> list[tuple[float, float]]:
+        """
+        Evaluates many parameter sets, returning their (chi, kss) in the same order. Exact evaluations are done
+        together in array passes over the model's pairs, sampled ones one after the other with their own seeds.
+        """
+        if not self.batched:
+            results = []
+            for params in candidates:
+                for name, value in params.items():
+                    setattr(self.model, name, value)
+                self.model.recreate_matrix()
+                results.append(self.evaluate(n, self.task_seed(params)))
+            return results
+        results = []
+        for sums in self.model.expected_histograms(candidates):
+            distribution = Distribution.from_bin_sums(sums)
+            results.append((self.target.chi_square_distance(distribution), self.target.kolmogorov_smirnov_statistic(distribution)))
+        return results
+
+    def record(self, params: dict[str, float], chi: float, kss: float, metric: str, n: int):
+        """Stores a parameter set evaluated with n trips in the parameter map and keeps it if it is the best one so far."""
+        self.add_parameter_map_point(params, {"chi" : chi, "kss" : kss}, n)
+        current_metrics = { "chi" : chi, "kss" : kss }
+        if self.metrics[metric] is None or current_metrics[metric] < self.metrics[metric]:
+            for name, param in self.parameters.items():
+                param.value = params[name]
+            self.metrics["chi"] = chi
+            self.metrics["kss"] = kss
+
+    def sweep(self, candidates: list[dict[str, float]], n: int, metric: str, on_result = None):
+        """
+        Evaluates independent parameter sets and records their results. With more than one worker the sets are
+        evaluated in a process pool and recorded in the order they complete. On Ctrl-C the queued sets are cancelled,
+        everything evaluated up to then is already recorded. on_result is called with (params, chi, kss, trips) of every set.
+        Exact evaluations are batched instead, each batch is recorded once it is done. With successive halving only
+        the sets that survive the screening are evaluated with n trips and can become the best one, the eliminated
+        ones are reported with the metrics and trips of their last screening.
+        """
+        if self.batched:
+            size = self.model.batch_size()
+            for start in range(0, len(candidates), size):
+                batch = candidates[start:start + size]
+                for params, (chi, kss) in zip(batch, self.evaluate_batch(batch, n)):
+                    self.record(params, chi, kss, metric, n)
+                    if on_result is not None:
+                        on_result(params, chi, kss, n)
+            return
+        if self.workers == 1:
+            survivors, eliminated = self.screen(candidates, n, metric)
+            self.report_eliminated(candidates, eliminated, on_result)
+            for params in [candidates[index] for index in survivors]:
+                for name, value in params.items():
+                    setattr(self.model, name, value)
+                self.model.recreate_matrix()
+                chi, kss = self.evaluate(n, self.task_seed(params))
+                self.record(params, chi, kss, metric, n)
+                if on_result is not None:
+                    on_result(params, chi, kss, n)
+            return
+        with ParallelEvaluator(self.model, self.target, self.evaluation, n, self.workers, self.uniform_blocks(n)) as evaluator:
+            survivors, eliminated = self.screen(candidates, n, metric, evaluator)
+            self.report_eliminated(candidates, eliminated, on_result)
+            futures = {evaluator.submit(candidates[index], self.task_seed(candidates[index])): candidates[index] for index in survivors}
+            try:
+                for future in as_completed(futures):
+                    chi, kss = future.result()
+                    self.record(futures[future], chi, kss, metric, n)
+                    if on_result is not None:
+                        on_result(futures[future], chi, kss, n)
+            except KeyboardInterrupt:
+                evaluator.shutdown(wait=False)
+                raise
+
+    @staticmethod
+    def report_eliminated(candidates: list[dict[str, float]], eliminated: dict[int, tuple[int, tuple[float, float]]], on_result = None):
+        """Calls on_result for the candidates eliminated by the screening, they are already in the parameter map."""
+        if on_result is None:
+            return
+        for index, (trips, (chi, kss)) in sorted(eliminated.items()):
+            on_result(candidates[index], chi, kss, trips)
+
+    def task_seed(self, parameters: dict[str, float]) -> np.random.SeedSequence:
+        """Seed for sampling the given parameter set, derived from the search seed and the parameter values."""
+        values = np.array([parameters[name] for name in self.parameters], dtype=np.float64)
+        return np.random.SeedSequence([self.seed, *values.view(np.uint64).tolist()])
+
     def apply(self):
         for name, param in self.parameters.items():
             setattr(self.model, name, param.value)
         self.model.recreate_matrix()
         self.save_parameter_map()
 
-    def add_parameter_map_point(self, params: dict[str, float], metrics: dict[str, float]):
+    def add_parameter_map_point(self, params: dict[str, float], metrics: dict[str, float], trips: int = None):
         """
         Store a row of parameter values + metric values into the internal DataFrame.
+        trips is the number of trips the metrics were estimated from, it is left empty for exact evaluations.
         Will save to CSV immediately if a csv_path is provided.
         """
         if not self.csv_path:
             return
 
         # Ensure the row matches DataFrame columns
-        row = {**params, **metrics}
+        row = {**params, **metrics, "trips": None if self.evaluation is EvaluationType.EXPECTED else trips}
         # Append to DataFrame
         new_row = pl.DataFrame([row]).cast(self._df.schema)
         self._df = pl.concat([self._df, new_row], how="vertical")
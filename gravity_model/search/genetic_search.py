@@ -2,17 +2,19 @@ from pathlib import Path
 import time
 import random
 
-from ..training import chi_square_distance, get_histogram, kolmogorov_smirnov_statistic, get_ccdf
 from ..trip import TripContainer
 from .generic import GenericSearch
+from .parallel import ParallelEvaluator
+from .halving import SuccessiveHalving
 from ..log import logger
 
-from . import DEFAULT_TRAINING_TRIPS
+from . import DEFAULT_TRAINING_TRIPS, EvaluationType
 
 class GeneticSearch(GenericSearch):
-    def __init__(self, model, desired: TripContainer, parameters: dict[str, tuple[float, float, float]], csv_path: Path | None = None, population_size=20, mutation_rate=0.2):
-        super().__init__(model=model, desired=desired, parameters=parameters, csv_path=csv_path)
+    def __init__(self, model, desired: TripContainer, parameters: dict[str, tuple[float, float, float]], csv_path: Path | None = None, population_size=20, mutation_rate=0.2, evaluation: EvaluationType = EvaluationType.SAMPLED, workers: int = 1, seed: int = None, training_trips: int = DEFAULT_TRAINING_TRIPS, halving: SuccessiveHalving = None):
+        super().__init__(model=model, desired=desired, parameters=parameters, csv_path=csv_path, evaluation=evaluation, workers=workers, seed=seed, training_trips=training_trips, halving=halving)
         
+        self.evaluator: ParallelEvaluator = None
         self.fitness = None
         self.population_size = population_size
         self.mutation_rate = mutation_rate
@@ -23,18 +25,22 @@ class GeneticSearch(GenericSearch):
             for name, p in self.parameters.items()
         }
 
-    def evaluate_fitness(self, individual, metric):
-        for name, value in individual.items():
-            setattr(self.model, name, value)
-        self.model.recreate_matrix()
-        trips = self.model.make_trips(min(self.real_data.df.height, DEFAULT_TRAINING_TRIPS))
-        chi = chi_square_distance(get_histogram(self.real_data), get_histogram(trips))
-        kss = kolmogorov_smirnov_statistic(get_ccdf(self.real_data), get_ccdf(trips))
+    @property
+    def training_trips(self) -> int:
+        return min(self.real_data.df.height, self.sample_size)
+
+    def evaluate_fitness(self, individual, metric, metrics: tuple[float, float] = None):
+        if metrics is None:
+            for name, value in individual.items():
+                setattr(self.model, name, value)
+            self.model.recreate_matrix()
+            metrics = self.evaluate(self.training_trips, self.task_seed(individual))
+        chi, kss = metrics
         if metric == "chi":
             fitness = chi
         elif metric == "kss":
             fitness = kss
-        self.add_parameter_map_point(individual, {"chi" : chi, "kss" : kss})
+        self.add_parameter_map_point(individual, {"chi" : chi, "kss" : kss}, self.training_trips)
         return fitness, (chi, kss)
     
     def population_diversity(self, population: list[dict[str, float]]) -> float:
@@ -61,12 +67,34 @@ class GeneticSearch(GenericSearch):
             raise RuntimeError(f"Total distance {total_distance} exceeds number of parameters {len(self.parameters)}")
         return total_distance / count
     
-    def calculate_fitness(self, population: list[dict[str, float]], metric: str = "chi") -> list[tuple[float, dict[str, float]]]:
+    @staticmethod
+    def rank(fitness_scores: list[tuple[float, dict[str, float], int]]) -> list[tuple[float, dict[str, float], int]]:
+        """
+        Sorts (fitness, individual, trips) entries, fitness values are only compared between entries evaluated with the
+        same number of trips. Individuals that got through more screening rungs rank ahead of those eliminated earlier.
+        """
+        return sorted(fitness_scores, key=lambda x: (-x[2], x[0]))
+
+    def calculate_fitness(self, population: list[dict[str, float]], metric: str = "chi") -> list[tuple[float, dict[str, float], int]]:
         fitness_scores = []
-        for individual in population:
-            fitness, metrics = self.evaluate_fitness(individual, metric=metric)
+        # With successive halving only the promoted individuals are evaluated with all training trips
+        survivors, screened = self.screen(population, self.training_trips, metric, self.evaluator)
+        promoted = [population[index] for index in survivors]
+        # With workers or batched evaluations the whole generation is evaluated at once, only the bookkeeping happens here
+        evaluated = [None] * len(promoted)
+        if self.evaluator is not None:
+            evaluated = self.evaluator.map(promoted, [self.task_seed(individual) for individual in promoted])
+        elif self.batched:
+            evaluated = self.evaluate_batch(promoted, self.training_trips)
+        for individual, metrics in zip(promoted, evaluated):
+            fitness, metrics = self.evaluate_fitness(individual, metric=metric, metrics=metrics)
             logger.info(f"Individual {len(fitness_scores) + 1} of {len(population)} | {self.population_size} {individual}  - Fitness: {fitness} - Metrics (chi,  KSS): {metrics}")
-            fitness_scores.append((fitness, individual))
+            fitness_scores.append((fitness, individual, self.training_trips))
+        # Screened out individuals keep the fitness of their last screening rung, the ranking keeps them apart from the others
+        for index, (trips, (chi, kss)) in sorted(screened.items()):
+            fitness = chi if metric == "chi" else kss
+            logger.info(f"Individual {population[index]} screened out on {trips} trips - Fitness: {fitness} - Metrics (chi,  KSS): {(chi, kss)}")
+            fitness_scores.append((fitness, population[index], trips))
         return fitness_scores
     
     def tournament_select(self, parents: tuple[float, dict[str, float]], k=2, p=0.7):        
@@ -101,7 +129,7 @@ class GeneticSearch(GenericSearch):
                 jitter_range = (parameter.maximum - parameter.minimum) * 0.2
                 individual[metric] = random.uniform(max(parameter.minimum, individual[metric] - jitter_range), min(parameter.maximum, individual[metric] + jitter_range))
     
-    def make_children(self, fitness_scores: list[tuple[float, dict[str, float]]], elitism: int, diversity: float) -> list[dict[str, float]]:
+    def make_children(self, fitness_scores: list[tuple[float, dict[str, float], int]], elitism: int, diversity: float) -> list[dict[str, float]]:
         population = []
         for homeowner in random.sample(fitness_scores[0:-1], len(fitness_scores) - (elitism + 1)): # Skip the worst individual and sample the rest (population size - elitism) from all remaining individuals)
             # Restricted Tournament Selection
@@ -123,6 +151,14 @@ class GeneticSearch(GenericSearch):
         return population
 
     def train(self, iterations: int = 100, accuracy: float = -1.0, metric: str = "chi"):
+        if self.workers > 1 and not self.batched:
+            with ParallelEvaluator(self.model, self.target, self.evaluation, self.training_trips, self.workers, self.uniform_blocks(self.training_trips)) as self.evaluator:
+                self.run(iterations, accuracy, metric)
+            self.evaluator = None
+        else:
+            self.run(iterations, accuracy, metric)
+
+    def run(self, iterations: int, accuracy: float, metric: str):
         start_time = time.time()
         elitism = max(2, int(self.population_size/10))
         num_generations = max(1, iterations // self.population_size)
@@ -142,7 +178,7 @@ class GeneticSearch(GenericSearch):
                 fitness_scores.extend(self.calculate_fitness(population, metric=metric))
                 if len(fitness_scores) != self.population_size:
                     raise RuntimeError(f"Population size mismatch: {len(fitness_scores)} != {self.population_size}")
-                fitness_scores.sort(key=lambda x: x[0])
+                fitness_scores = self.rank(fitness_scores)
 
                 diversity = self.population_diversity(population)
                 logger.info(f"Generation {generation + 1} - Best fitness: {fitness_scores[0][0]} - Diversity: {diversity}")
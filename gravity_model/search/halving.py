@@ -0,0 +1,54 @@
+import math
+
+from ..log import logger
+
+# Sample size of the first screening rung
+HALVING_MINIMUM_TRIPS = 50_000
+# Every rung samples this many times more trips than the previous one and promotes this fraction of its candidates
+HALVING_RATE = 3
+
+METRICS = ("chi", "kss")
+
+class SuccessiveHalving():
+    """
+    Screens candidates on growing sample sizes before they are evaluated at full size (successive halving).
+
+    All candidates are evaluated on a small sample first, only the best 1/rate of them are promoted to the next rung,
+    which samples rate times as many trips. Screening stops once a single candidate is left or the next rung would
+    not be smaller than the full sample size, the remaining candidates are then evaluated at full size by the search.
+    """
+
+    def __init__(self, minimum_trips: int = HALVING_MINIMUM_TRIPS, rate: int = HALVING_RATE):
+        if rate < 2:
+            raise ValueError("Successive halving needs a rate of at least 2!")
+        self.minimum_trips = minimum_trips
+        self.rate = rate
+
+    def rungs(self, n: int) -> list[int]:
+        """Sample sizes of the screening rungs for a full sample size of n."""
+        sizes = []
+        size = self.minimum_trips
+        while size < n:
+            sizes.append(size)
+            size *= self.rate
+        return sizes
+
+    def screen(self, candidates: list[dict[str, float]], n: int, metric: str, evaluate) -> tuple[list[int], dict[int, tuple[int, tuple[float, float]]]]:
+        """
+        Screens the candidates with evaluate(candidates, trips), which returns their (chi, kss) in the same order.
+        Returns the indices of the candidates that are promoted to the full sample size and, for every eliminated
+        candidate, the number of trips of the last rung it was evaluated on together with its (chi, kss) there.
+        """
+        remaining = list(range(len(candidates)))
+        eliminated = {}
+        for trips in self.rungs(n):
+            if len(remaining) <= 1:
+                break
+            results = evaluate([candidates[index] for index in remaining], trips)
+            ranked = sorted(zip(remaining, results), key=lambda result: result[1][METRICS.index(metric)])
+            promoted = max(1, math.ceil(len(ranked) / self.rate))
+            logger.info(f"Screened {len(ranked)} candidates on {trips} trips, promoting {promoted}")
+            for index, metrics in ranked[promoted:]:
+                eliminated[index] = (trips, metrics)
+            remaining = [index for index, _ in ranked[:promoted]]
+        return remaining, eliminated
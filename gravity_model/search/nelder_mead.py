@@ -1,12 +1,11 @@
 from pathlib import Path
 import time
 
-from ..training import chi_square_distance, get_histogram, kolmogorov_smirnov_statistic, get_ccdf
 from ..trip import TripContainer
 from .generic import GenericSearch
 from ..log import logger
 
-from . import DEFAULT_TRAINING_TRIPS
+from . import DEFAULT_TRAINING_TRIPS, EvaluationType
 
 class NelderMeadSearch(GenericSearch):
 
@@ -20,11 +19,15 @@ class NelderMeadSearch(GenericSearch):
     GENERATION_SIZE = 20
     SHRINKAGE_REQUIREED = GENERATION_SIZE // 5
 
-    def __init__(self, model, desired: TripContainer, parameters: dict[str, tuple[float, float, float]], csv_path: Path | None = None, population_size=20, mutation_rate=0.2):
-        super().__init__(model=model, desired=desired, parameters=parameters, csv_path=csv_path)
+    def __init__(self, model, desired: TripContainer, parameters: dict[str, tuple[float, float, float]], csv_path: Path | None = None, population_size=20, mutation_rate=0.2, evaluation: EvaluationType = EvaluationType.SAMPLED, seed: int = None, training_trips: int = DEFAULT_TRAINING_TRIPS):
+        super().__init__(model=model, desired=desired, parameters=parameters, csv_path=csv_path, evaluation=evaluation, seed=seed, training_trips=training_trips)
 
         self.metric: float = None
 
+    @property
+    def training_trips(self) -> int:
+        return min(len(self.real_data), self.sample_size)
+
     def initialize_default_simplex(self):
         simplex = []
         dimensions = len(self.parameters) + 1
@@ -109,10 +112,7 @@ class NelderMeadSearch(GenericSearch):
 
         # Check simplex performance
         logger.info(f"Testing simplex: {simplex}")
-        model_trips: TripContainer = self.model.make_trips(min(DEFAULT_TRAINING_TRIPS, len(self.real_data)))
-        chi = chi_square_distance(get_histogram(self.real_data), get_histogram(model_trips))
-        kss = kolmogorov_smirnov_statistic(get_ccdf(self.real_data), get_ccdf(model_trips))
-        return chi, kss
+        return self.evaluate(self.training_trips, self.task_seed(simplex))
     
     def clamp_vertex(self, vertex):
         # Ensure all vertex values are within the parameter bounds
@@ -148,7 +148,7 @@ class NelderMeadSearch(GenericSearch):
                 if len(vertex_performance) <= 0:
                     for vertex in initial_simplex:
                         chi, kss = self.evaluate_simplex(vertex)
-                        self.add_parameter_map_point(vertex, {"chi" : chi, "kss" : kss})
+                        self.add_parameter_map_point(vertex, {"chi" : chi, "kss" : kss}, self.training_trips)
                         if metric == "chi":
                             performance_metric = chi
                         elif metric == "kss":
@@ -197,7 +197,7 @@ class NelderMeadSearch(GenericSearch):
                 )
                 logger.info(f"Reflection vertex: {reflection_vertex}")
                 reflection_chi, reflection_kss = self.evaluate_simplex(reflection_vertex)
-                self.add_parameter_map_point(reflection_vertex, {"chi" : reflection_chi, "kss" : reflection_kss})
+                self.add_parameter_map_point(reflection_vertex, {"chi" : reflection_chi, "kss" : reflection_kss}, self.training_trips)
                 reflection_performance = reflection_chi if metric == "chi" else reflection_kss
                 if best_vertex[0] <= reflection_performance < second_worst_vertex[0]:
                     logger.info(f"Accepting reflection vertex: {reflection_vertex} with performance {reflection_performance}")
@@ -211,7 +211,7 @@ class NelderMeadSearch(GenericSearch):
                     )
                     logger.info(f"Expansion vertex: {expansion_vertex}")
                     expansion_chi, expansion_kss = self.evaluate_simplex(expansion_vertex)
-                    self.add_parameter_map_point(expansion_vertex, {"chi" : expansion_chi, "kss" : expansion_kss})
+                    self.add_parameter_map_point(expansion_vertex, {"chi" : expansion_chi, "kss" : expansion_kss}, self.training_trips)
                     expansion_performance = expansion_chi if metric == "chi" else expansion_kss
                     if expansion_performance < reflection_performance:
                         logger.info(f"Accepting expansion vertex: {expansion_vertex} with performance {expansion_performance}")
@@ -233,7 +233,7 @@ class NelderMeadSearch(GenericSearch):
                     )
                 logger.info(f"Contraction vertex: {contraction_vertex}")
                 contraction_chi, contraction_kss = self.evaluate_simplex(contraction_vertex)
-                self.add_parameter_map_point(contraction_vertex, {"chi" : contraction_chi, "kss" : contraction_kss})
+                self.add_parameter_map_point(contraction_vertex, {"chi" : contraction_chi, "kss" : contraction_kss}, self.training_trips)
                 contraction_performance = contraction_chi if metric == "chi" else contraction_kss
                 if contraction_performance < worst_vertex[0]:
                     logger.info(f"Accepting contraction vertex: {contraction_vertex} with performance {contraction_performance}")
@@ -242,13 +242,17 @@ class NelderMeadSearch(GenericSearch):
 
                 # 6. Shrinkage
                 logger.info("Shrinking simplex")
+                shrinked_vertices = []
                 for i in range(1, dimensions + 1):
                     shrinked_vertex = self.clamp_vertex(
                         {name: best_vertex[1][name] + self.SHRINKAGE_COEFFICIENT * (vertex_performance[i][1][name] - best_vertex[1][name]) for name in self.parameters.keys()}
                     )
                     logger.info(f"Shrinked vertex {i}: {shrinked_vertex}")
-                    shrinked_chi, shrinked_kss = self.evaluate_simplex(shrinked_vertex)
-                    self.add_parameter_map_point(shrinked_vertex, {"chi" : shrinked_chi, "kss" : shrinked_kss})
+                    shrinked_vertices.append(shrinked_vertex)
+                # All shrinked vertices are known up front, so they are evaluated as one batch
+                shrinked_metrics = self.evaluate_batch(shrinked_vertices, self.training_trips)
+                for i, shrinked_vertex, (shrinked_chi, shrinked_kss) in zip(range(1, dimensions + 1), shrinked_vertices, shrinked_metrics):
+                    self.add_parameter_map_point(shrinked_vertex, {"chi" : shrinked_chi, "kss" : shrinked_kss}, self.training_trips)
                     shrinked_performance = shrinked_chi if metric == "chi" else shrinked_kss
                     vertex_performance[i] = (shrinked_performance, shrinked_vertex)
 
@@ -0,0 +1,127 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+import signal
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import polars as pl
+
+from ..location import LocationContainer
+from ..training import Distribution
+from ..trip import TripCounts
+from ..log import logger
+from . import EvaluationType
+
+# Pair arrays of the model that are placed in shared memory instead of being copied into every worker
+SHARED_ARRAYS = ("origins", "destinations", "distances")
+
+# State of a worker process, set up once by initialize_worker
+_worker = {}
+
+def evaluate_model(model, target: Distribution, evaluation: EvaluationType, n: int, rng: np.random.Generator = None, uniforms: np.ndarray = None) -> tuple[float, float]:
+    """
+    Compares the distance distribution of the model in its current state with the target distribution.
+    Depending on the evaluation type the model distribution is estimated from n sampled trips, from the trips drawn
+    with the common block of sorted uniforms or calculated exactly.
+    """
+    if evaluation is EvaluationType.EXPECTED:
+        model_trips: TripCounts = model.expected_trip_counts()
+    elif evaluation is EvaluationType.COMMON:
+        model_trips: TripCounts = model.common_trip_counts(uniforms)
+    else:
+        model_trips: TripCounts = model.make_trip_counts(n, rng)
+    distribution = Distribution(model_trips)
+    return target.chi_square_distance(distribution), target.kolmogorov_smirnov_statistic(distribution)
+
+def attach(name: str, dtype: str, shape: tuple[int, ...]) -> tuple[SharedMemory, np.ndarray]:
+    # Workers report to the resource tracker of the parent process, which unlinks the block when the search ends
+    memory = SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+
+def initialize_worker(model_class: type, parameters: dict[str, float], minimum_distance: int, locations: pl.DataFrame, arrays: dict[str, tuple[str, str, tuple[int, ...]]], target: Distribution, evaluation: EvaluationType, n: int):
+    """Builds the worker's model replica on top of the shared pair arrays."""
+    # Ctrl-C is handled by the search in the main process, which then cancels the queued evaluations
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    memories = {}
+    shared = {}
+    for name, (memory_name, dtype, shape) in arrays.items():
+        memories[name], shared[name] = attach(memory_name, dtype, shape)
+    model = model_class.from_arrays(
+        LocationContainer(df=locations), parameters, minimum_distance,
+        shared["origins"], shared["destinations"], shared["distances"], np.ones(len(shared["distances"]))
+    )
+    uniforms = {int(name.removeprefix("uniforms-")): array for name, array in shared.items() if name.startswith("uniforms-")}
+    _worker.update(memories=memories, model=model, target=target, evaluation=evaluation, n=n, uniforms=uniforms)
+
+def evaluate_parameters(parameters: dict[str, float], seed: np.random.SeedSequence, n: int = None) -> tuple[float, float]:
+    """Evaluates one parameter set on the worker's model replica with n (by default the pool's) trips, returning (chi, kss)."""
+    model = _worker["model"]
+    for name, value in parameters.items():
+        setattr(model, name, value)
+    model.recreate_matrix()
+    if n is None:
+        n = _worker["n"]
+    return evaluate_model(model, _worker["target"], _worker["evaluation"], n, np.random.default_rng(seed), _worker["uniforms"].get(n))
+
+class ParallelEvaluator():
+    """
+    Evaluates parameter sets of a model in a pool of worker processes.
+
+    Every worker holds its own model replica, whose pair arrays live in shared memory, so starting the pool
+    does not copy them. Each parameter set is evaluated with its own seed, which keeps the results independent
+    of the worker that evaluated it. The blocks of uniforms for common random numbers, one per sample size,
+    are shared the same way.
+    Use it as context manager, the shared memory is released on exit.
+    """
+
+    def __init__(self, model, target: Distribution, evaluation: EvaluationType, n: int, workers: int, uniforms: dict[int, np.ndarray] = None):
+        self.model = model
+        self.target = target
+        self.evaluation = evaluation
+        self.n = n
+        self.workers = workers
+        self.uniforms = uniforms if uniforms is not None else {}
+        self.memories: list[SharedMemory] = []
+        self.executor: ProcessPoolExecutor = None
+
+    def __enter__(self) -> "ParallelEvaluator":
+        arrays = {}
+        shared = {name: getattr(self.model, name) for name in SHARED_ARRAYS}
+        for size, block in self.uniforms.items():
+            shared[f"uniforms-{size}"] = block
+        for name, array in shared.items():
+            array = np.ascontiguousarray(array)
+            memory = SharedMemory(create=True, size=max(1, array.nbytes))
+            self.memories.append(memory)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[:] = array
+            arrays[name] = (memory.name, array.dtype.str, array.shape)
+        logger.info(f"Starting {self.workers} evaluation workers")
+        # Workers are spawned instead of forked, a fork of a process whose polars thread pool is already running can deadlock
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initialize_worker,
+            initargs=(type(self.model), self.model.parameters, self.model.minimum_distance, self.model.locations.df, arrays, self.target, self.evaluation, self.n)
+        )
+        return self
+
+    def submit(self, parameters: dict[str, float], seed: np.random.SeedSequence, n: int = None) -> Future:
+        return self.executor.submit(evaluate_parameters, parameters, seed, n)
+
+    def map(self, parameters: list[dict[str, float]], seeds: list[np.random.SeedSequence], n: int = None) -> list[tuple[float, float]]:
+        """Evaluates all parameter sets with n (by default the pool's) trips, returning their (chi, kss) in the same order."""
+        futures = [self.submit(p, seed, n) for p, seed in zip(parameters, seeds, strict=True)]
+        return [future.result() for future in futures]
+
+    def shutdown(self, wait: bool = True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+            self.executor = None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # An interrupted search does not wait for the evaluations that are still queued
+        self.shutdown(wait=exc_type is None)
+        for memory in self.memories:
+            memory.close()
+            memory.unlink()
+        self.memories = []
@@ -0,0 +1,87 @@
+import enum
+from hashlib import sha256
+from pathlib import Path
+
+import polars as pl
+
+from .log import logger
+from .cache import cache_file
+
+class FileFormat(enum.StrEnum):
+    CSV = "CSV"
+    PARQUET = "PARQUET"
+    IPC = "IPC"
+
+FILE_SUFFIXES = {
+    ".csv": FileFormat.CSV,
+    ".parquet": FileFormat.PARQUET,
+    ".pq": FileFormat.PARQUET,
+    ".ipc": FileFormat.IPC,
+    ".arrow": FileFormat.IPC,
+    ".feather": FileFormat.IPC,
+}
+
+# CSV files of at least this size get a binary sidecar copy in the cache directory the first time they are read
+SIDECAR_MINIMUM_SIZE = 64 * 1024 * 1024
+
+def file_format(filename: Path) -> FileFormat:
+    """Detects the format of a data file by its extension, files with unknown extensions are treated as csv."""
+    return FILE_SUFFIXES.get(Path(filename).suffix.lower(), FileFormat.CSV)
+
+def sidecar_file(filename: Path, schema: dict[str, pl.DataType] | None) -> Path:
+    """
+    The sidecar is keyed by the file's location, size and modification time, so a changed csv is never served stale.
+    The location is the first part of the key, which identifies the older sidecars of the same file.
+    """
+    stat = filename.stat()
+    location = sha256(filename.resolve().as_posix().encode()).hexdigest()
+    version = sha256(f"{stat.st_size}|{stat.st_mtime_ns}|{schema}".encode()).hexdigest()
+    return cache_file("frames", f"{location}-{version}", ".arrow")
+
+def remove_older_sidecars(binary: Path):
+    """Removes the sidecars of earlier versions of the file the given sidecar belongs to."""
+    location = binary.stem.split("-")[0]
+    for older in binary.parent.glob(f"{location}-*.arrow"):
+        if older != binary:
+            logger.info(f"Removing outdated binary sidecar {older.as_posix()}")
+            older.unlink(missing_ok=True)
+
+def read_frame(filename: Path, schema: dict[str, pl.DataType] = None, sidecar: bool = True, file_type: FileFormat = None) -> pl.DataFrame:
+    """
+    Reads a DataFrame in any supported format, given by the file extension unless file_type is set. IPC files are
+    memory-mapped. Large csv files are converted into an IPC sidecar on first read, later reads memory-map the
+    sidecar instead of parsing the csv again.
+    """
+    filename = Path(filename)
+    file_type = file_type or file_format(filename)
+    if file_type is FileFormat.CSV:
+        if not sidecar or filename.stat().st_size < SIDECAR_MINIMUM_SIZE:
+            return pl.read_csv(filename, schema=schema, infer_schema_length=None)
+        binary = sidecar_file(filename, schema)
+        if binary.exists():
+            logger.info(f"Reading {filename.as_posix()} from its binary sidecar {binary.as_posix()}")
+            return pl.read_ipc(binary, memory_map=True)
+        df = pl.read_csv(filename, schema=schema, infer_schema_length=None)
+        logger.info(f"Writing binary sidecar for {filename.as_posix()} to {binary.as_posix()}")
+        temporary = binary.with_suffix(".tmp")
+        df.write_ipc(temporary, compression="uncompressed")
+        temporary.replace(binary)
+        remove_older_sidecars(binary)
+        return df
+    if file_type is FileFormat.PARQUET:
+        df = pl.read_parquet(filename)
+    else:
+        df = pl.read_ipc(filename, memory_map=True)
+    if schema is not None:
+        df = df.select(schema.keys()).cast(schema)
+    return df
+
+def write_frame(df: pl.DataFrame, filename: Path, file_type: FileFormat = None):
+    """Writes a DataFrame in the format given by the file extension unless file_type is set."""
+    file_type = file_type or file_format(filename)
+    if file_type is FileFormat.CSV:
+        df.write_csv(filename)
+    elif file_type is FileFormat.PARQUET:
+        df.write_parquet(filename)
+    else:
+        df.write_ipc(filename, compression="uncompressed")
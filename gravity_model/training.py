@@ -1,13 +1,31 @@
 import tqdm
+import numpy as np
 import polars as pl
 import logging
 
-from .trip import TripContainer
+from .trip import TripContainer, TripCounts
 from .log import logger
 
 HISTROGRAM_BIN_SIZE = 10
 
-def get_histogram(trips: TripContainer) -> list[tuple[int, int]]:
+def get_distance_bins(distances: np.ndarray) -> np.ndarray:
+    return (distances // HISTROGRAM_BIN_SIZE).astype(np.int64)
+
+def get_count_histogram(trips: TripCounts) -> list[tuple[int, int]]:
+    bins = trips.bins if trips.bins is not None else get_distance_bins(trips.distances)
+    return get_bin_histogram(np.bincount(bins, weights=trips.counts))
+
+def get_bin_histogram(sums: np.ndarray) -> list[tuple[int, int]]:
+    """Histogram of the trips (or trip shares) summed up per distance bin."""
+    # Like the DataFrame histogram, only bins that received trips are part of the histogram
+    indices = np.nonzero(sums)[0]
+    labels = (indices * HISTROGRAM_BIN_SIZE).astype(np.float64)
+    percentages = sums[indices] / sums.sum()
+    return list(zip(labels.tolist(), percentages.tolist()))
+
+def get_histogram(trips: TripContainer | TripCounts) -> list[tuple[int, int]]:
+    if isinstance(trips, TripCounts):
+        return get_count_histogram(trips)
     bins = trips.df.with_columns(
         (
             (pl.col("distance") // HISTROGRAM_BIN_SIZE).alias("index")
@@ -34,6 +52,8 @@ def get_histogram(trips: TripContainer) -> list[tuple[int, int]]:
 def fix_hist(histogram: list[tuple[int, int]], length) -> list[tuple[int, int]]:
     if len(histogram) >= length:
         return histogram[:length]
+    # Copy, so padding never modifies a histogram that is cached by the caller
+    histogram = list(histogram)
     diff = length - len(histogram)
     for i in range(diff):
         histogram.append((
@@ -50,13 +70,23 @@ def make_hist_similar(histogram_a: list[tuple[int, int]], histogram_b: list[tupl
     if len(histogram_a) < len(histogram_b):
         return fix_hist(histogram_a, len(histogram_b)), histogram_b
 
-def total_variation_distance(test: TripContainer, model: TripContainer) -> int:
-    tvd_sum = 0
-    model_rel = model.as_relative()
-    for trip, test_amount in test.as_relative().items():
-        model_amount = model_rel.get(trip, 0.0)
-        tvd_sum += abs(test_amount - model_amount)
-    return tvd_sum / 2
+def total_variation_distance(test: TripContainer | TripCounts, model: TripContainer | TripCounts) -> int:
+    if test.locations is None or test.locations is not model.locations:
+        # Location indices are only comparable within one LocationContainer, otherwise the pairs are matched by their ids
+        shares = test.relative_ids().join(model.relative_ids(), on=["start_id", "end_id"], how="left", suffix="_model")
+        return (shares.get_column("share") - shares.get_column("share_model").fill_null(0.0)).abs().sum() / 2
+    test_origins, test_destinations, test_shares = test.relative_pairs()
+    model_origins, model_destinations, model_shares = model.relative_pairs()
+    # Both sides are encoded as int64 pair codes, so the shares can be matched up with one unique instead of dictionaries
+    origins = np.concatenate((test_origins, model_origins))
+    destinations = np.concatenate((test_destinations, model_destinations))
+    width = int(max(origins.max(initial=0), destinations.max(initial=0))) + 1
+    codes, inverse = np.unique(origins * width + destinations, return_inverse=True)
+    differences = np.bincount(inverse, weights=np.concatenate((test_shares, -model_shares)), minlength=len(codes))
+    # Like before, only the pairs that occur in the test trips contribute
+    in_test = np.zeros(len(codes), dtype=bool)
+    in_test[inverse[:len(test_shares)]] = True
+    return np.abs(differences[in_test]).sum() / 2
 
 def chi_square_distance(target: list[tuple[int, int]], actual: list[tuple[int, int]]):
     target, actual = make_hist_similar(target, actual)
@@ -80,8 +110,10 @@ def histogram_intersection_kernel(target: list[tuple[int, int]], actual: list[tu
         )
     return hik
 
-def get_ccdf(trips: TripContainer) -> list[tuple[int, float]]:
-    histogram = sorted(get_histogram(trips), key=lambda x: x[0])
+def get_ccdf(trips: TripContainer | TripCounts, histogram: list[tuple[int, int]] = None) -> list[tuple[int, float]]:
+    if histogram is None:
+        histogram = get_histogram(trips)
+    histogram = sorted(histogram, key=lambda x: x[0])
 
     ccdf = []
     cumulative = 0.0
@@ -100,6 +132,27 @@ def kolmogorov_smirnov_statistic(target: list[tuple[int, float]], actual: list[t
     diffs = [abs(a - b) for (_, a), (_, b) in zip(target, actual)]
     return max(diffs)
 
+class Distribution():
+    """Distance histogram and CCDF of a set of trips, calculated once and shared by all metrics."""
+
+    def __init__(self, trips: TripContainer | TripCounts):
+        self.histogram = get_histogram(trips)
+        self.ccdf = get_ccdf(trips, self.histogram)
+
+    @classmethod
+    def from_bin_sums(cls, sums: np.ndarray) -> "Distribution":
+        """Distribution of the trips (or trip shares) summed up per distance bin, e.g. a row of expected_histograms."""
+        distribution = cls.__new__(cls)
+        distribution.histogram = get_bin_histogram(sums)
+        distribution.ccdf = get_ccdf(None, distribution.histogram)
+        return distribution
+
+    def chi_square_distance(self, other: "Distribution") -> float:
+        return chi_square_distance(self.histogram, other.histogram)
+
+    def kolmogorov_smirnov_statistic(self, other: "Distribution") -> float:
+        return kolmogorov_smirnov_statistic(self.ccdf, other.ccdf)
+
 class Parameter():
 
     def __init__(self, name: str, initial: float, minimum: float, maximum: float):
@@ -1,17 +1,24 @@
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor
-from os import cpu_count
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from tempfile import TemporaryDirectory
 
+import numpy as np
 import polars as pl
 import tqdm
-from geopy.distance import distance
+from geopy.distance import distance, Distance
 
 from .log import logger
-from .location import Location
-from .distance import BaseLocationAssigner
+from .location import Location, LocationContainer
+from .distance import BaseLocationAssigner, UNASSIGNED
+from .geodesic import geodesic
+from .storage import FileFormat, file_format, read_frame, write_frame
 
 class Trip:
 
+    __slots__ = ("home", "target", "_distance")
+
     TRIP_SCHEMA = \
     {
         "start_name": pl.String,
@@ -29,29 +36,48 @@ class Trip:
         "distance": pl.Float64
     }
 
-    def __init__(self, location_a: Location, location_b: Location):
+    def __init__(self, location_a: Location, location_b: Location, kilometers: float = None):
         if (not isinstance(location_a, Location)) or (not isinstance(location_b, Location)):
             raise TypeError(f"Trip locations need to be of type Location not {type(location_a)} or {type(location_b)}")
         self.home = location_a
         self.target = location_b
+        # The distance is only calculated once, callers that already know it (e.g. from a distance matrix) can pass it in
+        self._distance: Distance = Distance(kilometers=kilometers) if kilometers is not None else None
 
     def make_copy(self):
-        return Trip(self.home, self.target)
+        trip = Trip(self.home, self.target)
+        trip._distance = self._distance
+        return trip
 
     @property
     def locations(self):
         return (self.home, self.target)
 
+    @property
+    def key(self) -> tuple[int, int]:
+        """Compact identity of the trip as (origin index, destination index) into the LocationContainer."""
+        return (self.home.index, self.target.index)
+
     @property
     def distance(self) -> distance:
-        return self.home.distance_to(self.target)
+        if self._distance is None:
+            self._distance = self.home.distance_to(self.target)
+        return self._distance
     
     @staticmethod
-    def from_dict(value: dict) -> "Trip":
+    def from_dict(value: dict, locations: LocationContainer = None) -> "Trip":
+        """Creates a Trip from a row in the trip schema, with a LocationContainer its own Locations (and indices) are used."""
+        if locations is not None:
+            return Trip(
+                locations.location(locations.index_of(value["start_id"])),
+                locations.location(locations.index_of(value["end_id"])),
+                value.get("distance", None)
+            )
         return \
         Trip(
             Location(value["start_name"], value["start_id"], value["start_lat"], value["start_long"], value["start_area"], value["start_population"]),
-            Location(value["end_name"], value["end_id"], value["end_lat"], value["end_long"], value["end_area"], value["end_population"])
+            Location(value["end_name"], value["end_id"], value["end_lat"], value["end_long"], value["end_area"], value["end_population"]),
+            value.get("distance", None)
         )
     
     def to_dict(self) -> dict:
@@ -94,62 +120,105 @@ class Trip:
     def __setstate__(self, state: tuple[Location, Location]):
         self.home = state[0]
         self.target = state[1]
+        self._distance = None
 
     def __eq__(self, value):
         if not isinstance(value, Trip):
             return False
-        return  self.locations == value.locations
+        return self.home == value.home and self.target == value.target
     
     def __hash__(self):
-        return hash(self.locations)
+        # Locations cache their own hash, so this stays cheap without going stale when a Location changes
+        return hash((self.home, self.target))
     
     def __repr__(self):
         return f"Trip(locations={self.locations})"
     
+class TripView(Sequence):
+    """Read-only sequence of Trips backed by a trip DataFrame, Trip objects are only created when they are accessed."""
+
+    def __init__(self, df: pl.DataFrame, locations: LocationContainer = None):
+        self.df = df
+        self.locations = locations
+
+    def __len__(self):
+        return self.df.height
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [Trip.from_dict(row, self.locations) for row in self.df[item].iter_rows(named=True)]
+        return Trip.from_dict(self.df.row(item, named=True), self.locations)
+
+    def __iter__(self):
+        for row in self.df.iter_rows(named=True):
+            yield Trip.from_dict(row, self.locations)
+
+def count_pairs(origins: np.ndarray, destinations: np.ndarray, counts: np.ndarray = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sums up the counts (one per entry if not given) of every distinct origin-destination pair of location indices."""
+    origins, destinations = np.asarray(origins, dtype=np.int64), np.asarray(destinations, dtype=np.int64)
+    if len(origins) == 0:
+        return origins, destinations, np.zeros(0)
+    # Pairs are encoded as one int64 code, so they can be counted with a single unique
+    width = int(max(origins.max(), destinations.max())) + 1
+    codes, inverse = np.unique(origins * width + destinations, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts, minlength=len(codes))
+    return codes // width, codes % width, totals
+
 class TripContainer:
+    """
+    Container for trips. A DataFrame in the trip schema is the authoritative representation whenever the container was
+    created from one (e.g. when loading a csv), the trips are then only a lazy view on it.
+    """
 
-    def __init__(self, results: list[Trip] | pl.DataFrame | dict[Trip, int] = None):
+    def __init__(self, results: list[Trip] | pl.DataFrame | dict[Trip, int] = None, locations: LocationContainer = None):
         if results is None:
             raise ValueError("TripContainer needs to be initialized with a list of Trips, a DataFrame or a dictionary of Trips!")
         self._trips = None
-        self._dictionary = None
+        self._dict = None
         self._df = None
+        # With the LocationContainer the trips refer to, every trip can be identified by its pair of location indices
+        self.locations = locations
+        self._pairs: tuple[np.ndarray, np.ndarray] = None
 
         if isinstance(results, list):
             self._trips = results
         elif isinstance(results, pl.DataFrame):
             self._df = results
         elif isinstance(results, dict):
-            self._dictionary = results
+            self._dict = results
+
+    def _materialize(self):
+        # Modifications need an actual list, a lazy view is turned into one first
+        if not isinstance(self._trips, list):
+            self._trips = list(self.trips)
 
     def append(self, trip: Trip):
-        self.trips.append(trip)
-        self._dictionary = None
+        self._materialize()
+        self._trips.append(trip)
+        self._dict = None
         self._df = None
+        self._pairs = None
     
     def extend(self, trips: list[Trip]):
-        self.trips.extend(trips)
-        self._dictionary = None
+        self._materialize()
+        self._trips.extend(trips)
+        self._dict = None
         self._df = None
+        self._pairs = None
 
     def update(self, trips: list[Trip]):
         self.trips = trips
-        self._dictionary = None
-        self._df = None
 
     @property
-    def trips(self) -> list[Trip]:
+    def trips(self) -> list[Trip] | TripView:
         if self._trips is None:
+            if self._df is not None:
+                return TripView(self._df, self.locations)
             self._trips = []
-            if self.dictionary is not None:
-                for trip, count in tqdm.tqdm(self.dictionary.items(), desc="Making List of Trips", total=len(self.dictionary), unit="entry(ies)"):
+            if self._dict is not None:
+                for trip, count in tqdm.tqdm(self._dict.items(), desc="Making List of Trips", total=len(self._dict), unit="entry(ies)"):
                     for _ in range(count):
                         self._trips.append(trip)
-            elif self.df is not None:
-                for row in tqdm.tqdm(self.df.iter_rows(named=True), desc="Making List of Trips", total=self.df.height, unit="row(s)"):
-                    self._trips.append(
-                        Trip.from_dict(row)                        
-                    )
         return self._trips
     
     @trips.setter
@@ -162,94 +231,171 @@ class TripContainer:
         self._trips = value
         self._df = None
         self._dict = None
+        self._pairs = None
 
     @staticmethod
-    def chunkify(lst, n):
-        return [lst[i::n] for i in range(n)]
+    def trips_to_df(trips: Sequence[Trip]) -> pl.DataFrame:
+        """Builds the trip DataFrame column by column, distances that are not known yet are calculated in one vectorised pass."""
+        columns = {}
+        for prefix, locations in (("start", [trip.home for trip in trips]), ("end", [trip.target for trip in trips])):
+            columns[f"{prefix}_name"] = [location.name for location in locations]
+            columns[f"{prefix}_id"] = [location.lid for location in locations]
+            columns[f"{prefix}_area"] = [location.area for location in locations]
+            columns[f"{prefix}_population"] = [location.population for location in locations]
+            columns[f"{prefix}_lat"] = np.array([location.latitude for location in locations], dtype=np.float64)
+            columns[f"{prefix}_long"] = np.array([location.longitude for location in locations], dtype=np.float64)
+        distances = np.array([trip._distance.km if trip._distance is not None else np.nan for trip in trips], dtype=np.float64)
+        unknown = np.isnan(distances)
+        if unknown.any():
+            distances[unknown] = geodesic(
+                columns["start_lat"][unknown], columns["start_long"][unknown],
+                columns["end_lat"][unknown], columns["end_long"][unknown]
+            )
+        columns["distance"] = distances
+        return pl.DataFrame(columns, schema=Trip.TRIP_SCHEMA)
 
     @staticmethod
-    def process_chunk(chunk: list[Trip]) -> pl.DataFrame:
-        rows = [trip.to_list() for trip in chunk]
-        return pl.DataFrame(
-            data=rows,
-            orient="row",
-            schema=Trip.TRIP_SCHEMA
-        )
+    def pairs_to_df(locations: LocationContainer, origins: np.ndarray, destinations: np.ndarray, distances: np.ndarray) -> pl.DataFrame:
+        """Builds the trip DataFrame by gathering the origin and destination rows from the location table."""
+        locations_df = locations.df
+        columns = []
+        for prefix, indices in (("start", pl.Series(origins)), ("end", pl.Series(destinations))):
+            for column in ("name", "id", "area", "population", "lat", "long"):
+                columns.append(locations_df.get_column(column).gather(indices).alias(f"{prefix}_{column}"))
+        columns.append(pl.Series("distance", distances, dtype=pl.Float64))
+        return pl.DataFrame(columns).select(Trip.TRIP_SCHEMA.keys())
+
+    @staticmethod
+    def from_pairs(locations: LocationContainer, origins: np.ndarray, destinations: np.ndarray, distances: np.ndarray) -> "TripContainer":
+        """Creates a DataFrame backed container from trips given as location indices and their distances."""
+        container = TripContainer(TripContainer.pairs_to_df(locations, origins, destinations, distances), locations)
+        container._pairs = (np.asarray(origins, dtype=np.int64), np.asarray(destinations, dtype=np.int64))
+        return container
+
+    def pairs(self) -> tuple[np.ndarray, np.ndarray]:
+        """Origin and destination location indices of every trip, looked up from the location ids in the trip DataFrame."""
+        if self._pairs is None:
+            if self.locations is None:
+                raise ValueError("The location indices of trips are only known when the TripContainer has a LocationContainer!")
+            ids = pl.Series(self.locations.ids, dtype=pl.String)
+            indices = pl.Series(np.arange(len(ids), dtype=np.int64))
+            self._pairs = tuple(
+                self.df.get_column(column).replace_strict(ids, indices, return_dtype=pl.Int64).to_numpy()
+                for column in ("start_id", "end_id")
+            )
+        return self._pairs
+
+    def pair_counts(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Distinct origin-destination pairs of location indices and how many trips each of them got."""
+        if self.locations is not None:
+            return count_pairs(*self.pairs())
+        # Without a location table the indices come from the Locations of the trips themselves
+        keys = np.array([trip.key for trip in self.dictionary], dtype=np.int64).reshape(-1, 2)
+        if (keys < 0).any():
+            raise ValueError("Trips need Locations from a LocationContainer to be counted by location indices!")
+        return count_pairs(keys[:, 0], keys[:, 1], np.array(list(self.dictionary.values()), dtype=np.float64))
 
     @property
     def df(self) -> pl.DataFrame:
         if self._df is None:
-            num_chunks = min(cpu_count(), max(1, (len(self._trips) // 250_000)))
-            chunks = self.chunkify(self.trips, num_chunks)
-            logger.debug(f"Creating DataFrame from Trips in {num_chunks} chunks of size {len(chunks[0])}...")
-            with ProcessPoolExecutor(max_workers=cpu_count()) as executor:
-                try:
-                    dfs = list(executor.map(TripContainer.process_chunk, chunks))
-                except KeyboardInterrupt as e:
-                    executor.shutdown(wait=False, cancel_futures=True)
-                    raise e
-            self._df = pl.concat(dfs, rechunk=True)
-            
-
+            logger.debug(f"Creating DataFrame from {len(self.trips)} Trips...")
+            self._df = self.trips_to_df(self.trips)
             logger.debug(f"DataFrame created with {self._df.height} rows and {self._df.width} columns")
         return self._df
     
     @df.setter
-    def df(self, value) -> dict[Trip, int]:
+    def df(self, value):
         if not isinstance(value, pl.DataFrame):
-            raise TypeError("The df property can only be set to lists of Trips!")
+            raise TypeError("The df property can only be set to a DataFrame!")
         self._trips = None
         self._df = value
         self._dict = None
+        self._pairs = None
 
     @property
-    def dictionary(self):
+    def dictionary(self) -> dict[Trip, int]:
         if self._dict is None:
-            self._dict = {}
-            for trip in tqdm.tqdm(self.trips, desc="Making Dict", total=len(self.trips), unit="trips"):
-                if self._dict.get(trip, None) is None:
-                    self._dict[trip] = 1
-                else:
-                    self._dict[trip] += 1
+            if self._trips is None and self._df is not None:
+                # Only one Trip per distinct row is created, the DataFrame does the counting
+                counts = self._df.group_by(self._df.columns, maintain_order=True).len(name="_count")
+                self._dict = {
+                    Trip.from_dict(row, self.locations): row["_count"]
+                    for row in counts.iter_rows(named=True)
+                }
+            else:
+                self._dict = {}
+                for trip in tqdm.tqdm(self.trips, desc="Making Dict", total=len(self.trips), unit="trips"):
+                    if self._dict.get(trip, None) is None:
+                        self._dict[trip] = 1
+                    else:
+                        self._dict[trip] += 1
         return self._dict
     
     @dictionary.setter
     def dictionary(self, value):
-        if not isinstance(value, pl.DataFrame):
-            raise TypeError("The dictionary property can only be set to lists of Trips!")
-        for _key, _ in self._dict.items():
+        if not isinstance(value, dict):
+            raise TypeError("The dictionary property can only be set to a dictionary of Trips!")
+        for _key, _ in value.items():
             if not isinstance(_key, Trip):
                 raise TypeError(f"The key is of type {type(_key)} and not Trip!")
         self._trips = None
         self._df = None
         self._dict = value
-        
+        self._pairs = None
+
+    def relative_pairs(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Distinct origin-destination pairs of location indices and their share of all trips."""
+        origins, destinations, counts = self.pair_counts()
+        return origins, destinations, counts / len(self)
+
+    def relative_ids(self) -> pl.DataFrame:
+        """Share of all trips per distinct (start_id, end_id) pair, which works without a LocationContainer."""
+        return self.df.group_by("start_id", "end_id").agg((pl.len() / len(self)).alias("share"))
+
     def as_relative(self) -> dict[Trip, float]:
         relative_trips = { }
+        total = len(self)
         for key, value in tqdm.tqdm(self.dictionary.items(), desc="Making relative trip dict", total=len(self.dictionary), unit="entry(ies)"):
-            relative_trips[key] = value / len(self)
+            relative_trips[key] = value / total
         return relative_trips
       
     def to_csv(self, filename: Path):
-        self.df.write_csv(filename)
+        write_frame(self.df, filename, FileFormat.CSV)
+
+    def to_parquet(self, filename: Path):
+        write_frame(self.df, filename, FileFormat.PARQUET)
+
+    def to_ipc(self, filename: Path):
+        write_frame(self.df, filename, FileFormat.IPC)
+
+    def to_file(self, filename: Path):
+        """Writes the trips in the format given by the file extension."""
+        write_frame(self.df, filename)
     
     @staticmethod
     def from_csv(filename: Path):
-        df = pl.read_csv(filename, schema=Trip.TRIP_SCHEMA)
-        trips = []
-        for row in tqdm.tqdm(df.iter_rows(named=True), desc="Loading Trips", total=df.height, unit="row(s)"):
-            trips.append(Trip.from_dict(row))
-        tc = TripContainer(trips)
-        tc._df = df
-        return tc
+        return TripContainer(read_frame(filename, schema=Trip.TRIP_SCHEMA, sidecar=False, file_type=FileFormat.CSV))
+
+    @staticmethod
+    def from_parquet(filename: Path):
+        return TripContainer(read_frame(filename, schema=Trip.TRIP_SCHEMA, file_type=FileFormat.PARQUET))
+
+    @staticmethod
+    def from_ipc(filename: Path):
+        return TripContainer(read_frame(filename, schema=Trip.TRIP_SCHEMA, file_type=FileFormat.IPC))
+
+    @staticmethod
+    def from_file(filename: Path, sidecar: bool = True, locations: LocationContainer = None):
+        """Reads trips in the format given by the file extension, large csv files are cached as binary sidecar."""
+        return TripContainer(read_frame(filename, schema=Trip.TRIP_SCHEMA, sidecar=sidecar), locations)
 
     def __len__(self):
-        if self._trips is not None:
-            return len(self.trips)
         if self._df is not None:
-            return self.df.height
-        if self._dictionary is not None:
-            return len(self.dictionary)
+            return self._df.height
+        if self._trips is not None:
+            return len(self._trips)
+        if self._dict is not None:
+            return sum(self._dict.values())
         return 0 
     
     def __getitem__(self, item):
@@ -257,8 +403,191 @@ class TripContainer:
             raise KeyError("TripContainer elements need to be accessed using index!")
         return self.trips[item]
 
+class TripCounts:
+    """
+    Compact trip container that stores how many trips each origin-destination pair got instead of the trips themselves.
+    Pairs are given as location indices into the LocationContainer, together with their distance in kilometers.
+    Counts may be fractional, e.g. when they hold the expected share of trips instead of a sample.
+    Optionally the histogram bin of every pair can be passed in, so it does not need to be recalculated.
+    """
+
+    def __init__(self, locations: LocationContainer, origins: np.ndarray, destinations: np.ndarray, distances: np.ndarray, counts: np.ndarray, bins: np.ndarray = None):
+        if not (len(origins) == len(destinations) == len(distances) == len(counts)):
+            raise ValueError("TripCounts needs origins, destinations, distances and counts of the same length!")
+        self.locations = locations
+        self.origins = origins
+        self.destinations = destinations
+        self.distances = distances
+        self.counts = counts
+        self.bins = bins
+        self._dict = None
+
+    @property
+    def total(self):
+        return self.counts.sum()
+
+    @property
+    def dictionary(self) -> dict[Trip, int]:
+        if self._dict is None:
+            location = self.locations.location
+            self._dict = {
+                Trip(location(origin), location(destination), kilometers): count
+                for origin, destination, kilometers, count in zip(
+                    self.origins.tolist(), self.destinations.tolist(), self.distances.tolist(), self.counts.tolist()
+                )
+                if count > 0
+            }
+        return self._dict
+
+    def pair_counts(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Origin-destination pairs of location indices that got trips and their counts."""
+        got_trips = self.counts > 0
+        return self.origins[got_trips], self.destinations[got_trips], self.counts[got_trips]
+
+    def relative_pairs(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Origin-destination pairs of location indices that got trips and their share of all trips."""
+        origins, destinations, counts = self.pair_counts()
+        return origins, destinations, counts / self.total
+
+    def relative_ids(self) -> pl.DataFrame:
+        """Share of all trips per (start_id, end_id) pair that got trips."""
+        origins, destinations, shares = self.relative_pairs()
+        ids = pl.Series(self.locations.ids, dtype=pl.String)
+        return pl.DataFrame({"start_id": ids.gather(origins), "end_id": ids.gather(destinations), "share": shares})
+
+    def as_relative(self) -> dict[Trip, float]:
+        total = self.total
+        return {trip: count / total for trip, count in self.dictionary.items()}
+
+    def __len__(self):
+        return int(self.total)
+
 class TripLoader:
 
+    @staticmethod
+    def assign_trips(loc_assigner: BaseLocationAssigner, tripsDf: pl.DataFrame, trips_schema: dict[str, str], keep_distance: bool = False, min_distance: float = 0.0) -> pl.DataFrame:
+        """
+        Converts a DataFrame of raw trips into the trip schema in one batch: all start and end coordinates are assigned
+        with two array calls, trips that could not be assigned or are shorter than min_distance are masked out and
+        every remaining trip is repeated by its frequency.
+        """
+        start_lat, start_long, end_lat, end_long, num = trips_schema.get("start_lat"), trips_schema.get("start_long"), trips_schema.get("stop_lat"), trips_schema.get("stop_long"), trips_schema.get("number")
+        locations = loc_assigner.locations
+
+        start_lats, start_longs = tripsDf.get_column(start_lat).to_numpy(), tripsDf.get_column(start_long).to_numpy()
+        end_lats, end_longs = tripsDf.get_column(end_lat).to_numpy(), tripsDf.get_column(end_long).to_numpy()
+        starts = loc_assigner.check_many(start_lats, start_longs)
+        ends = loc_assigner.check_many(end_lats, end_longs)
+
+        assigned = (starts != UNASSIGNED) & (ends != UNASSIGNED)
+        if keep_distance:
+            distances = np.full(len(starts), np.nan)
+            distances[assigned] = geodesic(start_lats[assigned], start_longs[assigned], end_lats[assigned], end_longs[assigned])
+        else:
+            distances = np.full(len(starts), np.nan)
+            distances[assigned] = locations.distance_matrix()[starts[assigned], ends[assigned]]
+        keep = assigned & (distances >= min_distance)
+
+        # Every raw trip is repeated by its frequency, as index gather into the kept rows
+        rows = np.repeat(np.nonzero(keep)[0], tripsDf.get_column(num).to_numpy()[keep])
+        df = TripContainer.pairs_to_df(locations, starts[rows], ends[rows], distances[rows])
+        if keep_distance:
+            df = df.with_columns(
+                pl.Series("start_lat", start_lats[rows], dtype=pl.Float64),
+                pl.Series("start_long", start_longs[rows], dtype=pl.Float64),
+                pl.Series("end_lat", end_lats[rows], dtype=pl.Float64),
+                pl.Series("end_long", end_longs[rows], dtype=pl.Float64)
+            )
+        return df
+
+    @staticmethod
+    def raw_schema(trips_schema: dict[str, str]) -> dict[str, pl.DataType]:
+        """Types of the raw columns we need, so polars neither reads other columns nor scans the file to infer types."""
+        return {
+            trips_schema.get("start_lat"): pl.Float64,
+            trips_schema.get("start_long"): pl.Float64,
+            trips_schema.get("stop_lat"): pl.Float64,
+            trips_schema.get("stop_long"): pl.Float64,
+            trips_schema.get("number"): pl.Int64
+        }
+
+    @staticmethod
+    def read_batches(trips: Path, trips_schema: dict[str, str], batch_size: int) -> Iterator[pl.DataFrame]:
+        """Reads the raw trips in chunks of roughly batch_size rows."""
+        schema = TripLoader.raw_schema(trips_schema)
+        columns = list(schema.keys())
+        file_type = file_format(trips)
+        if file_type is FileFormat.PARQUET:
+            # Slices are pushed down into the parquet reader, so only the required row groups are read
+            total = pl.scan_parquet(trips).select(pl.len()).collect().item()
+            for offset in range(0, total, batch_size):
+                yield pl.scan_parquet(trips).select(columns).slice(offset, batch_size).collect().cast(schema)
+            return
+        if file_type is FileFormat.IPC:
+            # IPC files are memory-mapped, slicing them does not copy anything
+            df = pl.read_ipc(trips, columns=columns, memory_map=True)
+            for offset in range(0, df.height, batch_size):
+                yield df.slice(offset, batch_size).cast(schema)
+            return
+        reader = pl.read_csv_batched(trips, columns=columns, schema_overrides=schema, batch_size=batch_size)
+        pending, rows = [], 0
+        while (batches := reader.next_batches(1)):
+            pending.extend(batches)
+            rows += sum(batch.height for batch in batches)
+            if rows >= batch_size:
+                yield pl.concat(pending)
+                pending, rows = [], 0
+        if pending:
+            yield pl.concat(pending)
+
+    @staticmethod
+    def stream_trips(loc_assigner: BaseLocationAssigner, trips: Path | str, trips_schema: dict[str, str], output: Path | str, keep_distance: bool = False, min_distance: float = 0.0, batch_size: int = 1_000_000, silent: bool = False) -> tuple[int, float]:
+        """
+        Converts the raw trips chunk by chunk and writes every converted chunk out immediately, so memory stays bounded
+        by the batch size. The next chunk is read on a background thread while the current one is assigned.
+        Csv output is appended to directly, other formats are written as IPC parts that are streamed into the output at the end.
+        Returns the number of trips written and the shortest distance among them.
+        """
+        if isinstance(trips, str):
+            trips = Path(trips)
+        if isinstance(output, str):
+            output = Path(output)
+        output_type = file_format(output)
+
+        written, shortest = 0, float("inf")
+        batches = TripLoader.read_batches(trips, trips_schema, batch_size)
+        # Only the binary formats are written as parts first, they need a directory to keep them in until the end
+        with ThreadPoolExecutor(max_workers=1) as reader, (nullcontext() if output_type is FileFormat.CSV else TemporaryDirectory(dir=output.parent)) as parts_directory:
+            parts: list[Path] = []
+            f = output.open("w") if output_type is FileFormat.CSV else None
+            try:
+                if f is not None:
+                    pl.DataFrame(schema=Trip.TRIP_SCHEMA).write_csv(f)
+                upcoming = reader.submit(next, batches, None)
+                while (tripsDf := upcoming.result()) is not None:
+                    upcoming = reader.submit(next, batches, None)
+                    df = TripLoader.assign_trips(loc_assigner, tripsDf, trips_schema, keep_distance=keep_distance, min_distance=min_distance)
+                    if f is not None:
+                        df.write_csv(f, include_header=False)
+                    else:
+                        parts.append(Path(parts_directory).joinpath(f"{len(parts)}.arrow"))
+                        df.write_ipc(parts[-1])
+                    written += df.height
+                    if df.height > 0:
+                        shortest = min(shortest, df.get_column("distance").min())
+                    if not silent:
+                        logger.info(f"Converted {tripsDf.height} rows into {df.height} trips ({written} written)")
+            finally:
+                if f is not None:
+                    f.close()
+            if f is None:
+                combined = pl.scan_ipc(parts) if parts else pl.LazyFrame(schema=Trip.TRIP_SCHEMA)
+                if output_type is FileFormat.PARQUET:
+                    combined.sink_parquet(output)
+                else:
+                    combined.sink_ipc(output, compression="uncompressed")
+        return written, shortest
+
     @staticmethod
     def load_trips(loc_assigner: BaseLocationAssigner, trips: Path | str, trips_schema: dict[str, str], keep_distance: bool = False, min_distance: float = 0.0, silent: bool = False) -> TripContainer:
         if isinstance(trips, str):
@@ -268,25 +597,12 @@ class TripLoader:
             logger.info("Will keep start and end coordinates of trips that will be mapped")
         logger.info(f"Minimum distance set to {min_distance}")
 
-        start_lat, start_long, end_lat, end_long, num = trips_schema.get("start_lat"), trips_schema.get("start_long"), trips_schema.get("stop_lat"), trips_schema.get("stop_long"), trips_schema.get("number") 
-        
-        tripsDf = pl.read_csv(trips, infer_schema_length=None)
-
-        trips_list = []
-        for row in tqdm.tqdm(tripsDf.iter_rows(named=True), desc="Loading trips", total=tripsDf.height, disable=silent):
-            start = loc_assigner.check((row[start_lat], row[start_long]))
-            end = loc_assigner.check((row[end_lat], row[end_long]))
-            if keep_distance:
-                start = start.get_copy()
-                end = end.get_copy()
-                start.coordinates = (row[start_lat], row[start_long])
-                end.coordinates = (row[end_lat], row[end_long])
-            if start is None or end is None:
-                continue
-            new_trip = Trip(start, end)
-            if new_trip.distance.km < min_distance:
-                continue
-            for _ in range(row[num]):
-                trips_list.append(new_trip.make_copy())
-        return TripContainer(trips_list)
-    
+        schema = TripLoader.raw_schema(trips_schema)
+        if file_format(trips) is FileFormat.CSV:
+            tripsDf = pl.read_csv(trips, columns=list(schema.keys()), schema_overrides=schema)
+        else:
+            tripsDf = read_frame(trips).select(schema.keys()).cast(schema)
+        df = TripLoader.assign_trips(loc_assigner, tripsDf, trips_schema, keep_distance=keep_distance, min_distance=min_distance)
+        if not silent:
+            logger.info(f"Loaded {df.height} trips from {tripsDf.height} rows")
+        return TripContainer(df, loc_assigner.locations)
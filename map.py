@@ -11,6 +11,7 @@ from scipy.interpolate import griddata
 from scipy.ndimage import minimum_filter
 
 from gravity_model.log import logger
+from gravity_model.search.generic import read_parameter_map
 
 @click.command()
 @click.argument("heatmap_output", metavar="[Metric Heatmap Output]", type=click.Path(dir_okay=True, path_type=Path))
@@ -25,7 +26,7 @@ def main(heatmap_output: Path, metric_map_data: Iterable[Path], parameter: Itera
     
     for metric_map_file in metric_map_data:
         logger.info(f"Loading metric mapping data from {metric_map_file.absolute().as_posix()}")
-        temporary_df = pl.read_csv(metric_map_file, schema=metric_map_schema, has_header=True)
+        temporary_df = read_parameter_map(metric_map_file, columns)
         metric_map_df = pl.concat([metric_map_df, temporary_df], rechunk=True, how="vertical")
     metric_map_df = metric_map_df.group_by(parameter).mean()
     logger.info(f"Successfully loaded {len(metric_map_data)} metric mapping files.")
@@ -16,7 +16,7 @@ def main(boundary_data: Path, population_data: Path, location_data: Path):
                               {"index": "LAD24CD", "name": "LAD24NM", "lat": "LAT", "long": "LONG", "area": "Shape__Area"},
                               {"index": "Code", "population": "Population"})
     logger.info(f"Writing resulting location information to {location_data.absolute().as_posix()}")
-    locs.to_csv(location_data)
+    locs.to_file(location_data)
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
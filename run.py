@@ -4,7 +4,7 @@ from pathlib import Path
 import click
 
 from gravity_model.log import logger
-from gravity_model.models.loader import model_from_json
+from gravity_model.models.loader import load_model
 
 @click.command()
 @click.argument("model_location", metavar="[Model]", type=click.Path(exists=True, readable=True, dir_okay=False, path_type=Path))
@@ -12,13 +12,13 @@ from gravity_model.models.loader import model_from_json
 @click.argument("number", metavar="[Number Runs]", type=int)
 def main(model_location: Path, trip_output: Path, number: int):
     logger.info(f"Loading model from {model_location.absolute().as_posix()}")
-    model = model_from_json(model_location)
+    model = load_model(model_location)
 
     logger.info(f"Executing {number} trips...")
     trips = model.make_trips(number)
     
     logger.info(f"Saving results to {trip_output.absolute().as_posix()}")
-    trips.to_csv(trip_output)
+    trips.to_file(trip_output)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,27 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from gravity_model import cache
+from gravity_model.location import Location, LocationContainer
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+    """Every test gets its own cache directory, so cached distances, grids or sidecars never leak between tests."""
+    directory = tmp_path.joinpath("cache")
+    monkeypatch.setattr(cache, "CACHE_DIRECTORY", directory)
+    return directory
+
+@pytest.fixture
+def locations() -> LocationContainer:
+    """40 locations scattered over Great Britain with random areas and populations."""
+    rng = np.random.default_rng(7)
+    n = 40
+    return LocationContainer(df=pl.DataFrame({
+        "name": [f"Location {i}" for i in range(n)],
+        "id": [f"L{i:02d}" for i in range(n)],
+        "lat": rng.uniform(50.0, 58.0, n),
+        "long": rng.uniform(-5.0, 1.5, n),
+        "area": rng.uniform(50.0, 1500.0, n),
+        "population": rng.integers(10_000, 2_000_000, n),
+    }, schema=Location.LOCATION_SCHEMA))
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from gravity_model.distance import UNASSIGNED, BallTreeLocationAssigner, CachedLocationAssigner, CircleLocationAssigner
+from gravity_model.location import LocationContainer
+
+class CountingAssigner(CircleLocationAssigner):
+    """Remembers how many coordinates it was asked to assign."""
+
+    def __init__(self, locations: LocationContainer):
+        super().__init__(locations)
+        self.assigned = 0
+
+    def check_many(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        self.assigned += len(latitudes)
+        return super().check_many(latitudes, longitudes)
+
+def towers(n: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Coordinates of n celltowers."""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(50.0, 58.0, n), rng.uniform(-5.0, 1.5, n)
+
+def parts(cache_directory) -> list:
+    return sorted(cache_directory.joinpath("assignments").glob("*/*.arrow"))
+
+def test_cache_matches_wrapped_assigner(locations: LocationContainer):
+    exact = CircleLocationAssigner(locations)
+    cached = CachedLocationAssigner(CountingAssigner(locations))
+    latitudes, longitudes = towers(500, 1)
+    # Trip endpoints repeat the same towers, each one is only assigned once
+    repeated = np.random.default_rng(2).integers(0, 500, 5_000)
+    indices = cached.check_many(latitudes[repeated], longitudes[repeated])
+    assert indices.tolist() == exact.check_many(latitudes[repeated], longitudes[repeated]).tolist()
+    assert UNASSIGNED in indices.tolist()
+    assert cached.assigner.assigned == len(np.unique(repeated))
+    cached.check_many(latitudes, longitudes)
+    assert cached.assigner.assigned == 500
+
+def test_cache_is_persisted_in_parts(locations: LocationContainer, cache_directory):
+    latitudes, longitudes = towers(300, 3)
+    first = CachedLocationAssigner(CountingAssigner(locations))
+    expected = first.check_many(latitudes, longitudes)
+    first.check_many(latitudes[:100], longitudes[:100])
+    assert len(parts(cache_directory)) == 1
+
+    # A later run only assigns the towers it has not seen yet, and only appends those
+    later_latitudes, later_longitudes = towers(50, 4)
+    later = CachedLocationAssigner(CountingAssigner(locations))
+    assert later.check_many(latitudes, longitudes).tolist() == expected.tolist()
+    assert later.assigner.assigned == 0
+    later.check_many(np.concatenate((latitudes, later_latitudes)), np.concatenate((longitudes, later_longitudes)))
+    assert later.assigner.assigned == 50
+    assert len(parts(cache_directory)) == 2
+    assert CachedLocationAssigner(CountingAssigner(locations)).table.height == 350
+
+    # Another assigner has its own cache
+    CachedLocationAssigner(BallTreeLocationAssigner(locations)).check_many(latitudes, longitudes)
+    assert len(parts(cache_directory)) == 3
+
+def test_parts_are_merged(locations: LocationContainer, cache_directory, monkeypatch):
+    monkeypatch.setattr(CachedLocationAssigner, "MAXIMUM_PARTS", 3)
+    latitudes, longitudes = towers(100, 5)
+    cached = CachedLocationAssigner(CountingAssigner(locations))
+    for start in range(0, 100, 20):
+        cached.check_many(latitudes[start:start + 20], longitudes[start:start + 20])
+    assert len(parts(cache_directory)) == 5
+    merged = CachedLocationAssigner(CountingAssigner(locations))
+    assert len(parts(cache_directory)) == 1
+    assert merged.check_many(latitudes, longitudes).tolist() == cached.check_many(latitudes, longitudes).tolist()
+    assert merged.assigner.assigned == 0
+    # New assignments are appended after the merged part
+    merged.check_many(*towers(10, 6))
+    assert len(parts(cache_directory)) == 2
+    assert CachedLocationAssigner(CountingAssigner(locations)).table.height == 110
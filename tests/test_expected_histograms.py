@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from gravity_model.location import LocationContainer
+from gravity_model.models.basic import GravityModel
+from gravity_model.models.doublepower import DoublePowerGravityModel
+from gravity_model.models.tripleexpo import TripleExponentialGravityModel
+from gravity_model.models.split import SplitGravityModel
+from gravity_model.training import Distribution
+
+# Models with the parameter sets they are evaluated with, including extreme ones whose gravities under- or overflow
+CANDIDATES = [
+    (GravityModel, [{}, {}]),
+    (DoublePowerGravityModel, [{"alpha": alpha, "beta": beta} for alpha in (0.5, 1.5, 3.0) for beta in (0.2, 1.0, 2.0)]),
+    (TripleExponentialGravityModel, [{"alpha": 0.01, "beta": 1e-6, "gamma": 2e-6}, {"alpha": 0.5, "beta": 1e-3, "gamma": 1e-3}, {"alpha": 1e-4, "beta": 0.0, "gamma": 0.0}]),
+    (SplitGravityModel, [{"alpha": 1.0, "beta": 2.0, "gamma": gamma} for gamma in (150, 400, 1000)]),
+]
+
+def assert_same_distribution(actual: Distribution, expected: Distribution):
+    assert [label for label, _ in actual.histogram] == [label for label, _ in expected.histogram]
+    np.testing.assert_allclose([share for _, share in actual.histogram], [share for _, share in expected.histogram], rtol=1e-9, atol=1e-15)
+    np.testing.assert_allclose([share for _, share in actual.ccdf], [share for _, share in expected.ccdf], rtol=1e-9, atol=1e-15)
+
+@pytest.mark.parametrize("model_class, candidates", CANDIDATES, ids=[model.TYPE for model, _ in CANDIDATES])
+@pytest.mark.parametrize("memory_budget", [None, 1], ids=["default budget", "one set per chunk"])
+def test_expected_histograms_match_expected_trip_counts(locations: LocationContainer, model_class, candidates, memory_budget):
+    model = model_class(locations)
+    initial = dict(model.parameters)
+    histograms = model.expected_histograms(candidates) if memory_budget is None else model.expected_histograms(candidates, memory_budget)
+    assert histograms.shape[0] == len(candidates)
+    # The batch leaves the model as it was
+    assert model.parameters == initial
+
+    for parameters, sums in zip(candidates, histograms):
+        for name, value in parameters.items():
+            setattr(model, name, value)
+        model.recreate_matrix()
+        assert_same_distribution(Distribution.from_bin_sums(sums), Distribution(model.expected_trip_counts()))
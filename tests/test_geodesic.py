@@ -0,0 +1,40 @@
+import numpy as np
+from geopy.distance import distance
+
+from gravity_model.geodesic import geodesic, pairwise_geodesic
+from gravity_model.location import LocationContainer
+
+# Largest difference to geopy we accept, in kilometers
+TOLERANCE = 1e-6
+
+def geopy_distances(lat_a, long_a, lat_b, long_b) -> np.ndarray:
+    return np.array([distance((a, b), (c, d)).kilometers for a, b, c, d in zip(lat_a, long_a, lat_b, long_b)])
+
+def test_geodesic_matches_geopy():
+    rng = np.random.default_rng(0)
+    lat_a, lat_b = rng.uniform(-89, 89, (2, 500))
+    long_a, long_b = rng.uniform(-180, 180, (2, 500))
+    np.testing.assert_allclose(geodesic(lat_a, long_a, lat_b, long_b), geopy_distances(lat_a, long_a, lat_b, long_b), rtol=0, atol=TOLERANCE)
+
+def test_geodesic_special_cases():
+    # Coincident, equatorial, meridional, across the antimeridian and nearly antipodal (geopy fallback) pairs
+    lat_a = np.array([51.5, 0.0, 10.0, 20.0, 0.0, 0.5])
+    long_a = np.array([-0.1, 10.0, 30.0, 179.9, 0.0, 0.0])
+    lat_b = np.array([51.5, 0.0, -40.0, 20.0, 0.5, -0.5])
+    long_b = np.array([-0.1, 50.0, 30.0, -179.9, 179.7, 179.8])
+    np.testing.assert_allclose(geodesic(lat_a, long_a, lat_b, long_b), geopy_distances(lat_a, long_a, lat_b, long_b), rtol=0, atol=TOLERANCE)
+
+def test_pairwise_geodesic_matches_geopy(locations: LocationContainer):
+    latitudes, longitudes = locations.latitudes, locations.longitudes
+    matrix = pairwise_geodesic(latitudes, longitudes)
+    origins, destinations = np.meshgrid(np.arange(len(locations)), np.arange(len(locations)), indexing="ij")
+    expected = geopy_distances(latitudes[origins.ravel()], longitudes[origins.ravel()], latitudes[destinations.ravel()], longitudes[destinations.ravel()])
+    np.testing.assert_allclose(matrix.ravel(), expected, rtol=0, atol=TOLERANCE)
+
+def test_distance_matrix_is_cached(locations: LocationContainer, cache_directory):
+    matrix = locations.distance_matrix()
+    assert len(list(cache_directory.joinpath("distances").glob("*.npy"))) == 1
+    # A new container of the same dataset reads the matrix from the cache instead of calculating it
+    cached = LocationContainer(df=locations.df).distance_matrix()
+    assert isinstance(cached, np.memmap)
+    np.testing.assert_array_equal(cached, matrix)
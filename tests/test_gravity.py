@@ -0,0 +1,62 @@
+from math import exp
+
+import numpy as np
+import pytest
+
+from gravity_model.location import LocationContainer
+from gravity_model.models.basic import GravityModel
+from gravity_model.models.power import PowerGravityModel
+from gravity_model.models.doublepower import DoublePowerGravityModel
+from gravity_model.models.triplepower import TriplePowerGravityModel
+from gravity_model.models.expo import ExponentialGravityModel
+from gravity_model.models.doubleexpo import DoubleExponentialGravityModel
+from gravity_model.models.tripleexpo import TripleExponentialGravityModel
+from gravity_model.models.expower import ExponentialPowerGravityModel
+from gravity_model.models.split import SplitGravityModel
+from gravity_model.sampling import PairSampler
+
+# The scalar gravity functions the array kernels replaced, as (model, parameters, gravity of (pop_a, pop_b, km, p))
+SCALAR_MODELS = [
+    (GravityModel, {}, lambda a, b, d, p: (a * b) / d),
+    (PowerGravityModel, {"alpha": 1.3}, lambda a, b, d, p: (a * b) / (d ** p["alpha"])),
+    (DoublePowerGravityModel, {"alpha": 1.3, "beta": 0.8}, lambda a, b, d, p: ((a ** p["beta"]) * (b ** p["beta"])) / (d ** p["alpha"])),
+    (TriplePowerGravityModel, {"alpha": 1.3, "beta": 0.8, "gamma": 1.1}, lambda a, b, d, p: ((a ** p["beta"]) * (b ** p["gamma"])) / (d ** p["alpha"])),
+    (ExponentialGravityModel, {"alpha": 0.004}, lambda a, b, d, p: (a * b) * exp(-p["alpha"] * d)),
+    (DoubleExponentialGravityModel, {"alpha": 0.004, "beta": 2e-7}, lambda a, b, d, p: exp(p["beta"] * a) * exp(p["beta"] * b) * exp(-p["alpha"] * d)),
+    (TripleExponentialGravityModel, {"alpha": 0.004, "beta": 2e-7, "gamma": 3e-7}, lambda a, b, d, p: exp(p["beta"] * a) * exp(p["gamma"] * b) * exp(-p["alpha"] * d)),
+    (ExponentialPowerGravityModel, {"alpha": 1.2, "beta": 0.002}, lambda a, b, d, p: (a * b) * (1 / (d ** p["alpha"])) * exp(-p["beta"] * d)),
+    (SplitGravityModel, {"alpha": 1.2, "beta": 2.1, "gamma": 400}, lambda a, b, d, p: (a * b) / (d ** (p["alpha"] if d < p["gamma"] else p["beta"]))),
+]
+
+def scalar_gravities(model: GravityModel, gravity, parameters: dict[str, float]) -> np.ndarray:
+    return np.array([
+        gravity(float(a), float(b), float(d), parameters)
+        for a, b, d in zip(model.origin_populations, model.destination_populations, model.distances)
+    ])
+
+@pytest.mark.parametrize("model_class, parameters, gravity", SCALAR_MODELS, ids=[model.TYPE for model, _, _ in SCALAR_MODELS])
+def test_gravities_match_scalar_formula(locations: LocationContainer, model_class, parameters, gravity):
+    model = model_class(locations, **parameters)
+    expected = scalar_gravities(model, gravity, parameters)
+    # The gravities are stored relative to the largest one
+    np.testing.assert_allclose(model.gravities * np.exp(model.log_scale), expected, rtol=1e-12)
+    assert model.total_gravity == pytest.approx(expected.sum() / np.exp(model.log_scale), rel=1e-12)
+    for trip in model.all_trips[:20]:
+        assert model.gravity(trip) == pytest.approx(gravity(trip.home.population, trip.target.population, trip.distance.kilometers, parameters), rel=1e-12)
+
+@pytest.mark.parametrize("model_class, parameters, gravity", SCALAR_MODELS, ids=[model.TYPE for model, _, _ in SCALAR_MODELS])
+def test_sampler_follows_scalar_gravities(locations: LocationContainer, model_class, parameters, gravity):
+    model = model_class(locations, **parameters)
+    expected = scalar_gravities(model, gravity, parameters)
+    probabilities = np.diff(model.sampler.cdf, prepend=0.0)
+    np.testing.assert_allclose(probabilities, expected / expected.sum(), rtol=1e-9, atol=1e-15)
+
+@pytest.mark.parametrize("n", [100, 5_000])
+def test_sampler_counts_match_samples(n: int):
+    # Fewer and more uniforms than weights take the two different paths of counts
+    weights = np.random.default_rng(3).pareto(1.5, 1_000)
+    sampler = PairSampler(weights)
+    samples = sampler.sample(n, np.random.default_rng(4))
+    counts = sampler.counts(np.sort(np.random.default_rng(4).random(n)))
+    np.testing.assert_array_equal(counts, np.bincount(samples, minlength=len(weights)))
+    assert counts.sum() == n
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from gravity_model.distance import GRID_FALLBACK, UNASSIGNED, BallTreeLocationAssigner, BeeLineLocationAssigner, CachedLocationAssigner, CircleLocationAssigner, GridLocationAssigner
+from gravity_model.location import LocationContainer
+
+# A coarse raster keeps building it cheap, the boundary cells are still resolved by the exact assigner
+EXTENT = (-6.0, 2.5, 49.5, 58.5)
+RESOLUTION = 0.05
+
+def random_coordinates(n: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    # Mostly inside the raster, some outside of it, which are passed on to the exact assigner
+    return rng.uniform(48.0, 60.0, n), rng.uniform(-8.0, 4.0, n)
+
+@pytest.mark.parametrize("exact_class", [BallTreeLocationAssigner, BeeLineLocationAssigner], ids=["BALLTREE", "BEELINE"])
+def test_grid_agrees_with_exact_assigner(locations: LocationContainer, exact_class):
+    exact = exact_class(locations)
+    grid = GridLocationAssigner(exact, extent=EXTENT, resolution=RESOLUTION)
+    # Most coordinates are answered by the raster itself, not by the fallback
+    assert np.mean(grid.cells == GRID_FALLBACK) < 0.25
+    latitudes, longitudes = random_coordinates(200_000, 1)
+    np.testing.assert_array_equal(grid.check_many(latitudes, longitudes), exact.check_many(latitudes, longitudes))
+
+def test_grid_agrees_near_cell_corners(locations: LocationContainer):
+    exact = BallTreeLocationAssigner(locations)
+    grid = GridLocationAssigner(exact, extent=EXTENT, resolution=RESOLUTION)
+    # Coordinates on and right next to the raster lines, where rounding decides the cell
+    rng = np.random.default_rng(2)
+    rows, columns = rng.integers(0, grid.rows + 1, (2, 50_000))
+    offsets = rng.choice([-1e-12, 0.0, 1e-12], (2, 50_000))
+    latitudes = EXTENT[2] + rows * RESOLUTION + offsets[0]
+    longitudes = EXTENT[0] + columns * RESOLUTION + offsets[1]
+    np.testing.assert_array_equal(grid.check_many(latitudes, longitudes), exact.check_many(latitudes, longitudes))
+
+def test_grid_is_cached(locations: LocationContainer, cache_directory):
+    exact = BallTreeLocationAssigner(locations)
+    grid = GridLocationAssigner(exact, extent=EXTENT, resolution=RESOLUTION)
+    assert len(list(cache_directory.joinpath("grids").glob("*.npy"))) == 1
+    cached = GridLocationAssigner(exact, extent=EXTENT, resolution=RESOLUTION)
+    assert isinstance(cached.cells, np.memmap)
+    np.testing.assert_array_equal(cached.cells, grid.cells)
+    # A different raster layout is a different cache entry
+    GridLocationAssigner(exact, extent=EXTENT, resolution=RESOLUTION * 2)
+    assert len(list(cache_directory.joinpath("grids").glob("*.npy"))) == 2
+
+def test_grid_check_matches_check_many(locations: LocationContainer):
+    grid = GridLocationAssigner(BallTreeLocationAssigner(locations), extent=EXTENT, resolution=RESOLUTION)
+    latitudes, longitudes = random_coordinates(100, 3)
+    indices = grid.check_many(latitudes, longitudes)
+    assert (indices != UNASSIGNED).all()
+    assert [grid.check((lat, long)).index for lat, long in zip(latitudes, longitudes)] == indices.tolist()
+
+def test_grid_needs_convex_regions(locations: LocationContainer):
+    # A circle smaller than a cell that touches none of its corners would be missed by the raster
+    with pytest.raises(ValueError, match="convex"):
+        GridLocationAssigner(CircleLocationAssigner(locations), extent=EXTENT, resolution=RESOLUTION)
+    with pytest.raises(ValueError, match="convex"):
+        GridLocationAssigner(CachedLocationAssigner(CircleLocationAssigner(locations)), extent=EXTENT, resolution=RESOLUTION)
+    GridLocationAssigner(CachedLocationAssigner(BallTreeLocationAssigner(locations)), extent=EXTENT, resolution=RESOLUTION)
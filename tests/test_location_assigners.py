@@ -0,0 +1,77 @@
+import math
+
+import numpy as np
+import pytest
+from geopy.distance import distance, great_circle
+
+from gravity_model.distance import UNASSIGNED, BallTreeLocationAssigner, BaseLocationAssigner, BeeLineLocationAssigner, CircleLocationAssigner
+from gravity_model.location import Location, LocationContainer
+
+def brute_force_nearest(locations: LocationContainer, latitudes: np.ndarray, longitudes: np.ndarray, metric) -> list[int]:
+    """Index of the nearest location by the given geopy distance, the lowest index wins ties."""
+    indices = []
+    for coordinates in zip(latitudes.tolist(), longitudes.tolist()):
+        distances = [metric(locations.location(index).coordinates, coordinates).km for index in range(len(locations))]
+        indices.append(int(np.argmin(distances)))
+    return indices
+
+def brute_force_circles(locations: LocationContainer, latitudes: np.ndarray, longitudes: np.ndarray) -> list[int]:
+    """The linear scan the spatial index replaced: the nearest location whose circle contains the coordinates."""
+    indices = []
+    for coordinates in zip(latitudes.tolist(), longitudes.tolist()):
+        nearest, shortest = UNASSIGNED, None
+        for index in range(len(locations)):
+            location = locations.location(index)
+            current = distance(location.coordinates, coordinates)
+            if current.km < math.sqrt(location.area / math.pi) and (shortest is None or current < shortest):
+                nearest, shortest = index, current
+        indices.append(nearest)
+    return indices
+
+def coordinates_near_locations(locations: LocationContainer, n: int, spread: float, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Coordinates scattered around random locations, so that many of them fall into their circles."""
+    rng = np.random.default_rng(seed)
+    centers = rng.integers(0, len(locations), n)
+    return locations.latitudes[centers] + rng.normal(0.0, spread, n), locations.longitudes[centers] + rng.normal(0.0, spread, n)
+
+@pytest.mark.parametrize("batch_size", [1_000_000, 7], ids=["single", "batched"])
+def test_circles_match_brute_force(locations: LocationContainer, monkeypatch, batch_size):
+    monkeypatch.setattr(CircleLocationAssigner, "BATCH_SIZE", batch_size)
+    # Overlapping circles, so the nearest of several containing circles has to be chosen
+    locations.df = locations.df.with_columns(locations.df.get_column("area") * 40)
+    assigner = CircleLocationAssigner(locations)
+    latitudes, longitudes = coordinates_near_locations(locations, 400, 0.3, 4)
+    expected = brute_force_circles(locations, latitudes, longitudes)
+    assert UNASSIGNED in expected
+    assert len(set(expected)) > 10
+    assert assigner.check_many(latitudes, longitudes).tolist() == expected
+    assert [None if (location := assigner.check(coordinates)) is None else location.index for coordinates in zip(latitudes[:50], longitudes[:50])] == [None if index == UNASSIGNED else index for index in expected[:50]]
+
+@pytest.mark.parametrize("assigner_class, metric", [(BallTreeLocationAssigner, great_circle), (BeeLineLocationAssigner, distance)], ids=["BALLTREE", "BEELINE"])
+def test_nearest_matches_brute_force(locations: LocationContainer, monkeypatch, assigner_class, metric):
+    monkeypatch.setattr(BeeLineLocationAssigner, "BATCH_SIZE", 64)
+    assigner = assigner_class(locations)
+    rng = np.random.default_rng(5)
+    latitudes, longitudes = rng.uniform(49.0, 59.0, 300), rng.uniform(-7.0, 2.5, 300)
+    expected = brute_force_nearest(locations, latitudes, longitudes, metric)
+    assert assigner.check_many(latitudes, longitudes).tolist() == expected
+    assert [assigner.check(coordinates).index for coordinates in zip(latitudes[:50], longitudes[:50])] == expected[:50]
+
+class NearbyAssigner(BaseLocationAssigner):
+    """Only implements check, assigning coordinates within 50km of their nearest location."""
+
+    def __init__(self, locations: LocationContainer):
+        self.locations = locations
+        self.nearest = BeeLineLocationAssigner(locations)
+
+    def check(self, coordinates) -> Location | None:
+        location = self.nearest.check(coordinates)
+        return location if distance(location.coordinates, coordinates).km < 50 else None
+
+def test_check_many_falls_back_to_check(locations: LocationContainer):
+    assigner = NearbyAssigner(locations)
+    latitudes, longitudes = coordinates_near_locations(locations, 200, 0.5, 6)
+    indices = assigner.check_many(latitudes, longitudes)
+    assert indices.dtype == np.int64
+    assert UNASSIGNED in indices.tolist()
+    assert indices.tolist() == [UNASSIGNED if (location := assigner.check(coordinates)) is None else location.index for coordinates in zip(latitudes, longitudes)]
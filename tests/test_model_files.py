@@ -0,0 +1,121 @@
+import json
+import struct
+
+import numpy as np
+import polars as pl
+import pytest
+
+from gravity_model.location import LocationContainer
+from gravity_model.models import MODEL_MAGIC, MODEL_FORMAT_VERSION
+from gravity_model.models.basic import GravityModel
+from gravity_model.models.loader import MODELS, load_model, model_from_parameters
+from gravity_model.training import Distribution
+
+@pytest.fixture
+def stored_locations(tmp_path, locations: LocationContainer) -> LocationContainer:
+    """The synthetic locations, read back from a file, as parameter model files refer to their location file."""
+    filename = tmp_path.joinpath("locations.csv")
+    locations.to_file(filename)
+    return LocationContainer.from_file(filename)
+
+def trained_model(model_class: type[GravityModel], locations: LocationContainer) -> GravityModel:
+    """A model whose parameters differ from the defaults, so a loader that falls back to them is noticed."""
+    model = model_class(locations)
+    for name in model_class.PARAMETERS:
+        setattr(model, name, getattr(model, name) * 1.1)
+    model.recreate_matrix()
+    return model
+
+def assert_same_model(loaded: GravityModel, model: GravityModel):
+    assert type(loaded) is type(model)
+    assert loaded.parameters == model.parameters
+    assert loaded.minimum_distance == model.minimum_distance
+    assert loaded.locations.df.equals(model.locations.df)
+    for name in ("origins", "destinations", "distances", "gravities"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(model, name))
+    assert loaded.log_scale == model.log_scale
+    assert loaded.total_gravity == pytest.approx(model.total_gravity, rel=1e-12)
+    np.testing.assert_array_equal(loaded.sampler.cdf, model.sampler.cdf)
+
+@pytest.mark.parametrize("model_class", MODELS.values(), ids=MODELS.keys())
+def test_binary_round_trip(tmp_path, locations: LocationContainer, model_class: type[GravityModel]):
+    model = trained_model(model_class, locations)
+    filename = tmp_path.joinpath("model.bin")
+    model.to_file(filename)
+    with filename.open("rb") as f:
+        assert f.read(len(MODEL_MAGIC)) == MODEL_MAGIC
+
+    loaded = load_model(filename)
+    assert_same_model(loaded, model)
+    # The memory-mapped model is fully usable: it samples, evaluates and can be retrained
+    assert len(loaded.make_trips(100)) == 100
+    np.testing.assert_allclose(loaded.expected_trip_counts().counts, model.expected_trip_counts().counts, rtol=1e-12)
+    gravities = np.array(loaded.gravities)
+    loaded.recreate_matrix()
+    np.testing.assert_allclose(loaded.gravities, gravities, rtol=1e-12)
+
+def test_binary_model_keeps_expected_distribution(tmp_path, locations: LocationContainer):
+    model = trained_model(MODELS["DOUBLEPOWER"], locations)
+    model.to_file(tmp_path.joinpath("model.bin"))
+    loaded = load_model(tmp_path.joinpath("model.bin"))
+    assert Distribution(loaded.expected_trip_counts()).histogram == Distribution(model.expected_trip_counts()).histogram
+
+def test_binary_rejects_newer_format_versions(tmp_path, locations: LocationContainer):
+    filename = tmp_path.joinpath("model.bin")
+    GravityModel(locations).to_file(filename)
+    with filename.open("r+b") as f:
+        f.seek(len(MODEL_MAGIC))
+        f.write(struct.pack("<I", MODEL_FORMAT_VERSION + 1))
+    with pytest.raises(ValueError, match="format version"):
+        load_model(filename)
+
+@pytest.mark.parametrize("model_class", MODELS.values(), ids=MODELS.keys())
+def test_parameters_round_trip(tmp_path, stored_locations: LocationContainer, model_class: type[GravityModel]):
+    model = trained_model(model_class, stored_locations)
+    filename = tmp_path.joinpath("models", "model.json")
+    filename.parent.mkdir()
+    model.to_file(filename, parameters_only=True)
+
+    loaded = load_model(filename)
+    # Nothing is built until the model is used
+    assert type(loaded) is model_class
+    assert loaded.parameters == model.parameters
+    assert "_source" in loaded.__dict__
+    assert_same_model(loaded, model)
+    assert "_source" not in loaded.__dict__
+
+def test_parameters_with_loaded_locations(tmp_path, stored_locations: LocationContainer):
+    model = trained_model(MODELS["EXPOWER"], stored_locations)
+    filename = tmp_path.joinpath("model.json")
+    model.to_file(filename, parameters_only=True)
+    assert_same_model(model_from_parameters(filename, locations=stored_locations), model)
+
+def test_parameters_reject_changed_locations(tmp_path, stored_locations: LocationContainer):
+    model = trained_model(MODELS["POWER"], stored_locations)
+    filename = tmp_path.joinpath("model.json")
+    model.to_file(filename, parameters_only=True)
+    original = stored_locations.df
+    stored_locations.df.with_columns(pl.col("population") + 1).write_csv(stored_locations.source)
+
+    loaded = load_model(filename)
+    for _ in range(2):
+        with pytest.raises(ValueError, match="does not match"):
+            loaded.make_trips(10)
+    # A failed build keeps the reference, so the model can still be built once the dataset is restored
+    original.write_csv(stored_locations.source)
+    assert_same_model(loaded, model)
+
+def test_load_model_detects_formats(tmp_path, stored_locations: LocationContainer):
+    model = trained_model(MODELS["SPLIT"], stored_locations)
+    model.to_file(tmp_path.joinpath("model.json"))
+    assert type(load_model(tmp_path.joinpath("model.json"))) is MODELS["SPLIT"]
+
+    # Parameter files are recognised by their format field, wherever it appears in the file
+    model.to_file(tmp_path.joinpath("parameters.json"), parameters_only=True)
+    header = json.loads(tmp_path.joinpath("parameters.json").read_text())
+    tmp_path.joinpath("annotated.json").write_text(json.dumps({"notes": "trained on the synthetic locations " * 4, **header}))
+    assert "_source" in load_model(tmp_path.joinpath("annotated.json")).__dict__
+
+    tmp_path.joinpath("garbage.bin").write_bytes(b"GRAVMD not a model")
+    with pytest.raises(ValueError, match="neither a binary nor a json model"):
+        load_model(tmp_path.joinpath("garbage.bin"))
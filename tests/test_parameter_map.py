@@ -0,0 +1,69 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from gravity_model.location import LocationContainer
+from gravity_model.models.doublepower import DoublePowerGravityModel
+from gravity_model.search import EvaluationType
+from gravity_model.search.generic import read_parameter_map
+from gravity_model.search.grid_search import GridSearch
+from gravity_model.search.halving import SuccessiveHalving
+from gravity_model.trip import TripContainer
+
+PARAMETERS = {"alpha": (1.0, 2.5, 1.5), "beta": (0.5, 1.5, 1.0)}
+COLUMNS = ["alpha", "beta", "chi", "kss"]
+TRAINING_TRIPS = 18_000
+CANDIDATES = [{"alpha": alpha, "beta": beta} for alpha in (1.2, 1.8, 2.4) for beta in (0.6, 0.9, 1.2)]
+
+@pytest.fixture
+def target(locations: LocationContainer) -> TripContainer:
+    model = DoublePowerGravityModel(locations, 1.8, 0.9)
+    model.rng = np.random.default_rng(11)
+    return model.make_trips(TRAINING_TRIPS)
+
+def search(locations: LocationContainer, target: TripContainer, path, evaluation: EvaluationType = EvaluationType.SAMPLED, halving: SuccessiveHalving = None) -> GridSearch:
+    return GridSearch(DoublePowerGravityModel(locations), target, PARAMETERS, path, evaluation=evaluation, seed=5, training_trips=TRAINING_TRIPS, halving=halving)
+
+def test_screened_map_round_trips(tmp_path, locations: LocationContainer, target: TripContainer):
+    path = tmp_path.joinpath("map.csv")
+    grid = search(locations, target, path, halving=SuccessiveHalving(2_000))
+    survivors = []
+    grid.sweep(CANDIDATES, TRAINING_TRIPS, "chi", lambda params, chi, kss, trips: survivors.append(params) if trips == TRAINING_TRIPS else None)
+    grid.save_parameter_map()
+    written = pl.read_csv(path)
+    assert set(written.get_column("trips")) == {2_000, 6_000, TRAINING_TRIPS}
+    # Only the evaluations with all trips are read back, screening rows are left out
+    parameter_map = read_parameter_map(path, COLUMNS)
+    assert parameter_map.columns == COLUMNS
+    assert all(dtype == pl.Float64 for dtype in parameter_map.dtypes)
+    assert parameter_map.select("alpha", "beta").sort("alpha", "beta").to_dicts() == sorted(survivors, key=lambda params: (params["alpha"], params["beta"]))
+    assert parameter_map.equals(written.filter(pl.col("trips") == TRAINING_TRIPS).select(COLUMNS))
+
+def test_exact_and_old_maps_round_trip(tmp_path, locations: LocationContainer, target: TripContainer):
+    path = tmp_path.joinpath("map.csv")
+    grid = search(locations, target, path, EvaluationType.EXPECTED)
+    grid.sweep(CANDIDATES, TRAINING_TRIPS, "chi")
+    grid.save_parameter_map()
+    parameter_map = read_parameter_map(path, COLUMNS)
+    assert len(parameter_map) == len(CANDIDATES)
+    # Maps written before the trips column was added are read as they are
+    old_path = tmp_path.joinpath("old.csv")
+    parameter_map.write_csv(old_path)
+    assert read_parameter_map(old_path, COLUMNS).equals(parameter_map)
+    assert read_parameter_map(path, ["alpha", "chi"]).equals(parameter_map.select("alpha", "chi"))
+
+def test_interrupted_rung_keeps_its_evaluations(tmp_path, locations: LocationContainer, target: TripContainer, monkeypatch):
+    grid = search(locations, target, tmp_path.joinpath("map.csv"), halving=SuccessiveHalving(2_000))
+    evaluate_batch = grid.evaluate_batch
+    evaluated = 0
+    def interrupted(candidates, n):
+        nonlocal evaluated
+        if evaluated == 4:
+            raise KeyboardInterrupt()
+        evaluated += 1
+        return evaluate_batch(candidates, n)
+    monkeypatch.setattr(grid, "evaluate_batch", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        grid.sweep(CANDIDATES, TRAINING_TRIPS, "chi")
+    assert grid._df.height == 4
+    assert grid._df.get_column("trips").to_list() == [2_000] * 4
@@ -0,0 +1,106 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from gravity_model.distance import MERGED_BOUNDARIES, UNASSIGNED, PolygonLocationAssigner
+from gravity_model.location import Location, LocationContainer
+
+def box(west: float, south: float, east: float, north: float) -> str:
+    return f"({west} {south}, {east} {south}, {east} {north}, {west} {north}, {west} {south})"
+
+# An outer location with a hole, which holds an enclave, and a neighbour to its east
+OUTER = f"POLYGON ({box(0.0, 50.0, 2.0, 52.0)}, {box(0.8, 50.8, 1.2, 51.2)})"
+ENCLAVE = f"POLYGON ({box(0.8, 50.8, 1.2, 51.2)})"
+NEIGHBOUR = f"POLYGON ({box(2.0, 50.0, 4.0, 52.0)})"
+
+def location_table(ids: list[str]) -> LocationContainer:
+    n = len(ids)
+    return LocationContainer(df=pl.DataFrame({
+        "name": ids,
+        "id": ids,
+        "lat": np.full(n, 51.0),
+        "long": np.linspace(0.5, 3.0, n),
+        "area": np.full(n, 100.0),
+        "population": np.full(n, 1_000),
+    }, schema=Location.LOCATION_SCHEMA))
+
+def boundary_file(path, boundaries: dict[str, str]):
+    pl.DataFrame({"LAD24CD": list(boundaries), "geometry": list(boundaries.values())}).write_csv(path)
+    return path
+
+@pytest.fixture
+def assigner(tmp_path) -> PolygonLocationAssigner:
+    locations = location_table(["OUTER", "ENCLAVE", "NEIGHBOUR"])
+    return PolygonLocationAssigner(locations, boundary_file(tmp_path.joinpath("boundaries.csv"), {"OUTER": OUTER, "ENCLAVE": ENCLAVE, "NEIGHBOUR": NEIGHBOUR}))
+
+def test_enclave_and_tolerance(assigner: PolygonLocationAssigner):
+    points = [
+        ((51.0, 1.0), "ENCLAVE"),
+        ((50.9, 1.1), "ENCLAVE"),
+        ((51.0, 0.5), "OUTER"),
+        ((51.21, 1.0), "OUTER"),
+        ((51.0, 3.0), "NEIGHBOUR"),
+        # On the shared border the location with the lowest index wins
+        ((51.0, 2.0), "OUTER"),
+        # Just off the coast the nearest polygon is used, further away nothing is
+        ((51.0, 4.005), "NEIGHBOUR"),
+        ((49.995, 0.5), "OUTER"),
+        ((51.0, 4.5), None),
+        ((53.0, 1.0), None),
+    ]
+    latitudes = np.array([lat for (lat, _), _ in points])
+    longitudes = np.array([long for (_, long), _ in points])
+    expected = [UNASSIGNED if lid is None else assigner.locations.index_of(lid) for _, lid in points]
+    assert assigner.check_many(latitudes, longitudes).tolist() == expected
+    assert [None if (location := assigner.check(coordinates)) is None else location.lid for coordinates, _ in points] == [lid for _, lid in points]
+
+def test_unknown_boundary_ids_are_an_error(tmp_path):
+    locations = location_table(["OUTER", "ENCLAVE", "NEIGHBOUR"])
+    # The neighbour is split into two boundaries that were merged in the location data
+    path = boundary_file(tmp_path.joinpath("boundaries.csv"), {
+        "OUTER": OUTER, "ENCLAVE": ENCLAVE,
+        "NEIGHBOUR-SOUTH": f"POLYGON ({box(2.0, 50.0, 4.0, 51.0)})", "NEIGHBOUR-NORTH": f"POLYGON ({box(2.0, 51.0, 4.0, 52.0)})",
+    })
+    with pytest.raises(ValueError, match="NEIGHBOUR-NORTH, NEIGHBOUR-SOUTH"):
+        PolygonLocationAssigner(locations, path)
+    with pytest.raises(ValueError, match="NEIGHBOUR-NORTH"):
+        PolygonLocationAssigner(locations, path, id_mapping={"NEIGHBOUR-SOUTH": "NEIGHBOUR"})
+    # With the mapping both halves are assigned to the merged location
+    merged = PolygonLocationAssigner(locations, path, id_mapping={"NEIGHBOUR-SOUTH": "NEIGHBOUR", "NEIGHBOUR-NORTH": "NEIGHBOUR"})
+    assert merged.check_many(np.array([50.5, 51.5, 51.0]), np.array([3.0, 3.0, 1.0])).tolist() == [2, 2, 1]
+    assert merged.cache_key() != PolygonLocationAssigner(locations, path, id_mapping={"NEIGHBOUR-SOUTH": "NEIGHBOUR", "NEIGHBOUR-NORTH": "ENCLAVE"}).cache_key()
+
+def test_london_boroughs_are_merged(tmp_path):
+    path = boundary_file(tmp_path.joinpath("boundaries.csv"), {
+        "E09000001": f"POLYGON ({box(0.0, 51.0, 0.5, 51.5)})", "E09000033": f"POLYGON ({box(0.5, 51.0, 1.0, 51.5)})",
+    })
+    merged = PolygonLocationAssigner(location_table(["E12000007"]), path, id_mapping=MERGED_BOUNDARIES)
+    assert merged.check_many(np.array([51.2, 51.2]), np.array([0.2, 0.7])).tolist() == [0, 0]
+    # Location data that keeps the boroughs uses their own boundaries
+    boroughs = PolygonLocationAssigner(location_table(["E09000001", "E09000033"]), path, id_mapping=MERGED_BOUNDARIES)
+    assert boroughs.check_many(np.array([51.2, 51.2]), np.array([0.2, 0.7])).tolist() == [0, 1]
+
+def test_polygons_match_brute_force(tmp_path, locations: LocationContainer):
+    import shapely
+
+    # Irregular polygons around every location, which tile a box over Great Britain
+    extent = shapely.box(-5.5, 49.5, 2.0, 58.5)
+    cells = shapely.voronoi_polygons(shapely.multipoints(np.column_stack((locations.longitudes, locations.latitudes))), extend_to=extent)
+    polygons = [shapely.intersection(cell, extent) for cell in shapely.get_parts(cells)]
+    owners = [next(index for index in range(len(locations)) if polygon.contains(shapely.Point(locations.longitudes[index], locations.latitudes[index]))) for polygon in polygons]
+    path = boundary_file(tmp_path.joinpath("boundaries.csv"), {locations.ids[owner]: shapely.to_wkt(polygon) for owner, polygon in zip(owners, polygons)})
+    assigner = PolygonLocationAssigner(locations, path)
+
+    rng = np.random.default_rng(8)
+    latitudes, longitudes = rng.uniform(49.45, 58.55, 2_000), rng.uniform(-5.55, 2.05, 2_000)
+    expected = []
+    for lat, long in zip(latitudes, longitudes):
+        point = shapely.Point(long, lat)
+        inside = [owner for owner, polygon in zip(owners, polygons) if polygon.contains(point)]
+        if inside:
+            expected.append(min(inside))
+            continue
+        distances = [polygon.distance(point) for polygon in polygons]
+        expected.append(owners[int(np.argmin(distances))] if min(distances) <= assigner.tolerance else UNASSIGNED)
+    assert UNASSIGNED in expected
+    assert assigner.check_many(latitudes, longitudes).tolist() == expected
@@ -0,0 +1,86 @@
+import random
+
+import numpy as np
+import polars as pl
+import pytest
+
+from gravity_model.location import LocationContainer
+from gravity_model.models.doublepower import DoublePowerGravityModel
+from gravity_model.search import SearchType, EvaluationType
+from gravity_model.search.parallel import ParallelEvaluator, evaluate_model
+from gravity_model.training import Distribution
+from gravity_model.trip import TripContainer
+
+PARAMETERS = {"alpha": (1.0, 2.5, 1.5), "beta": (0.5, 1.5, 1.0)}
+TRAINING_TRIPS = 20_000
+
+@pytest.fixture
+def target(locations: LocationContainer) -> TripContainer:
+    """Trips of a model with known parameters, which the searches try to recover."""
+    model = DoublePowerGravityModel(locations, 1.8, 0.9)
+    model.rng = np.random.default_rng(11)
+    return model.make_trips(TRAINING_TRIPS)
+
+def train(locations: LocationContainer, target: TripContainer, metric_map, search_type: SearchType, evaluation: EvaluationType, workers: int, screening_trips: int = None, iterations: int = 16) -> tuple[dict[str, float], pl.DataFrame]:
+    """Trains a fresh model and returns its parameters and the parameter map, sorted as workers record in completion order."""
+    random.seed(3)
+    model = DoublePowerGravityModel(locations)
+    model.train(
+        target, PARAMETERS, iterations=iterations, accuracy=-1, search_type=search_type, metric_map=metric_map,
+        evaluation=evaluation, workers=workers, seed=5, training_trips=TRAINING_TRIPS, screening_trips=screening_trips
+    )
+    parameter_map = pl.read_csv(metric_map)
+    return model.parameters, parameter_map.sort(parameter_map.columns)
+
+@pytest.mark.parametrize("search_type", [SearchType.GRID, SearchType.RANDOM])
+@pytest.mark.parametrize("evaluation", [EvaluationType.SAMPLED, EvaluationType.COMMON])
+@pytest.mark.parametrize("screening_trips", [None, 5_000], ids=["full", "screened"])
+def test_sweep_is_independent_of_workers(tmp_path, locations: LocationContainer, target: TripContainer, search_type, evaluation, screening_trips):
+    serial = train(locations, target, tmp_path.joinpath("serial.csv"), search_type, evaluation, 1, screening_trips)
+    parallel = train(locations, target, tmp_path.joinpath("parallel.csv"), search_type, evaluation, 2, screening_trips)
+    assert parallel[0] == serial[0]
+    assert parallel[1].equals(serial[1])
+    if screening_trips is not None:
+        # Every screening rung is part of the parameter map
+        assert set(serial[1].get_column("trips").to_list()) == {5_000, 15_000, TRAINING_TRIPS}
+
+def test_sweep_is_independent_of_candidate_order(tmp_path, locations: LocationContainer, target: TripContainer):
+    # Every parameter set is sampled with a seed derived from its values, not from its position in the sweep
+    from gravity_model.search.random_search import RandomSearch
+    model = DoublePowerGravityModel(locations)
+    candidates = [{"alpha": alpha, "beta": beta} for alpha in (1.2, 1.8, 2.4) for beta in (0.6, 0.9, 1.2)]
+    results = {}
+    for name, order in (("forward", candidates), ("backward", candidates[::-1])):
+        search = RandomSearch(model, target, PARAMETERS, tmp_path.joinpath(f"{name}.csv"), seed=5, training_trips=TRAINING_TRIPS)
+        search.sweep(order, TRAINING_TRIPS, "chi")
+        search.save_parameter_map()
+        results[name] = pl.read_csv(tmp_path.joinpath(f"{name}.csv")).sort(["alpha", "beta"])
+    assert len(results["forward"]) == len(candidates)
+    assert results["forward"].equals(results["backward"])
+
+@pytest.mark.parametrize("screening_trips", [None, 5_000], ids=["full", "screened"])
+def test_genetic_search_is_independent_of_workers(tmp_path, locations: LocationContainer, target: TripContainer, screening_trips):
+    # Two generations of a population of 20
+    serial = train(locations, target, tmp_path.joinpath("serial.csv"), SearchType.GENETIC, EvaluationType.SAMPLED, 1, screening_trips, iterations=40)
+    parallel = train(locations, target, tmp_path.joinpath("parallel.csv"), SearchType.GENETIC, EvaluationType.SAMPLED, 2, screening_trips, iterations=40)
+    assert len(serial[1]) >= 20
+    assert parallel[0] == serial[0]
+    assert parallel[1].equals(serial[1])
+
+def test_workers_are_spawned(locations: LocationContainer, target: TripContainer):
+    # Forking the search process, whose polars thread pool is already running, could deadlock the workers
+    model = DoublePowerGravityModel(locations, 1.6, 0.8)
+    distribution = Distribution(target)
+    seeds = [np.random.SeedSequence(seed) for seed in range(3)]
+    with ParallelEvaluator(model, distribution, EvaluationType.SAMPLED, 5_000, 2) as evaluator:
+        assert evaluator.executor._mp_context.get_start_method() == "spawn"
+        results = evaluator.map([model.parameters] * len(seeds), seeds)
+    assert results == [evaluate_model(model, distribution, EvaluationType.SAMPLED, 5_000, np.random.default_rng(seed)) for seed in seeds]
+
+def test_nelder_mead_is_reproducible(tmp_path, locations: LocationContainer, target: TripContainer):
+    # Every vertex, not only the shrunk ones, is sampled with a seed derived from the search seed
+    first = train(locations, target, tmp_path.joinpath("first.csv"), SearchType.NELDER_MEAD, EvaluationType.SAMPLED, 1, iterations=12)
+    second = train(locations, target, tmp_path.joinpath("second.csv"), SearchType.NELDER_MEAD, EvaluationType.SAMPLED, 1, iterations=12)
+    assert len(first[1]) > 3
+    assert second[0] == first[0]
+    assert second[1].equals(first[1])
@@ -0,0 +1,71 @@
+import os
+
+import polars as pl
+import pytest
+
+from gravity_model import storage
+from gravity_model.location import LocationContainer
+from gravity_model.models.power import PowerGravityModel
+from gravity_model.trip import TripContainer
+from gravity_model.storage import FileFormat, file_format, read_frame, write_frame
+
+@pytest.mark.parametrize("suffix, expected", [
+    (".csv", FileFormat.CSV), (".parquet", FileFormat.PARQUET), (".PQ", FileFormat.PARQUET),
+    (".arrow", FileFormat.IPC), (".ipc", FileFormat.IPC), (".feather", FileFormat.IPC), (".txt", FileFormat.CSV),
+])
+def test_file_format(suffix, expected):
+    assert file_format(f"trips{suffix}") is expected
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".arrow"])
+def test_locations_round_trip(tmp_path, locations: LocationContainer, suffix):
+    path = tmp_path.joinpath(f"locations{suffix}")
+    locations.to_file(path)
+    assert LocationContainer.from_file(path).df.equals(locations.df)
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".arrow"])
+def test_trips_round_trip(tmp_path, locations: LocationContainer, suffix):
+    trips = PowerGravityModel(locations, 1.5).make_trips(500)
+    path = tmp_path.joinpath(f"trips{suffix}")
+    trips.to_file(path)
+    assert TripContainer.from_file(path).df.equals(trips.df)
+
+def test_explicit_file_type_and_schema(tmp_path, locations: LocationContainer):
+    # The file type overrides the extension, binary files are narrowed down to the schema's columns and types
+    path = tmp_path.joinpath("locations.dat")
+    write_frame(locations.df, path, FileFormat.PARQUET)
+    schema = {"id": pl.String, "population": pl.Float64}
+    df = read_frame(path, schema=schema, file_type=FileFormat.PARQUET)
+    assert df.schema == pl.Schema(schema)
+    assert df.equals(locations.df.select("id", pl.col("population").cast(pl.Float64)))
+
+def test_csv_sidecar(tmp_path, locations: LocationContainer, cache_directory, monkeypatch):
+    monkeypatch.setattr(storage, "SIDECAR_MINIMUM_SIZE", 0)
+    path = tmp_path.joinpath("locations.csv")
+    locations.to_file(path)
+    assert LocationContainer.from_file(path).df.equals(locations.df)
+    sidecars = list(cache_directory.joinpath("frames").glob("*.arrow"))
+    assert len(sidecars) == 1
+
+    # Later reads are served by the sidecar without parsing the csv
+    def read_csv(*args, **kwargs):
+        raise AssertionError("The csv was parsed again")
+    with monkeypatch.context() as patch:
+        patch.setattr(storage.pl, "read_csv", read_csv)
+        assert LocationContainer.from_file(path).df.equals(locations.df)
+
+    # A changed csv gets a new sidecar, which replaces the outdated one
+    changed = locations.df.head(10)
+    changed.write_csv(path)
+    os.utime(path, ns=(0, path.stat().st_mtime_ns + 1_000_000_000))
+    assert LocationContainer.from_file(path).df.equals(changed)
+    assert [sidecar.name for sidecar in cache_directory.joinpath("frames").glob("*.arrow")] != [sidecar.name for sidecar in sidecars]
+    assert len(list(cache_directory.joinpath("frames").glob("*.arrow"))) == 1
+    # Reading without the sidecar keeps the existing one
+    assert read_frame(path, sidecar=False).height == 10
+    assert len(list(cache_directory.joinpath("frames").glob("*.arrow"))) == 1
+
+def test_small_csv_has_no_sidecar(tmp_path, locations: LocationContainer, cache_directory):
+    path = tmp_path.joinpath("locations.csv")
+    locations.to_file(path)
+    LocationContainer.from_file(path)
+    assert not cache_directory.joinpath("frames").exists() or not any(cache_directory.joinpath("frames").iterdir())
@@ -0,0 +1,52 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from gravity_model.distance import BallTreeLocationAssigner
+from gravity_model.location import LocationContainer
+from gravity_model.storage import read_frame
+from gravity_model.trip import Trip, TripLoader
+
+TRIPS_SCHEMA = {"start_lat": "home_coord_x", "start_long": "home_coord_y", "stop_lat": "dest_coord_x", "stop_long": "dest_coord_y", "number": "frequency"}
+
+@pytest.fixture
+def raw_trips() -> pl.DataFrame:
+    """Raw celltower trips in the export's layout, including a column the conversion does not need."""
+    rng = np.random.default_rng(3)
+    n = 1_000
+    return pl.DataFrame({
+        "home_coord_x": rng.uniform(50.0, 58.0, n),
+        "home_coord_y": rng.uniform(-5.0, 1.5, n),
+        "dest_coord_x": rng.uniform(50.0, 58.0, n),
+        "dest_coord_y": rng.uniform(-5.0, 1.5, n),
+        "frequency": rng.integers(1, 4, n),
+        "tower": [f"T{i}" for i in range(n)],
+    })
+
+@pytest.mark.parametrize("input_suffix", [".csv", ".parquet", ".arrow"])
+@pytest.mark.parametrize("output_suffix", [".csv", ".parquet", ".arrow"])
+@pytest.mark.parametrize("keep_distance", [False, True], ids=["locations", "towers"])
+def test_streaming_matches_loading(tmp_path, locations: LocationContainer, raw_trips: pl.DataFrame, input_suffix, output_suffix, keep_distance):
+    raw = tmp_path.joinpath(f"raw{input_suffix}")
+    {".csv": raw_trips.write_csv, ".parquet": raw_trips.write_parquet, ".arrow": raw_trips.write_ipc}[input_suffix](raw)
+    assigner = BallTreeLocationAssigner(locations)
+    loaded = TripLoader.load_trips(assigner, raw, TRIPS_SCHEMA, keep_distance=keep_distance, min_distance=100.0, silent=True).df
+    assert 0 < loaded.height < raw_trips.get_column("frequency").sum()
+
+    # Chunks much smaller than the input, which do not divide it evenly
+    output = tmp_path.joinpath(f"trips{output_suffix}")
+    written, shortest = TripLoader.stream_trips(assigner, raw, TRIPS_SCHEMA, output, keep_distance=keep_distance, min_distance=100.0, batch_size=170, silent=True)
+    assert written == loaded.height
+    assert shortest == loaded.get_column("distance").min()
+    streamed = read_frame(output, schema=Trip.TRIP_SCHEMA, sidecar=False)
+    assert streamed.equals(loaded)
+
+def test_streaming_without_trips(tmp_path, locations: LocationContainer, raw_trips: pl.DataFrame):
+    raw = tmp_path.joinpath("raw.csv")
+    raw_trips.write_csv(raw)
+    for suffix in (".csv", ".parquet"):
+        output = tmp_path.joinpath(f"trips{suffix}")
+        # Every trip is shorter than the minimum distance, the output only has the schema
+        written, shortest = TripLoader.stream_trips(BallTreeLocationAssigner(locations), raw, TRIPS_SCHEMA, output, min_distance=10_000.0, batch_size=300, silent=True)
+        assert (written, shortest) == (0, float("inf"))
+        assert read_frame(output, schema=Trip.TRIP_SCHEMA, sidecar=False).schema == pl.Schema(Trip.TRIP_SCHEMA)
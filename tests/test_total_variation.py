@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from gravity_model.location import LocationContainer
+from gravity_model.models.doublepower import DoublePowerGravityModel
+from gravity_model.training import total_variation_distance
+from gravity_model.trip import Trip, TripContainer
+
+def baseline_total_variation_distance(test: TripContainer, model: TripContainer) -> float:
+    """The dictionary based distance that the vectorised one replaced."""
+    tvd_sum = 0
+    model_rel = model.as_relative()
+    for trip, test_amount in test.as_relative().items():
+        tvd_sum += abs(test_amount - model_rel.get(trip, 0.0))
+    return tvd_sum / 2
+
+@pytest.fixture
+def trip_files(tmp_path, locations: LocationContainer):
+    """Two csv files with trips of models with different parameters."""
+    files = []
+    for seed, parameters in ((1, (1.8, 0.9)), (2, (1.2, 0.7))):
+        model = DoublePowerGravityModel(locations, *parameters)
+        model.rng = np.random.default_rng(seed)
+        path = tmp_path.joinpath(f"trips_{seed}.csv")
+        model.make_trips(3_000).to_csv(path)
+        files.append(path)
+    return files
+
+def test_total_variation_distance_of_csv_files(trip_files):
+    # Containers loaded from files have no LocationContainer, their trips are matched by location ids
+    test, model = (TripContainer.from_csv(path) for path in trip_files)
+    assert test.locations is None
+    tvd = total_variation_distance(test, model)
+    assert 0 < tvd < 1
+    assert tvd == pytest.approx(baseline_total_variation_distance(test, model), rel=1e-12)
+    assert total_variation_distance(test, test) == 0
+
+def test_total_variation_distance_with_locations(trip_files, locations: LocationContainer):
+    # With a shared LocationContainer the pairs are matched by their indices, with the same result
+    test, model = (TripContainer.from_file(path, locations=locations) for path in trip_files)
+    expected = total_variation_distance(TripContainer.from_csv(trip_files[0]), TripContainer.from_csv(trip_files[1]))
+    assert total_variation_distance(test, model) == pytest.approx(expected, rel=1e-12)
+    # Model trip counts are compared with file trips by their ids
+    counts = DoublePowerGravityModel(locations, 1.2, 0.7).make_trip_counts(3_000, np.random.default_rng(2))
+    assert total_variation_distance(TripContainer.from_csv(trip_files[0]), counts) == pytest.approx(total_variation_distance(test, counts), rel=1e-12)
+
+def test_as_relative_is_keyed_by_trips(trip_files, locations: LocationContainer):
+    trips = TripContainer.from_csv(trip_files[0])
+    relative = trips.as_relative()
+    assert all(isinstance(trip, Trip) for trip in relative)
+    assert sum(relative.values()) == pytest.approx(1.0)
+    counts = DoublePowerGravityModel(locations, 1.2, 0.7).make_trip_counts(3_000, np.random.default_rng(2))
+    assert all(isinstance(trip, Trip) for trip in counts.as_relative())
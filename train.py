@@ -18,7 +18,7 @@ from gravity_model.models.tripleexpo import TripleExponentialGravityModel
 from gravity_model.models.expower import ExponentialPowerGravityModel
 from gravity_model.models.split import SplitGravityModel
 
-from gravity_model.search import SearchType
+from gravity_model.search import SearchType, EvaluationType, DEFAULT_TRAINING_TRIPS
 
 
 @click.command()
@@ -32,9 +32,15 @@ from gravity_model.search import SearchType
 @click.option("--default-parameter", type=(str, float), multiple=True)
 @click.option("--training-parameter", type=(str, float, float, float), multiple=True)
 @click.option("--metric-map", type=click.Path(exists=False, dir_okay=False, path_type=Path))
-def main(location_data: Path, model_output: Path, model_type: ModelType, search_type: SearchType, optimize: Path, iterations: int, metric: str, default_parameter: list[tuple[str, float]], training_parameter: list[tuple[str, float, float, float]], metric_map: Path):
+@click.option("-e", "--evaluation", type=click.Choice(EvaluationType, case_sensitive=False), default=EvaluationType.SAMPLED)
+@click.option("-w", "--workers", type=int, default=1, help="Number of processes evaluating parameter sets in parallel (GRID, RANDOM and GENETIC searches)")
+@click.option("--seed", type=int, default=None, help="Seed for sampling trips during the search, a random one is logged if not set")
+@click.option("--training-trips", type=int, default=DEFAULT_TRAINING_TRIPS, help="Number of trips sampled per evaluation, COMMON evaluations need far fewer than SAMPLED ones")
+@click.option("--screening-trips", type=int, default=None, help="Screen candidates on this many trips first and only evaluate the best ones with all training trips (GRID, RANDOM and GENETIC searches)")
+@click.option("-p", "--parameters-only", is_flag=True, default=False, help="Only store the model type, its parameters and a reference to the location data")
+def main(location_data: Path, model_output: Path, model_type: ModelType, search_type: SearchType, optimize: Path, iterations: int, metric: str, default_parameter: list[tuple[str, float]], training_parameter: list[tuple[str, float, float, float]], metric_map: Path, evaluation: EvaluationType, workers: int, seed: int, training_trips: int, screening_trips: int, parameters_only: bool):
     logger.info(f"Loading location data from {location_data.absolute().as_posix()}")
-    locs = LocationContainer.from_csv(location_data)
+    locs = LocationContainer.from_file(location_data)
     default_parameter = {element[0]: element[1] for element in default_parameter}
     training_parameter = {element[0]: tuple(element[1:]) for element in training_parameter}
 
@@ -66,7 +72,7 @@ def main(location_data: Path, model_output: Path, model_type: ModelType, search_
     if model and optimize:
         logger.info(f"Starting Training...")
         logger.info(f"Loading desired output data from {optimize.absolute().as_posix()}")
-        target_trips = TripContainer.from_csv(optimize)
+        target_trips = TripContainer.from_file(optimize, locations=locs)
         accuracy=0.0005
         if model_type is ModelType.BASIC:
             logger.warning("Training a basic model does not require optimization, but we will still calculate the error metrics!")
@@ -96,9 +102,9 @@ def main(location_data: Path, model_output: Path, model_type: ModelType, search_
             accuracy=0.0005
             parameters={"alpha": POWER_LAW_DIST_TUPLE, "beta": POWER_LAW_DIST_TUPLE, "gamma": DISTANCE_SPLIT_TUPLE}
         parameters.update(training_parameter)
-        model.train(desired=target_trips, iterations=iterations, accuracy=accuracy, metric=metric, parameters=parameters, search_type=search_type, metric_map=metric_map)
+        model.train(desired=target_trips, iterations=iterations, accuracy=accuracy, metric=metric, parameters=parameters, search_type=search_type, metric_map=metric_map, evaluation=evaluation, workers=workers, seed=seed, training_trips=training_trips, screening_trips=screening_trips)
     logger.info(f"Storing model at {model_output.absolute().as_posix()}")
-    model.to_json(model_output)
+    model.to_file(model_output, parameters_only=parameters_only)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file